@@ -6,22 +6,39 @@ import time as time_module
 
 # Import active_downloads from start.py
 from IdFinderPro.start import active_downloads
+from IdFinderPro.jobs import scheduler
+from IdFinderPro.metrics import render_summary
+from IdFinderPro.telemetry import render_transfer_stats, WINDOWS
 
 @Client.on_message(filters.command(["processes"]) & filters.user(ADMINS))
 async def show_active_processes(client: Client, message: Message):
     """Admin command to view active download processes"""
     
+    # Transfer telemetry window: /processes [minutes], at most the retained hour
+    window = WINDOWS[0]
+    if len(message.command) > 1 and message.command[1].isdigit():
+        window = min(max(int(message.command[1]), 1) * 60, WINDOWS[-1])
+    transfer_text = render_transfer_stats(window)
+    
+    # Job queue summary
+    jobs = scheduler.stats()
+    queue_text = (
+        f"**Jobs Running:** {jobs['running']}/{jobs['max_running']}\n"
+        f"**Queued:** {jobs['queued_premium']} premium, {jobs['queued_free']} free"
+    )
+    
     if not active_downloads:
-        await message.reply("📭 **No Active Downloads**\n\nThere are currently no files being downloaded.")
+        await message.reply(f"📭 **No Active Downloads**\n\nThere are currently no files being downloaded.\n\n{queue_text}\n\n{transfer_text}")
         return
     
     current_time = time_module.time()
     process_list = []
     
-    for user_id, info in active_downloads.items():
+    for info in list(active_downloads.values()):
+        user_id = info['user_id']
         # Get user info
         try:
-            user = await db.col.find_one({'id': user_id})
+            user = await db.get_user(user_id)
             username = user.get('name', 'Unknown') if user else 'Unknown'
         except:
             username = 'Unknown'
@@ -45,9 +62,18 @@ async def show_active_processes(client: Client, message: Message):
     response = f"""🔄 **Active Download Processes**
 
 **Total Active:** {len(active_downloads)}
+{queue_text}
 
 {processes_text}
 
+{transfer_text}
+
 💡 Use `/cancel` to stop any user's process if needed."""
 
     await message.reply(response)
+
+
+@Client.on_message(filters.command(["metrics"]) & filters.user(ADMINS))
+async def show_metrics(client: Client, message: Message):
+    """Admin command to view handler latency, database and event loop metrics"""
+    await message.reply(render_summary())
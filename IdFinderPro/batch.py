@@ -0,0 +1,88 @@
+"""
+Batch pipeline helpers.
+Several files of a batch are downloaded at once, but each one waits for its
+turn before anything is sent so the chat still receives them in order.
+Message metadata is prefetched in chunks instead of one request per id.
+"""
+import asyncio
+from config import MAX_CONCURRENT_TRANSFERS
+
+# get_messages accepts at most 200 ids per request
+PREFETCH_CHUNK = 200
+
+# Global cap on parallel downloads from user sessions (all users together)
+transfer_slots = asyncio.Semaphore(MAX_CONCURRENT_TRANSFERS)
+
+
+class BatchSequencer:
+    """Lets batch items finish out of order while sending them in order"""
+
+    def __init__(self, first_id):
+        self.next_id = first_id  # Lowest message id not finished yet
+        self.finished = set()
+        self.condition = asyncio.Condition()
+
+    async def wait_turn(self, msgid):
+        """Wait until every earlier item of the batch is finished"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.next_id >= msgid)
+
+    async def finish(self, msgid):
+        """Mark an item as done (sent, skipped or failed)"""
+        async with self.condition:
+            self.finished.add(msgid)
+            while self.next_id in self.finished:
+                self.finished.discard(self.next_id)
+                self.next_id += 1
+            self.condition.notify_all()
+
+
+class MessagePrefetcher:
+    """Fetches the messages of a batch range in chunks (one request per 200 ids)"""
+
+    def __init__(self, client, chat_id, first_id, last_id, chunk_size=PREFETCH_CHUNK):
+        self.client = client
+        self.chat_id = chat_id
+        self.first_id = first_id
+        self.last_id = last_id
+        self.chunk_size = chunk_size
+        self.chunks = {}  # {chunk_start: asyncio.Task returning {msgid: Message}}
+
+    def chunk_start(self, msgid):
+        return msgid - (msgid - self.first_id) % self.chunk_size
+
+    def fetch(self, start):
+        """Start loading a chunk in the background if not loaded yet"""
+        if start > self.last_id or start in self.chunks:
+            return
+        self.chunks[start] = asyncio.create_task(self.load(start))
+
+    async def load(self, start):
+        ids = list(range(start, min(start + self.chunk_size, self.last_id + 1)))
+        try:
+            messages = await self.client.get_messages(self.chat_id, ids)
+        except Exception as e:
+            print(f"[PREFETCH] Chunk {start}-{ids[-1]} of {self.chat_id} failed: {e}")
+            return None
+        return {msg.id: msg for msg in messages if msg}
+
+    async def get(self, msgid):
+        """Message for msgid, or None if the chunk could not be fetched (caller fetches it alone)"""
+        start = self.chunk_start(msgid)
+        self.fetch(start)
+        # Keep the next chunk loading while the workers use this one
+        self.fetch(start + self.chunk_size)
+
+        # Earlier chunks are no longer needed - ids are requested in order
+        for old in [s for s in self.chunks if s < start]:
+            self.chunks.pop(old).cancel()
+
+        messages = await self.chunks[start]
+        if messages is None:
+            return None
+        return messages.get(msgid)
+
+    def close(self):
+        for task in self.chunks.values():
+            task.cancel()
+        self.chunks.clear()
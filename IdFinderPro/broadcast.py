@@ -1,69 +1,313 @@
 from pyrogram.errors import InputUserDeactivated, UserNotParticipant, FloodWait, UserIsBlocked, PeerIdInvalid
 from database.db import db
 from pyrogram import Client, filters
-from config import ADMINS
+from config import ADMINS, BROADCAST_RATE, BROADCAST_WORKERS
 import asyncio
 import datetime
 import time
 
-async def broadcast_messages(user_id, message):
-    try:
-        await message.copy(chat_id=user_id)
-        return True, "Success"
-    except FloodWait as e:
-        await asyncio.sleep(e.value)
-        return await broadcast_messages(user_id, message)
-    except InputUserDeactivated:
-        await db.delete_user(int(user_id))
-        return False, "Deleted"
-    except UserIsBlocked:
-        await db.delete_user(int(user_id))
-        return False, "Blocked"
-    except PeerIdInvalid:
-        await db.delete_user(int(user_id))
-        return False, "Error"
-    except Exception as e:
-        return False, "Error"
+# Users loaded (and checkpointed) at once
+BROADCAST_CHUNK = 200
+# Seconds between two status edits
+STATUS_INTERVAL = 15
+# Sends to one user before it is recorded as failed
+MAX_ATTEMPTS = 3
+# Dead users collected before they are removed with one delete_many
+DEAD_FLUSH_SIZE = 1000
+# Failure reasons that mean the user can never receive messages again
+DEAD_REASONS = ("Blocked", "Deleted", "Invalid")
+
+
+class TokenBucket:
+    """Rate limiter shared by all senders of a broadcast"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until one message may be sent"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """FloodWait hit - stop every sender, not only the one that got it"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+async def broadcast_messages(user_id, message, bucket):
+    for attempt in range(MAX_ATTEMPTS):
+        await bucket.acquire()
+        try:
+            await message.copy(chat_id=user_id)
+            return True, "Success"
+        except FloodWait as e:
+            bucket.pause(e.value)
+        # Dead users are removed in bulk by the caller
+        except InputUserDeactivated:
+            return False, "Deleted"
+        except UserIsBlocked:
+            return False, "Blocked"
+        except PeerIdInvalid:
+            return False, "Invalid"
+        except Exception as e:
+            return False, "Error"
+    return False, "Error"
+
+
+class Broadcast:
+    """One broadcast run - sends in id order and checkpoints after every chunk"""
+
+    def __init__(self, record, message, status_msg):
+        self.id = record['_id']
+        self.retry_of = record.get('retry_of')
+        self.message = message
+        self.status_msg = status_msg
+        self.total = record['total']
+        self.cursor = record.get('cursor')
+        self.success = record.get('success', 0)
+        self.blocked = record.get('blocked', 0)
+        self.deleted = record.get('deleted', 0)
+        self.failed = record.get('failed', 0)
+        self.removed = record.get('removed', 0)
+        self.dry_run = record.get('dry_run', False)
+        self.dead_users = []  # Waiting for the next bulk delete
+        self.bucket = TokenBucket(BROADCAST_RATE)
+        self.started = time.time()
+        self.done_at_start = self.done
+        self.paused = False
+        self.cancelled = False
+        self.task = None
+
+    @property
+    def done(self):
+        return self.success + self.blocked + self.deleted + self.failed
+
+    async def next_chunk(self):
+        if self.retry_of is not None:
+            return await db.get_broadcast_failed_ids(self.retry_of, "Error", after=self.cursor, limit=BROADCAST_CHUNK)
+        return await db.get_user_ids(after=self.cursor, limit=BROADCAST_CHUNK)
+
+    async def send_chunk(self, user_ids):
+        senders = asyncio.Semaphore(BROADCAST_WORKERS)
+
+        async def send(user_id):
+            async with senders:
+                return await broadcast_messages(int(user_id), self.message, self.bucket)
+
+        results = await asyncio.gather(*(send(uid) for uid in user_ids))
+
+        failures = []
+        for user_id, (sent, reason) in zip(user_ids, results):
+            if sent:
+                self.success += 1
+                continue
+            if reason == "Blocked":
+                self.blocked += 1
+            elif reason == "Deleted":
+                self.deleted += 1
+            else:
+                self.failed += 1
+            failures.append((int(user_id), reason))
+            if reason in DEAD_REASONS:
+                self.dead_users.append(int(user_id))
+        await db.add_broadcast_failures(self.id, failures)
+
+        if len(self.dead_users) >= DEAD_FLUSH_SIZE:
+            await self.flush_dead_users()
+
+    async def flush_dead_users(self):
+        """Remove collected dead users with a single delete_many (only counted in dry run)"""
+        dead_users, self.dead_users = self.dead_users, []
+        if not dead_users:
+            return
+        if self.dry_run:
+            self.removed += len(dead_users)
+            return
+        try:
+            self.removed += await db.delete_users(dead_users)
+        except Exception as e:
+            # Still recorded in broadcast_failures, a later broadcast finds them again
+            print(f"[BROADCAST] Could not remove {len(dead_users)} dead users: {e}")
+
+    def status_text(self, title="Broadcast in progress"):
+        elapsed = max(time.time() - self.started, 1)
+        rate = (self.done - self.done_at_start) / elapsed
+        remaining = max(self.total - self.done, 0)
+        eta = datetime.timedelta(seconds=int(remaining / rate)) if rate > 0 else "Calculating..."
+        return (
+            f"{title}:\n\n"
+            f"Total Users {self.total}\n"
+            f"Completed: {self.done} / {self.total}\n"
+            f"Success: {self.success}\n"
+            f"Blocked: {self.blocked}\n"
+            f"Deleted: {self.deleted}\n"
+            f"Failed: {self.failed}\n"
+            f"{'Dead users (dry run, kept)' if self.dry_run else 'Removed from database'}: {self.removed + len(self.dead_users)}\n\n"
+            f"⚡ Speed: {rate:.1f} msg/s\n"
+            f"⏳ ETA: {eta}"
+        )
+
+    async def reporter(self):
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            try:
+                await self.status_msg.edit(self.status_text())
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception:
+                pass
+
+    async def run(self):
+        reporter = asyncio.create_task(self.reporter())
+        status = "done"
+        try:
+            while True:
+                if self.cancelled:
+                    status = "cancelled"
+                    break
+                if self.paused:
+                    status = "paused"
+                    break
+                user_ids = await self.next_chunk()
+                if not user_ids:
+                    break
+                await self.send_chunk(user_ids)
+                self.cursor = user_ids[-1]
+                await db.update_broadcast_progress(self.id, self.cursor, self.success, self.blocked, self.deleted, self.failed, self.removed)
+        except Exception as e:
+            # Progress up to the last chunk is saved, the broadcast can be resumed
+            print(f"[BROADCAST] Broadcast {self.id} stopped: {e}")
+            status = "paused"
+        finally:
+            reporter.cancel()
+            await self.flush_dead_users()
+            await db.update_broadcast_progress(self.id, self.cursor, self.success, self.blocked, self.deleted, self.failed, self.removed)
+            await db.set_broadcast_status(self.id, status)
+
+        if status == "done":
+            time_taken = datetime.timedelta(seconds=int(time.time() - self.started))
+            text = self.status_text(f"Broadcast Completed in {time_taken}")
+            if self.failed:
+                text += "\n\nUse /broadcast_retry to send again to failed users."
+        elif status == "paused":
+            text = self.status_text("Broadcast Paused") + "\n\nUse /broadcast_resume to continue."
+        else:
+            text = self.status_text("Broadcast Cancelled")
+        try:
+            await self.status_msg.edit(text)
+        except Exception:
+            pass
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+
+# Broadcast currently sending (only one at a time)
+active_broadcast = None
+
+
+def broadcast_running():
+    return active_broadcast is not None and active_broadcast.task is not None and not active_broadcast.task.done()
+
+
+async def start_broadcast(record, message, status_msg):
+    global active_broadcast
+    active_broadcast = Broadcast(record, message, status_msg)
+    active_broadcast.start()
 
 
 @Client.on_message(filters.command("broadcast") & filters.user(ADMINS) & filters.reply)
 async def verupikkals(bot, message):
-    users = await db.get_all_users()
     b_msg = message.reply_to_message
     if not b_msg:
         return await message.reply_text("**Reply This Command To Your Broadcast Message**")
+    if broadcast_running():
+        return await message.reply_text("**A broadcast is already running.**\n\nUse /broadcast_pause or /broadcast_cancel first.")
+    # "/broadcast dryrun" keeps blocked/deleted users and only counts them
+    dry_run = len(message.command) > 1 and message.command[1].lower() in ("dry", "dryrun", "dry-run")
     sts = await message.reply_text(
-        text='Broadcasting your messages...'
+        text='Broadcasting your messages...' + (' (dry run, dead users are only counted)' if dry_run else '')
     )
-    start_time = time.time()
     total_users = await db.total_users_count()
-    done = 0
-    blocked = 0
-    deleted = 0
-    failed =0
-
-    success = 0
-    async for user in users:
-        if 'id' in user:
-            pti, sh = await broadcast_messages(int(user['id']), b_msg)
-            if pti:
-                success += 1
-            elif pti == False:
-                if sh == "Blocked":
-                    blocked += 1
-                elif sh == "Deleted":
-                    deleted += 1
-                elif sh == "Error":
-                    failed += 1
-            done += 1
-            if not done % 20:
-                await sts.edit(f"Broadcast in progress:\n\nTotal Users {total_users}\nCompleted: {done} / {total_users}\nSuccess: {success}\nBlocked: {blocked}\nDeleted: {deleted}")    
-        else:
-            # Handle the case where 'id' key is missing in the user dictionary
-            done += 1
-            failed += 1
-            if not done % 20:
-                await sts.edit(f"Broadcast in progress:\n\nTotal Users {total_users}\nCompleted: {done} / {total_users}\nSuccess: {success}\nBlocked: {blocked}\nDeleted: {deleted}")    
-    
-    time_taken = datetime.timedelta(seconds=int(time.time()-start_time))
-    await sts.edit(f"Broadcast Completed:\nCompleted in {time_taken} seconds.\n\nTotal Users {total_users}\nCompleted: {done} / {total_users}\nSuccess: {success}\nBlocked: {blocked}\nDeleted: {deleted}")
+    broadcast_id = await db.create_broadcast(b_msg.chat.id, b_msg.id, total_users, dry_run=dry_run)
+    record = {'_id': broadcast_id, 'total': total_users, 'dry_run': dry_run}
+    await start_broadcast(record, b_msg, sts)
+
+
+@Client.on_message(filters.command("broadcast_pause") & filters.user(ADMINS))
+async def pause_broadcast(bot, message):
+    if not broadcast_running():
+        return await message.reply_text("**No broadcast is running.**")
+    active_broadcast.paused = True
+    await message.reply_text("⏸️ **Broadcast will pause after the current chunk.**")
+
+
+@Client.on_message(filters.command("broadcast_cancel") & filters.user(ADMINS))
+async def cancel_broadcast(bot, message):
+    if broadcast_running():
+        active_broadcast.cancelled = True
+        return await message.reply_text("🛑 **Broadcast will stop after the current chunk.**")
+    # A paused broadcast (or one interrupted by a restart) is only in the database
+    record = await db.get_last_broadcast(['running', 'paused'])
+    if not record:
+        return await message.reply_text("**No broadcast to cancel.**")
+    await db.set_broadcast_status(record['_id'], "cancelled")
+    await message.reply_text("🛑 **Broadcast cancelled.**")
+
+
+@Client.on_message(filters.command("broadcast_resume") & filters.user(ADMINS))
+async def resume_broadcast(bot, message):
+    if broadcast_running():
+        return await message.reply_text("**A broadcast is already running.**")
+    # 'running' here means the bot restarted while it was sending
+    record = await db.get_last_broadcast(['running', 'paused'])
+    if not record:
+        return await message.reply_text("**No paused broadcast to resume.**")
+    try:
+        b_msg = await bot.get_messages(record['chat_id'], record['message_id'])
+    except Exception as e:
+        b_msg = None
+        print(f"[BROADCAST] Could not load message of broadcast {record['_id']}: {e}")
+    if not b_msg or b_msg.empty:
+        await db.set_broadcast_status(record['_id'], "cancelled")
+        return await message.reply_text("❌ **The broadcast message no longer exists, broadcast cancelled.**")
+    await db.set_broadcast_status(record['_id'], "running")
+    sts = await message.reply_text("▶️ Resuming broadcast...")
+    await start_broadcast(record, b_msg, sts)
+
+
+@Client.on_message(filters.command("broadcast_retry") & filters.user(ADMINS))
+async def retry_broadcast(bot, message):
+    if broadcast_running():
+        return await message.reply_text("**A broadcast is already running.**")
+    record = await db.get_last_broadcast(['done', 'cancelled'])
+    if not record:
+        return await message.reply_text("**No finished broadcast to retry.**")
+    total = await db.count_broadcast_failures(record['_id'], "Error")
+    if not total:
+        return await message.reply_text("✅ **The last broadcast has no failed users to retry.**")
+    try:
+        b_msg = await bot.get_messages(record['chat_id'], record['message_id'])
+    except Exception:
+        b_msg = None
+    if not b_msg or b_msg.empty:
+        return await message.reply_text("❌ **The broadcast message no longer exists.**")
+    sts = await message.reply_text(f"🔁 Retrying {total} failed users...")
+    broadcast_id = await db.create_broadcast(record['chat_id'], record['message_id'], total, retry_of=record['_id'])
+    await start_broadcast({'_id': broadcast_id, 'total': total, 'retry_of': record['_id']}, b_msg, sts)
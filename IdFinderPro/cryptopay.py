@@ -3,12 +3,14 @@ Crypto Pay Integration for Premium Subscriptions
 Uses @CryptoBot / @send Crypto Pay API
 """
 import time
+import asyncio
 import hashlib
 import hmac
+import aiohttp
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from database.db import db
-from config import ADMINS, CRYPTO_PAY_API_TOKEN, CRYPTO_PAY_TESTNET
+from config import ADMINS, CRYPTO_PAY_API_TOKEN, CRYPTO_PAY_TESTNET, INVOICE_POLL_MIN, INVOICE_POLL_MAX
 
 # Crypto Pay API URLs
 CRYPTO_PAY_API_URL = "https://testnet-pay.crypt.bot/api" if CRYPTO_PAY_TESTNET else "https://pay.crypt.bot/api"
@@ -27,48 +29,81 @@ PLAN_DURATIONS = {
 }
 
 
+# Crypto Pay methods that only read data, safe to send again after a network error
+IDEMPOTENT_METHODS = {"getMe", "getBalance", "getInvoices", "getExchangeRates", "getCurrencies"}
+# Seconds to wait before each retry of an idempotent call
+RETRY_DELAYS = [0.5, 1, 2]
+
+# Keep-alive connection pool shared by every Crypto Pay call
+http_session = None
+
+
+def get_http_session():
+    """Shared aiohttp session, created on first use (or by Bot.start)"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=20, connect=5),
+            headers={
+                "Crypto-Pay-API-Token": CRYPTO_PAY_API_TOKEN,
+                "Content-Type": "application/json"
+            }
+        )
+    return http_session
+
+
+async def close_http_session():
+    """Close the shared session (called from Bot.stop)"""
+    global http_session
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
+
+
 async def crypto_pay_request(method: str, params: dict = None):
     """Make a request to Crypto Pay API"""
-    import aiohttp
-    
     if not CRYPTO_PAY_API_TOKEN:
         return None, "Crypto Pay API token not configured"
     
     url = f"{CRYPTO_PAY_API_URL}/{method}"
-    headers = {
-        "Crypto-Pay-API-Token": CRYPTO_PAY_API_TOKEN,
-        "Content-Type": "application/json"
-    }
+    attempts = len(RETRY_DELAYS) + 1 if method in IDEMPOTENT_METHODS else 1
     
-    try:
-        async with aiohttp.ClientSession() as session:
+    for attempt in range(attempts):
+        try:
+            session = get_http_session()
             if params:
-                async with session.post(url, headers=headers, json=params) as response:
-                    try:
-                        data = await response.json()
-                    except:
-                        response_text = await response.text()
-                        return None, f"Invalid JSON response: {response_text[:200]}"
+                request = session.post(url, json=params)
             else:
-                async with session.get(url, headers=headers) as response:
-                    try:
-                        data = await response.json()
-                    except:
-                        response_text = await response.text()
-                        return None, f"Invalid JSON response: {response_text[:200]}"
-            
-            if data.get("ok"):
-                return data.get("result"), None
+                request = session.get(url)
+            async with request as response:
+                # Server side trouble - worth another try for read-only calls
+                if (response.status >= 500 or response.status == 429) and attempt < attempts - 1:
+                    await asyncio.sleep(RETRY_DELAYS[attempt])
+                    continue
+                try:
+                    data = await response.json()
+                except:
+                    response_text = await response.text()
+                    return None, f"Invalid JSON response: {response_text[:200]}"
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt < attempts - 1:
+                print(f"[CRYPTO PAY] {method} failed ({e!r}), retrying...")
+                await asyncio.sleep(RETRY_DELAYS[attempt])
+                continue
+            return None, str(e) or type(e).__name__
+        except Exception as e:
+            return None, str(e)
+        
+        if data.get("ok"):
+            return data.get("result"), None
+        else:
+            error_obj = data.get("error", {})
+            if isinstance(error_obj, dict):
+                error_msg = error_obj.get("message") or error_obj.get("name") or str(error_obj)
             else:
-                error_obj = data.get("error", {})
-                if isinstance(error_obj, dict):
-                    error_msg = error_obj.get("message") or error_obj.get("name") or str(error_obj)
-                else:
-                    error_msg = str(error_obj) if error_obj else "Unknown error"
-                return None, error_msg
-                
-    except Exception as e:
-        return None, str(e)
+                error_msg = str(error_obj) if error_obj else "Unknown error"
+            return None, error_msg
 
 
 async def create_crypto_invoice(user_id: int, plan: str, amount_usd: float):
@@ -118,6 +153,164 @@ async def check_invoice_status(invoice_id: int):
     return None, "Invoice not found"
 
 
+# Seconds after which an unfinished activation claim is taken over (process died mid-activation)
+ACTIVATION_TIMEOUT = 5 * 60
+
+
+async def activate_crypto_premium(invoice_id, user_id=None, plan=None):
+    """
+    Activate the premium paid with an invoice, exactly once.
+    Shared by the Check Payment button, the webhook and the reconciler.
+    Returns (expiry_time, days), or None if the invoice was already processed.
+    """
+    now = time.time()
+    claimed = await db.claim_crypto_invoice(invoice_id, now, now - ACTIVATION_TIMEOUT)
+    if claimed:
+        user_id = claimed.get("user_id", user_id)
+        plan = claimed.get("plan") or plan
+    elif user_id is None or await db.get_crypto_invoice(invoice_id):
+        # Already paid (or being activated) by another path, or unknown invoice without user info
+        return None
+    
+    try:
+        days = PLAN_DURATIONS.get(plan, 1)
+        
+        # Calculate expiry
+        duration = days * 24 * 60 * 60  # Convert to seconds
+        
+        # Check if user already has premium
+        user = await db.get_user(user_id)
+        is_premium_user = await db.is_premium(user_id)
+        
+        if is_premium_user and user and user.get('premium_expiry'):
+            current_expiry = user.get('premium_expiry')
+            if current_expiry > time.time():
+                expiry_time = current_expiry + duration
+            else:
+                expiry_time = time.time() + duration
+        else:
+            expiry_time = time.time() + duration
+        
+        # Set premium
+        await db.set_premium(user_id, True, expiry_time)
+    except Exception:
+        # Premium not granted - give the claim back so the payment isn't lost
+        if claimed:
+            await db.release_crypto_invoice(invoice_id)
+        raise
+    
+    if claimed:
+        await db.finish_crypto_invoice(invoice_id, time.time())
+    return expiry_time, days
+
+
+# Invoice ids per getInvoices call (API maximum)
+RECONCILE_CHUNK = 100
+# Invoices live for 1 hour (expires_in), ones missing from the API after this are given up
+INVOICE_MAX_AGE = 2 * 60 * 60
+
+
+class InvoiceReconciler:
+    """Background check of pending invoices, catches payments whose webhook never arrived"""
+
+    def __init__(self, min_interval=INVOICE_POLL_MIN, max_interval=INVOICE_POLL_MAX):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.client = None
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def poke(self):
+        """A new invoice was created - go back to fast polling"""
+        self.interval = self.min_interval
+        self.wake.set()
+
+    async def notify(self, user_id, invoice, expiry_time, days):
+        from datetime import datetime
+        paid_amount = invoice.get("paid_amount", invoice.get("amount"))
+        paid_asset = invoice.get("paid_asset", "crypto")
+        expiry_date = datetime.fromtimestamp(expiry_time).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            await self.client.send_message(
+                user_id,
+                f"✅ **Payment Received!**\n\n"
+                f"**Amount Paid:** {paid_amount} {paid_asset}\n"
+                f"**Plan:** {days} Day(s) Premium\n"
+                f"**Expires:** {expiry_date}\n\n"
+                f"Thank you for your purchase! 🎉"
+            )
+        except Exception as e:
+            print(f"[CRYPTO PAY] Could not notify user {user_id}: {e}")
+
+    async def reconcile(self):
+        """Check every pending invoice, returns how many are still pending"""
+        invoices = await db.get_all_pending_crypto_invoices()
+        if not invoices:
+            return 0
+        
+        activated = 0
+        expired = []
+        for i in range(0, len(invoices), RECONCILE_CHUNK):
+            chunk = invoices[i:i + RECONCILE_CHUNK]
+            result, error = await crypto_pay_request("getInvoices", {
+                "invoice_ids": ",".join(str(inv["invoice_id"]) for inv in chunk),
+                "count": len(chunk)
+            })
+            if error:
+                print(f"[CRYPTO PAY] Reconcile check failed: {error}")
+                continue
+            
+            remote = {item.get("invoice_id"): item for item in result.get("items", [])}
+            for inv in chunk:
+                item = remote.get(inv["invoice_id"])
+                status = item.get("status") if item else None
+                if status == "paid":
+                    activation = await activate_crypto_premium(inv["invoice_id"])
+                    if activation:
+                        activated += 1
+                        await self.notify(inv["user_id"], item, *activation)
+                elif status == "expired" or (item is None and time.time() - inv.get("created_at", 0) > INVOICE_MAX_AGE):
+                    expired.append(inv["invoice_id"])
+        
+        await db.expire_crypto_invoices(expired)
+        if activated or expired:
+            print(f"[CRYPTO PAY] Reconciled invoices: {activated} activated, {len(expired)} expired")
+        return len(invoices) - activated - len(expired)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                pending = await self.reconcile()
+            except Exception as e:
+                print(f"[CRYPTO PAY] Reconciler error: {e}")
+                pending = 0
+            # Poll fast while invoices are waiting, back off while there are none
+            if pending:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * 2, self.max_interval)
+
+    def start(self, client):
+        """Start the reconciler (called from Bot.start)"""
+        self.client = client
+        if CRYPTO_PAY_API_TOKEN and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+
+invoice_reconciler = InvoiceReconciler()
+
+
 # Crypto payment selection handler
 @Client.on_callback_query(filters.regex(r"^crypto_pay_"))
 async def crypto_payment_handler(client: Client, query):
@@ -166,6 +359,7 @@ async def crypto_payment_handler(client: Client, query):
             asset="MULTI",  # Multiple assets accepted
             pay_url=pay_url
         )
+        invoice_reconciler.poke()
         
         # Build payment message
         text = f"""**💰 Crypto Payment**
@@ -239,31 +433,12 @@ async def check_crypto_payment(client: Client, query):
     status = invoice.get("status")
     
     if status == "paid":
-        # Payment successful! Activate premium
-        plan = db_invoice.get("plan")
-        days = PLAN_DURATIONS.get(plan, 1)
-        
-        # Calculate expiry
-        duration = days * 24 * 60 * 60  # Convert to seconds
-        
-        # Check if user already has premium
-        user = await db.col.find_one({'id': user_id})
-        is_premium_user = await db.is_premium(user_id)
-        
-        if is_premium_user and user.get('premium_expiry'):
-            current_expiry = user.get('premium_expiry')
-            if current_expiry > time.time():
-                expiry_time = current_expiry + duration
-            else:
-                expiry_time = time.time() + duration
-        else:
-            expiry_time = time.time() + duration
-        
-        # Set premium
-        await db.set_premium(user_id, True, expiry_time)
-        
-        # Update invoice status
-        await db.update_crypto_invoice_status(invoice_id, "paid", time.time())
+        # Payment successful! Activate premium (once - the webhook or reconciler may have done it already)
+        activation = await activate_crypto_premium(invoice_id)
+        if activation is None:
+            await query.answer("✅ This payment was already processed!", show_alert=True)
+            return
+        expiry_time, days = activation
         
         # Get payment details
         paid_amount = invoice.get("paid_amount", invoice.get("amount"))
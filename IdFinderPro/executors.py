@@ -0,0 +1,172 @@
+"""
+Executors for work that would block the event loop.
+Blocking calls (file cleanup, QR rendering, HMAC checks) go to a thread pool,
+CPU heavy pure-Python work can go to a process pool, and a watchdog thread
+reports every time the loop stays blocked longer than LOOP_LAG_THRESHOLD.
+"""
+import asyncio
+import functools
+import glob
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config import THREAD_POOL_SIZE, PROCESS_POOL_SIZE, LOOP_LAG_THRESHOLD
+
+thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="bot-worker")
+process_pool = None  # Created on first use, stays None if PROCESS_POOL_SIZE is 0
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """Run a blocking function in the thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(thread_pool, functools.partial(func, *args, **kwargs))
+
+
+async def run_cpu(func, *args):
+    """
+    Run CPU bound work in the process pool (thread pool if it is disabled).
+    func and its arguments are pickled, so func must live in a module without import side effects.
+    """
+    global process_pool
+    if PROCESS_POOL_SIZE <= 0:
+        return await run_in_thread(func, *args)
+    if process_pool is None:
+        import multiprocessing
+        # spawn - never fork a process that holds open MTProto connections
+        process_pool = ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool, func, *args)
+
+
+def remove_files(*patterns):
+    """Delete every file matching the glob patterns, returns the removed paths"""
+    removed = []
+    for pattern in patterns:
+        for path in glob.glob(pattern):
+            try:
+                os.remove(path)
+                removed.append(path)
+            except:
+                pass
+    return removed
+
+
+async def remove_files_async(*patterns):
+    """remove_files without blocking the event loop"""
+    return await run_in_thread(remove_files, *patterns)
+
+
+def remove_file(path):
+    """Delete one file (a literal path, not a pattern), True if it is gone afterwards"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return False
+    return True
+
+
+async def remove_file_async(path, attempts=1, delay=1):
+    """remove_file off the event loop, retrying while the file is still locked (Windows)"""
+    for attempt in range(attempts):
+        if await run_in_thread(remove_file, path):
+            return True
+        if attempt < attempts - 1:
+            await asyncio.sleep(delay)
+    return False
+
+
+class LoopLagMonitor:
+    """Watchdog thread that measures event loop lag and records where the loop was blocked"""
+
+    def __init__(self, threshold=LOOP_LAG_THRESHOLD, interval=0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop = None
+        self.loop_thread_id = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.checks = 0
+        self.blocked = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.recent = deque(maxlen=20)  # (time, lag, where) of the latest blocks
+
+    def blocking_location(self):
+        """Innermost frames of the loop thread while it is blocked"""
+        frame = sys._current_frames().get(self.loop_thread_id)
+        if frame is None:
+            return "unknown"
+        stack = traceback.extract_stack(frame)[-3:]
+        return " <- ".join(f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in reversed(stack))
+
+    def watch(self):
+        while not self.stopped.is_set():
+            answered = threading.Event()
+            sent = time.monotonic()
+            try:
+                self.loop.call_soon_threadsafe(answered.set)
+            except RuntimeError:
+                return  # Loop closed
+            where = None
+            if not answered.wait(self.threshold):
+                # Still blocked - look at what the loop thread is running right now
+                where = self.blocking_location()
+                answered.wait()
+            lag = time.monotonic() - sent
+
+            self.checks += 1
+            self.last_lag = lag
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            if where:
+                self.blocked += 1
+                self.recent.append((time.time(), lag, where))
+                print(f"[LOOP] Event loop blocked for {lag:.2f}s at {where}")
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        """Start watching the running loop (called from Bot.start)"""
+        if self.thread is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.watch, name="loop-lag-monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread = None
+
+    def stats(self):
+        return {
+            'checks': self.checks,
+            'blocked': self.blocked,
+            'last_lag': round(self.last_lag, 4),
+            'avg_lag': round(self.total_lag / self.checks, 4) if self.checks else 0.0,
+            'max_lag': round(self.max_lag, 4)
+        }
+
+
+loop_monitor = LoopLagMonitor()
+
+
+def start_executors():
+    """Use the shared thread pool as the loop default and start the lag monitor (called from Bot.start)"""
+    asyncio.get_running_loop().set_default_executor(thread_pool)
+    loop_monitor.start()
+
+
+def shutdown_executors():
+    """Stop the monitor and the pools (called from Bot.stop)"""
+    loop_monitor.stop()
+    if process_pool is not None:
+        process_pool.shutdown(wait=False, cancel_futures=True)
+    thread_pool.shutdown(wait=False)
@@ -13,6 +13,7 @@ from pyrogram.errors import (
 )
 from config import API_ID, API_HASH
 from database.db import db
+from IdFinderPro.session_pool import session_pool
 
 SESSION_STRING_SIZE = 351
 
@@ -23,6 +24,8 @@ async def logout(client, message):
         await message.reply("❌ **You are not logged in!**\n\nUse `/login` to authenticate first.")
         return 
     await db.set_session(message.from_user.id, session=None)  
+    # Close the pooled connection for the old session
+    await session_pool.discard(message.from_user.id)
     await message.reply("✅ **Logged out successfully!**\n\nYour session has been removed. Use `/login` anytime to login again.")
 
 @Client.on_message(filters.private & ~filters.forwarded & filters.command(["login"]))
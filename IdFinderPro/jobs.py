@@ -0,0 +1,182 @@
+"""
+Central job queue.
+Every link a user sends becomes a job. Premium jobs start before free ones,
+except that FREE_RESERVED_JOBS slots are kept for free users while any are
+waiting. Users of the same class take turns (round-robin) so one big queue
+can't block everybody else, and at most MAX_RUNNING_JOBS run at the same time.
+A user has at most one running job, the rest wait in the queue.
+"""
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from config import MAX_RUNNING_JOBS, FREE_RESERVED_JOBS
+
+# Priority classes, highest first
+PREMIUM = "premium"
+FREE = "free"
+
+
+class Job:
+    __slots__ = ('id', 'user_id', 'priority', 'run', 'cancelled', 'created', 'started', 'notice', 'record_id')
+
+    def __init__(self, id, user_id, priority, run):
+        self.id = id
+        self.user_id = user_id
+        self.priority = priority
+        self.run = run  # async function(job)
+        self.cancelled = False
+        self.created = time.time()
+        self.started = None
+        self.notice = None  # "Queued" message edited when the job starts
+        self.record_id = None  # _id of the stored batch in the jobs collection
+
+
+class JobScheduler:
+    """Priority queue of user jobs with per-user fair share"""
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, free_reserved=FREE_RESERVED_JOBS):
+        self.max_running = max_running
+        # At least one slot stays usable by premium jobs
+        self.free_reserved = max(0, min(free_reserved, max_running - 1))
+        self.queues = {PREMIUM: OrderedDict(), FREE: OrderedDict()}  # {priority: {user_id: deque of jobs}} in turn order
+        self.running = {}  # {user_id: Job}
+        self.tasks = set()  # asyncio tasks of the running jobs
+        self.stopping = False
+        self.ids = itertools.count(1)
+
+    def submit(self, user_id, premium, run):
+        """Queue a job, returns (job, position) - position 0 means it started right away"""
+        job = Job(next(self.ids), user_id, PREMIUM if premium else FREE, run)
+        self.queues[job.priority].setdefault(user_id, deque()).append(job)
+        self.dispatch()
+        return job, self.position(job)
+
+    def pick(self, queues, busy, premium_running):
+        """(priority, user_id) whose job starts next, skipping users in busy - None if nothing can start"""
+        first = {}
+        for priority in (PREMIUM, FREE):
+            first[priority] = next((uid for uid, jobs in queues[priority].items() if jobs and uid not in busy), None)
+        premium, free = first[PREMIUM], first[FREE]
+        if premium is not None and (free is None or premium_running < self.max_running - self.free_reserved):
+            return PREMIUM, premium
+        if free is not None:
+            return FREE, free
+        return None
+
+    @staticmethod
+    def take(queue, user_id):
+        """Pop the user's first job, the user goes to the back of the line for their next one"""
+        jobs = queue.pop(user_id)
+        job = jobs.popleft()
+        if jobs:
+            queue[user_id] = jobs
+        return job
+
+    def premium_running(self):
+        return sum(1 for job in self.running.values() if job.priority == PREMIUM)
+
+    def position(self, job):
+        """
+        1-based place in the queue, 0 if the job is not waiting.
+        Replays next_job on a copy of the queue: users with a running job are
+        skipped until every startable job is taken, then assumed finished.
+        """
+        if job.started:
+            return 0
+        queues = {priority: OrderedDict((uid, deque(jobs)) for uid, jobs in queue.items())
+                  for priority, queue in self.queues.items()}
+        busy = set(self.running)
+        premium_running = self.premium_running()
+        index = 0
+        while True:
+            picked = self.pick(queues, busy, premium_running)
+            if picked is None:
+                if not busy:
+                    return 0  # Not queued (cancelled)
+                # Everything left waits for the running jobs to finish
+                busy.clear()
+                premium_running = 0
+                continue
+            priority, user_id = picked
+            index += 1
+            if self.take(queues[priority], user_id) is job:
+                return index
+            busy.add(user_id)
+            if priority == PREMIUM:
+                premium_running += 1
+
+    def next_job(self):
+        """Take the next job whose user has nothing running"""
+        picked = self.pick(self.queues, self.running, self.premium_running())
+        if picked is None:
+            return None
+        priority, user_id = picked
+        return self.take(self.queues[priority], user_id)
+
+    def dispatch(self):
+        """Start waiting jobs while there are free slots"""
+        while not self.stopping and len(self.running) < self.max_running:
+            job = self.next_job()
+            if job is None:
+                return
+            job.started = time.time()
+            self.running[job.user_id] = job
+            # Keep a reference so the task isn't garbage collected and can be cancelled on stop
+            task = asyncio.create_task(self.execute(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def execute(self, job):
+        try:
+            if job.notice:
+                try:
+                    await job.notice.edit_text("▶️ **Your download is starting now!**")
+                except Exception:
+                    pass
+            await job.run(job)
+        except Exception as e:
+            print(f"[JOBS] Job {job.id} of user {job.user_id} failed: {e}")
+        finally:
+            self.running.pop(job.user_id, None)
+            self.dispatch()
+
+    async def stop(self):
+        """Cancel the running jobs and wait for them (called from Bot.stop) - stored batches resume on the next start"""
+        self.stopping = True
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def waiting_jobs(self, user_id):
+        """Number of jobs this user has in the queue (not running)"""
+        return sum(len(queue.get(user_id, ())) for queue in self.queues.values())
+
+    def is_running(self, user_id):
+        return user_id in self.running
+
+    def is_cancelled(self, user_id):
+        """True if the user's running job was cancelled"""
+        job = self.running.get(user_id)
+        return job is not None and job.cancelled
+
+    def cancel_user(self, user_id):
+        """Cancel the running job and drop queued jobs, returns (was_running, dropped_jobs)"""
+        job = self.running.get(user_id)
+        if job:
+            job.cancelled = True
+        dropped = []
+        for queue in self.queues.values():
+            dropped.extend(queue.pop(user_id, ()))
+        return job is not None, dropped
+
+    def stats(self):
+        return {
+            'running': len(self.running),
+            'max_running': self.max_running,
+            'queued_premium': sum(len(jobs) for jobs in self.queues[PREMIUM].values()),
+            'queued_free': sum(len(jobs) for jobs in self.queues[FREE].values())
+        }
+
+
+scheduler = JobScheduler()
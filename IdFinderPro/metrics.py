@@ -0,0 +1,288 @@
+"""
+Handler and database metrics.
+Every update handler is wrapped by instrument() when it is registered (see
+Bot.add_handler) and MongoDB commands are timed by a pymongo command listener.
+Database calls are also added to the handler request they were made from.
+The listener runs in Motor's worker threads, so every update and every
+render holds metrics.lock.
+"""
+import contextvars
+import functools
+import threading
+import time
+from pymongo import monitoring
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# [db calls, db seconds] of the handler request running in this context
+request_db = contextvars.ContextVar("request_db", default=None)
+
+
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)  # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(LATENCY_BUCKETS)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Bucket upper bound the q-th fraction of observations falls into"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else float('inf')
+        return float('inf')
+
+
+class HandlerStats:
+    __slots__ = ('calls', 'errors', 'in_flight', 'latency', 'db_calls', 'db_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.db_calls = 0
+        self.db_seconds = 0.0
+
+
+class MongoStats:
+    __slots__ = ('errors', 'latency')
+
+    def __init__(self):
+        self.errors = 0
+        self.latency = Histogram()
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.handlers = {}  # {handler name: HandlerStats}
+        self.mongo = {}  # {command name: MongoStats}
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def handler(self, name):
+        with self.lock:
+            stats = self.handlers.get(name)
+            if stats is None:
+                stats = self.handlers[name] = HandlerStats()
+            return stats
+
+    def observe_mongo(self, command, seconds, failed=False):
+        with self.lock:
+            stats = self.mongo.get(command)
+            if stats is None:
+                stats = self.mongo[command] = MongoStats()
+            stats.latency.observe(seconds)
+            if failed:
+                stats.errors += 1
+            request = request_db.get()
+            if request is not None:
+                request[0] += 1
+                request[1] += seconds
+
+
+metrics = MetricsRegistry()
+
+
+def handler_name(callback):
+    return f"{callback.__module__.split('.')[-1]}.{callback.__name__}"
+
+
+def instrument(callback):
+    """Wrap an async update handler to record latency, in-flight count, errors and DB usage"""
+    import pyrogram
+
+    stats = metrics.handler(handler_name(callback))
+
+    @functools.wraps(callback)
+    async def wrapper(client, *args):
+        with metrics.lock:
+            stats.calls += 1
+            stats.in_flight += 1
+        token = request_db.set([0, 0.0])
+        started = time.perf_counter()
+        try:
+            return await callback(client, *args)
+        except (pyrogram.StopPropagation, pyrogram.ContinuePropagation):
+            raise
+        except Exception:
+            with metrics.lock:
+                stats.errors += 1
+            raise
+        finally:
+            with metrics.lock:
+                stats.latency.observe(time.perf_counter() - started)
+                stats.in_flight -= 1
+                db_calls, db_seconds = request_db.get()
+                stats.db_calls += db_calls
+                stats.db_seconds += db_seconds
+            request_db.reset(token)
+
+    wrapper.instrumented = True
+    return wrapper
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Times every MongoDB command (runs in the thread of the request, with its context)"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        metrics.observe_mongo(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        metrics.observe_mongo(event.command_name, event.duration_micros / 1e6, failed=True)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_histogram(lines, metric, label, value, histogram):
+    cumulative = 0
+    for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), histogram.counts):
+        cumulative += n
+        lines.append(f'{metric}_bucket{{{label}="{escape_label(value)}",le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_sum{{{label}="{escape_label(value)}"}} {histogram.sum:.6f}')
+    lines.append(f'{metric}_count{{{label}="{escape_label(value)}"}} {histogram.count}')
+
+
+def render_prometheus():
+    """All metrics in Prometheus text exposition format"""
+    with metrics.lock:
+        lines = []
+        handlers = sorted(metrics.handlers.items())
+
+        simple = [
+            ('bot_handler_calls_total', 'counter', 'Updates handled', 'calls'),
+            ('bot_handler_errors_total', 'counter', 'Handler calls that raised', 'errors'),
+            ('bot_handler_in_flight', 'gauge', 'Handler calls running now', 'in_flight'),
+            ('bot_handler_db_calls_total', 'counter', 'MongoDB commands made while handling updates', 'db_calls'),
+            ('bot_handler_db_seconds_total', 'counter', 'Time spent in MongoDB while handling updates', 'db_seconds'),
+        ]
+        for metric, kind, help_text, attr in simple:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in handlers:
+                value = getattr(stats, attr)
+                if isinstance(value, float):
+                    value = f"{value:.6f}"
+                lines.append(f'{metric}{{handler="{escape_label(name)}"}} {value}')
+
+        lines.append("# HELP bot_handler_duration_seconds Handler latency")
+        lines.append("# TYPE bot_handler_duration_seconds histogram")
+        for name, stats in handlers:
+            render_histogram(lines, 'bot_handler_duration_seconds', 'handler', name, stats.latency)
+
+        mongo = sorted(metrics.mongo.items())
+        lines.append("# HELP bot_mongo_command_duration_seconds MongoDB command latency")
+        lines.append("# TYPE bot_mongo_command_duration_seconds histogram")
+        for command, stats in mongo:
+            render_histogram(lines, 'bot_mongo_command_duration_seconds', 'command', command, stats.latency)
+        lines.append("# HELP bot_mongo_command_errors_total MongoDB commands that failed")
+        lines.append("# TYPE bot_mongo_command_errors_total counter")
+        for command, stats in mongo:
+            lines.append(f'bot_mongo_command_errors_total{{command="{escape_label(command)}"}} {stats.errors}')
+
+        # Event loop lag (executors) and read-through cache counters (database)
+        from IdFinderPro.executors import loop_monitor
+        loop = loop_monitor.stats()
+        lines.append("# HELP bot_loop_lag_seconds Event loop lag")
+        lines.append("# TYPE bot_loop_lag_seconds gauge")
+        for stat in ('last_lag', 'avg_lag', 'max_lag'):
+            lines.append(f'bot_loop_lag_seconds{{stat="{stat[:-4]}"}} {loop[stat]}')
+        lines.append("# HELP bot_loop_blocked_total Times the event loop was blocked longer than the threshold")
+        lines.append("# TYPE bot_loop_blocked_total counter")
+        lines.append(f"bot_loop_blocked_total {loop['blocked']}")
+
+        from database.db import db
+        caches = db.cache_stats()
+        for metric, key in (('bot_cache_hits_total', 'hits'), ('bot_cache_misses_total', 'misses')):
+            lines.append(f"# TYPE {metric} counter")
+            for cache, stats in sorted(caches.items()):
+                lines.append(f'{metric}{{cache="{cache}"}} {stats[key]}')
+
+        # Transfer throughput of the last 5 minutes (telemetry)
+        from IdFinderPro.telemetry import transfer_telemetry, WINDOWS
+        transfers = sorted(transfer_telemetry.aggregate(WINDOWS[0], lambda s: (s.direction, s.dc_id, s.bucket)).items(), key=str)
+        lines.append("# HELP bot_transfer_bytes_per_second Average transfer speed over the last 5 minutes")
+        lines.append("# TYPE bot_transfer_bytes_per_second gauge")
+        for (direction, dc_id, bucket), g in transfers:
+            lines.append(f'bot_transfer_bytes_per_second{{direction="{direction}",dc="{dc_id}",size="{escape_label(bucket)}"}} {g["speed"]:.0f}')
+        lines.append("# HELP bot_transfer_files Transfers finished in the last 5 minutes")
+        lines.append("# TYPE bot_transfer_files gauge")
+        for (direction, dc_id, bucket), g in transfers:
+            lines.append(f'bot_transfer_files{{direction="{direction}",dc="{dc_id}",size="{escape_label(bucket)}"}} {g["files"]}')
+        floods = transfer_telemetry.flood_summary(WINDOWS[0])
+        lines.append("# HELP bot_flood_wait_seconds FloodWait seconds slept in the last 5 minutes")
+        lines.append("# TYPE bot_flood_wait_seconds gauge")
+        for direction, (count, seconds) in sorted(floods.items()):
+            lines.append(f'bot_flood_wait_seconds{{direction="{direction}"}} {seconds:.0f}')
+        lines.append("# HELP bot_rpc_retries RPC retries in the last 5 minutes")
+        lines.append("# TYPE bot_rpc_retries gauge")
+        for direction, count in sorted(transfer_telemetry.retry_summary(WINDOWS[0]).items()):
+            lines.append(f'bot_rpc_retries{{direction="{direction}"}} {count}')
+
+        lines.append("# TYPE bot_uptime_seconds gauge")
+        lines.append(f"bot_uptime_seconds {time.time() - metrics.started:.0f}")
+        return "\n".join(lines) + "\n"
+
+
+def format_seconds(value):
+    if value == float('inf'):
+        return f">{LATENCY_BUCKETS[-1]}s"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:g}s"
+
+
+def render_summary(limit=15):
+    """Short text report for the /metrics admin command"""
+    with metrics.lock:
+        from IdFinderPro.executors import loop_monitor
+
+        handlers = [(name, stats) for name, stats in metrics.handlers.items() if stats.calls]
+        handlers.sort(key=lambda item: item[1].latency.sum, reverse=True)
+
+        lines = ["📊 **Handler Metrics** (slowest total time first)\n"]
+        for name, stats in handlers[:limit]:
+            avg = stats.latency.sum / stats.latency.count if stats.latency.count else 0
+            lines.append(
+                f"`{name}` - {stats.calls} calls, {stats.errors} errors, {stats.in_flight} running\n"
+                f"   avg {format_seconds(avg)} | p50 ≤{format_seconds(stats.latency.quantile(0.5))} | "
+                f"p95 ≤{format_seconds(stats.latency.quantile(0.95))} | "
+                f"DB {stats.db_calls / stats.calls:.1f} calls/req"
+            )
+        if not handlers:
+            lines.append("No updates handled yet.")
+
+        mongo = sorted(metrics.mongo.items(), key=lambda item: item[1].latency.sum, reverse=True)
+        if mongo:
+            lines.append("\n🗄️ **MongoDB**")
+            for command, stats in mongo[:8]:
+                avg = stats.latency.sum / stats.latency.count if stats.latency.count else 0
+                lines.append(f"`{command}` - {stats.latency.count} calls, avg {format_seconds(avg)}, {stats.errors} errors")
+
+        loop = loop_monitor.stats()
+        lines.append(
+            f"\n🔁 **Event loop:** lag avg {format_seconds(loop['avg_lag'])}, max {format_seconds(loop['max_lag'])}, "
+            f"blocked {loop['blocked']} times"
+        )
+        return "\n".join(lines)
@@ -33,7 +33,7 @@ async def premium_menu(client: Client, message: Message):
     downloads_today = await db.get_download_count(message.from_user.id)
     
     if is_premium_user:
-        user = await db.col.find_one({'id': message.from_user.id})
+        user = await db.get_user(message.from_user.id)
         expiry = user.get('premium_expiry')
         
         if expiry:
@@ -99,7 +99,7 @@ async def redeem_code(client: Client, message: Message):
     days = code_info['days']
     
     # Check if user already has premium
-    user = await db.col.find_one({'id': message.from_user.id})
+    user = await db.get_user(message.from_user.id)
     is_premium_user = await db.is_premium(message.from_user.id)
     
     # Calculate new expiry time
@@ -0,0 +1,160 @@
+"""
+In-memory transfer progress.
+Pyrogram chunk callbacks only update a small struct per status message and a
+single editor task renders and pushes the status edits on a throttle.
+"""
+import asyncio
+import time
+from pyrogram.errors import FloodWait
+from IdFinderPro.telemetry import transfer_telemetry
+
+# Seconds between two edits of the same status message
+EDIT_INTERVAL = 10
+
+
+class TransferProgress:
+    __slots__ = ('client', 'chat_id', 'message_id', 'type', 'current', 'total',
+                 'started', 'last_bytes', 'last_time', 'speed', 'last_edit', 'last_text',
+                 'direction', 'dc_id', 'first_byte', 'retry_after')
+
+    def __init__(self, client, chat_id, message_id, type, direction=None, dc_id=None):
+        now = time.time()
+        self.client = client
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.type = type  # "down" or "up"
+        self.current = 0
+        self.total = 0
+        self.started = now
+        self.last_bytes = 0
+        self.last_time = now
+        self.speed = 0
+        self.last_edit = 0
+        self.last_text = None
+        self.direction = direction or type  # Telemetry direction: "down", "up" or "stream"
+        self.dc_id = dc_id
+        self.first_byte = None  # Seconds until the first chunk arrived
+        self.retry_after = 0  # No edits of this message before this time (FloodWait)
+
+
+# Format sizes
+def format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f"{size:.2f}{unit}"
+        size /= 1024
+    return f"{size:.2f}TB"
+
+
+def render_status(entry):
+    """Build the status text for one transfer"""
+    current, total = entry.current, entry.total
+
+    # Format speed
+    speed_text = format_size(entry.speed) + "/s" if entry.speed > 0 else "Calculating..."
+
+    # Calculate percentage
+    percentage = (current * 100 / total) if total > 0 else 0
+
+    # Create horizontal progress bar
+    bar_length = 20
+    filled_length = int(bar_length * current // total) if total > 0 else 0
+    bar = '█' * filled_length + '░' * (bar_length - filled_length)
+
+    # Create status message
+    action = "📥 Downloading" if entry.type == "down" else "📤 Uploading"
+    return f"""{action} in Progress
+
+[{bar}] {percentage:.1f}%
+
+📦 Processed: {format_size(current)} out of {format_size(total)}
+⚡ Speed: {speed_text}
+
+Hit /cancel to cancel the process"""
+
+
+class ProgressRegistry:
+    """Progress of every running transfer, keyed by status message id"""
+
+    def __init__(self, edit_interval=EDIT_INTERVAL):
+        self.edit_interval = edit_interval
+        self.transfers = {}  # {status_message_id: TransferProgress}
+        self.editor_task = None
+
+    def track(self, client, status_msg, type, direction=None, dc_id=None):
+        """Start showing progress of a transfer in status_msg"""
+        previous = self.transfers.get(status_msg.id)
+        if previous is not None:
+            self.finish(previous)
+        self.transfers[status_msg.id] = TransferProgress(client, status_msg.chat.id, status_msg.id, type, direction, dc_id)
+        self.start()
+
+    def untrack(self, message_id):
+        """Stop editing a status message"""
+        entry = self.transfers.pop(message_id, None)
+        if entry is not None:
+            self.finish(entry)
+
+    def finish(self, entry):
+        """Record a completed transfer in the telemetry (failed or cancelled ones are skipped)"""
+        if entry.total > 0 and entry.current >= entry.total:
+            transfer_telemetry.record_transfer(entry.direction, entry.dc_id, entry.total,
+                                               time.time() - entry.started, entry.first_byte)
+
+    def update(self, message_id, current, total):
+        entry = self.transfers.get(message_id)
+        if entry is None:
+            return
+        if entry.first_byte is None and current > 0:
+            entry.first_byte = time.time() - entry.started
+        entry.current = current
+        entry.total = total
+
+    async def edit_due(self):
+        """Push one status edit for every transfer whose throttle has expired"""
+        now = time.time()
+        for entry in list(self.transfers.values()):
+            if entry.total <= 0 or now - entry.last_edit < self.edit_interval or now < entry.retry_after:
+                continue
+
+            # Speed since the previous edit
+            time_diff = now - entry.last_time
+            if time_diff > 0:
+                entry.speed = (entry.current - entry.last_bytes) / time_diff
+            entry.last_bytes = entry.current
+            entry.last_time = now
+            entry.last_edit = now
+
+            text = render_status(entry)
+            if text == entry.last_text:
+                continue
+            entry.last_text = text
+            try:
+                await entry.client.edit_message_text(entry.chat_id, entry.message_id, text)
+            except FloodWait as e:
+                # Only this chat has to wait - the other transfers keep being edited
+                entry.retry_after = time.time() + e.value
+                entry.last_text = None
+            except Exception:
+                pass
+
+    async def editor(self):
+        while True:
+            await asyncio.sleep(1)
+            try:
+                await self.edit_due()
+            except Exception as e:
+                print(f"[PROGRESS] Editor error: {e}")
+
+    def start(self):
+        """Start the single status editor task"""
+        if self.editor_task is None or self.editor_task.done():
+            self.editor_task = asyncio.get_running_loop().create_task(self.editor())
+
+
+progress_registry = ProgressRegistry()
+
+
+async def progress(current, total, status_msg, type):
+    """Pyrogram progress callback - only records the numbers, no I/O"""
+    progress_registry.update(status_msg.id, current, total)
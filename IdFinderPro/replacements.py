@@ -0,0 +1,58 @@
+"""
+Word replacement engine for filenames and captions.
+Kept free of bot imports so the executors' process pool can import it.
+"""
+import re
+from functools import lru_cache
+
+
+# Characters that count as word boundaries for word replacements
+# Comprehensive separator list including: spaces, punctuation, symbols, math operators, 
+# currency symbols, arrows, geometric shapes, emojis, and special characters
+# Emoji ranges: U+1F300-1F9FF (emojis), U+2600-26FF (symbols), U+2700-27BF (dingbats), U+FE00-FE0F (variations)
+WORD_SEPARATORS = r'[\s,.;:!?\'"`~@#$%^&*()\[\]{}|/\\+=•·‣°÷×±¶§©®™†‡…¤¦¨¯¸ºª–—―‚„""''‹›«»≠≈≡≤≥∞∈∉∋∑∏√∂∆∇∫∴∵⊕⊗⊂⊃⊆⊇€£¥₩₽₹→←↑↓⇒⇐⇑⇓⇔★☆◆◇■□▲△▼▽\U0001F300-\U0001F9FF\u2600-\u26FF\u2700-\u27BF\uFE00-\uFE0F\-_]'
+
+
+@lru_cache(maxsize=256)
+def compile_word_replacements(replacement_pattern):
+    """Parse a replacement pattern once into compiled (regex, replace) rules, cached per pattern string"""
+    rules = []
+    for rule in replacement_pattern.split('|'):
+        rule = rule.strip()
+        if not rule:
+            continue
+        
+        # Check if it's a find:replace or just a find (remove)
+        if ':' in rule:
+            find, replace = rule.split(':', 1)
+            find = find.strip()
+            replace = replace.strip()
+        else:
+            find = rule.strip()
+            replace = ''  # Remove the word
+        
+        if not find:
+            continue
+        
+        # Match the word only when it stands between separators (or text start/end)
+        pattern = r'(?:^|(?<=' + WORD_SEPARATORS + r'))' + re.escape(find) + r'(?=' + WORD_SEPARATORS + r'|$)'
+        rules.append((re.compile(pattern, re.IGNORECASE), replace))
+    return tuple(rules)
+
+
+# Helper function to apply word replacements
+def apply_word_replacements(text, replacement_pattern):
+    """
+    Apply word replacements based on pattern.
+    Pattern format: "find1:change1|find2:change2|find3"
+    Works with words separated by space, comma, hyphen, or underscore
+    """
+    if not replacement_pattern or not text:
+        return text
+    
+    # Rules run in order, a later rule sees the text produced by the earlier ones
+    result = text
+    for regex, replace in compile_word_replacements(replacement_pattern):
+        result = regex.sub(replace, result)
+    
+    return result
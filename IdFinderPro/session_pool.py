@@ -0,0 +1,189 @@
+"""
+Pooled user-session clients.
+Keeps one connected client per logged-in user so a batch (and later requests)
+reuse the same MTProto connection instead of reconnecting for every file.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pyrogram import Client
+from config import API_ID, API_HASH, SESSION_POOL_SIZE, SESSION_IDLE_TIMEOUT, BATCH_WORKERS
+
+# Same client settings as the original per-request login client (at least one transfer per batch worker)
+CLIENT_WORKERS = 100
+CLIENT_TRANSMISSIONS = max(10, BATCH_WORKERS)
+
+
+class PooledSession:
+    __slots__ = ('client', 'session_string', 'last_used', 'in_use')
+
+    def __init__(self, client, session_string):
+        self.client = client
+        self.session_string = session_string
+        self.last_used = time.time()
+        self.in_use = 0
+
+
+class SessionPool:
+    """LRU pool of connected user clients keyed by user id"""
+
+    def __init__(self, max_size=SESSION_POOL_SIZE, idle_timeout=SESSION_IDLE_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.sessions = OrderedDict()  # {user_id: PooledSession}, least recently used first
+        self.retired = []  # Replaced PooledSessions still in use, disconnected on their last release
+        self.locks = {}  # {user_id: [asyncio.Lock, holders and waiters]} so one user never connects twice at once
+        self.reaper_task = None
+
+    @asynccontextmanager
+    async def user_lock(self, user_id):
+        """Per-user lock, removed from self.locks as soon as nobody holds or waits for it"""
+        entry = self.locks.get(user_id)
+        if entry is None:
+            entry = self.locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self.locks.get(user_id) is entry:
+                del self.locks[user_id]
+
+    async def acquire(self, user_id, session_string):
+        """Get a connected client for this user, connecting only if needed"""
+        async with self.user_lock(user_id):
+            entry = self.sessions.get(user_id)
+
+            # User logged in again with another account/session - batches using the old client keep it
+            if entry and entry.session_string != session_string:
+                await self.discard(user_id)
+                entry = None
+
+            if entry and not entry.client.is_connected:
+                try:
+                    await entry.client.connect()
+                except Exception:
+                    await self.discard(user_id)
+                    entry = None
+
+            if entry is None:
+                client = Client(
+                    f"saverestricted_{user_id}",
+                    session_string=session_string,
+                    api_hash=API_HASH,
+                    api_id=API_ID,
+                    in_memory=True,
+                    workers=CLIENT_WORKERS,
+                    max_concurrent_transmissions=CLIENT_TRANSMISSIONS,
+                    sleep_threshold=10
+                )
+                await client.connect()
+                entry = PooledSession(client, session_string)
+                self.sessions[user_id] = entry
+
+            entry.in_use += 1
+            entry.last_used = time.time()
+            self.sessions.move_to_end(user_id)
+
+        await self.trim()
+        return entry.client
+
+    async def release(self, user_id, client):
+        """Give a client back to the pool after a file is processed"""
+        entry = self.sessions.get(user_id)
+        if entry is None or entry.client is not client:
+            # Replaced while in use - close it once its last user is done
+            entry = next((e for e in self.retired if e.client is client), None)
+            if entry is None:
+                return
+            entry.in_use = max(0, entry.in_use - 1)
+            if entry.in_use == 0:
+                self.retired.remove(entry)
+                await self.disconnect(user_id, entry)
+            return
+        entry.in_use = max(0, entry.in_use - 1)
+        entry.last_used = time.time()
+        await self.trim()
+
+    @asynccontextmanager
+    async def session(self, user_id, session_string):
+        """Context manager version of acquire/release"""
+        client = await self.acquire(user_id, session_string)
+        try:
+            yield client
+        finally:
+            await self.release(user_id, client)
+
+    async def discard(self, user_id):
+        """Forget a user's client (logout, new session) - disconnected now, or on its last release if in use"""
+        entry = self.sessions.pop(user_id, None)
+        if entry is None:
+            return
+        if entry.in_use:
+            self.retired.append(entry)
+            return
+        await self.disconnect(user_id, entry)
+
+    async def disconnect(self, user_id, entry):
+        try:
+            await entry.client.disconnect()
+        except Exception as e:
+            print(f"[SESSION POOL] Disconnect error for {user_id}: {e}")
+
+    async def trim(self):
+        """Close least recently used idle clients until the pool is within its cap"""
+        while len(self.sessions) > self.max_size:
+            # Clients being connected or handed out by acquire (lock taken) are not idle
+            idle_user = next((uid for uid, entry in self.sessions.items() if entry.in_use == 0 and uid not in self.locks), None)
+            if idle_user is None:
+                # Every client is busy - the extra ones are closed as soon as they are released
+                break
+            await self.discard(idle_user)
+
+    async def reap_idle(self):
+        """Close clients that have not been used for idle_timeout seconds"""
+        now = time.time()
+        expired = [
+            uid for uid, entry in self.sessions.items()
+            if entry.in_use == 0 and now - entry.last_used > self.idle_timeout
+        ]
+        closed = 0
+        for uid in expired:
+            # acquire may have handed the client out since the list was made - check again under its lock
+            async with self.user_lock(uid):
+                entry = self.sessions.get(uid)
+                if entry is None or entry.in_use or time.time() - entry.last_used <= self.idle_timeout:
+                    continue
+                await self.discard(uid)
+                closed += 1
+        if closed:
+            print(f"[SESSION POOL] Closed {closed} idle session(s), {len(self.sessions)} open")
+
+    async def reaper(self):
+        while True:
+            await asyncio.sleep(60)
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                print(f"[SESSION POOL] Reaper error: {e}")
+
+    def start(self):
+        """Start the idle reaper (called from Bot.start)"""
+        if self.reaper_task is None:
+            self.reaper_task = asyncio.create_task(self.reaper())
+
+    async def close(self):
+        """Disconnect every pooled client (called from Bot.stop)"""
+        if self.reaper_task:
+            self.reaper_task.cancel()
+            self.reaper_task = None
+        for uid in list(self.sessions):
+            await self.disconnect(uid, self.sessions.pop(uid))
+        retired, self.retired = self.retired, []
+        for entry in retired:
+            await self.disconnect("retired", entry)
+
+
+session_pool = SessionPool()
@@ -59,15 +59,75 @@ Configure how your downloaded files are forwarded to your channel.
         [InlineKeyboardButton("📤 Upload Destination", callback_data="set_destination"), InlineKeyboardButton("✏️ Set Caption", callback_data="set_caption")],
         [InlineKeyboardButton(upload_btn_text, callback_data="toggle_upload_type"), InlineKeyboardButton("📝 Set Suffix", callback_data="set_suffix")],
         [InlineKeyboardButton("🔢 Set Index Count", callback_data="reset_index"), InlineKeyboardButton("🖼️ Set Thumbnail", callback_data="set_thumbnail")],
-        [InlineKeyboardButton("🔄 Remove/Replace Words", callback_data="replace_words_menu")],
+        [InlineKeyboardButton("🔄 Remove/Replace Words", callback_data="replace_words_menu"), InlineKeyboardButton("🎚️ File Filters", callback_data="set_filters")],
         [InlineKeyboardButton("🗑️ Clear All Settings", callback_data="clear_settings"), InlineKeyboardButton("🏠 Main Menu", callback_data="start")]
     ]
     
     await message.reply(settings_text, reply_markup=InlineKeyboardMarkup(buttons))
 
 
+async def build_filters_menu(user_id):
+    """Build the file type filters page"""
+    settings = await db.get_user_settings(user_id)
+    
+    # Get filter statuses
+    filter_text = settings.get('filter_text', True) if settings else True
+    filter_doc = settings.get('filter_document', True) if settings else True
+    filter_video = settings.get('filter_video', True) if settings else True
+    filter_photo = settings.get('filter_photo', True) if settings else True
+    filter_audio = settings.get('filter_audio', True) if settings else True
+    filter_voice = settings.get('filter_voice', True) if settings else True
+    filter_anim = settings.get('filter_animation', True) if settings else True
+    filter_sticker = settings.get('filter_sticker', True) if settings else True
+    filter_poll = settings.get('filter_poll', True) if settings else True
+    skip_filtered = settings.get('skip_filtered', False) if settings else False
+    
+    # Create status emojis
+    text_status = "✅" if filter_text else "❌"
+    doc_status = "✅" if filter_doc else "❌"
+    video_status = "✅" if filter_video else "❌"
+    photo_status = "✅" if filter_photo else "❌"
+    audio_status = "✅" if filter_audio else "❌"
+    voice_status = "✅" if filter_voice else "❌"
+    anim_status = "✅" if filter_anim else "❌"
+    sticker_status = "✅" if filter_sticker else "❌"
+    poll_status = "✅" if filter_poll else "❌"
+    skip_status = "✅" if skip_filtered else "❌"
+    
+    text = f"""**🎚️ File Type Filters**
+
+Configure which file types to forward to your channel.
+
+**Current Filters:**
+✏️ Text: {text_status}
+📄 Document: {doc_status}
+🎬 Video: {video_status}
+📸 Photo: {photo_status}
+🎵 Audio: {audio_status}
+🎤 Voice: {voice_status}
+🎨 Animation: {anim_status}
+🎭 Sticker: {sticker_status}
+📊 Poll: {poll_status}
+
+⏭️ **Skip Filtered Files:** {skip_status}
+When enabled, disabled file types are not downloaded or sent to you at all.
+
+**Click to toggle:**"""
+
+    buttons = [
+        [InlineKeyboardButton(f"✏️ Text {text_status}", callback_data="toggle_filter_text"), InlineKeyboardButton(f"📄 Document {doc_status}", callback_data="toggle_filter_document")],
+        [InlineKeyboardButton(f"🎬 Video {video_status}", callback_data="toggle_filter_video"), InlineKeyboardButton(f"📸 Photo {photo_status}", callback_data="toggle_filter_photo")],
+        [InlineKeyboardButton(f"🎵 Audio {audio_status}", callback_data="toggle_filter_audio"), InlineKeyboardButton(f"🎤 Voice {voice_status}", callback_data="toggle_filter_voice")],
+        [InlineKeyboardButton(f"🎨 Animation {anim_status}", callback_data="toggle_filter_animation"), InlineKeyboardButton(f"🎭 Sticker {sticker_status}", callback_data="toggle_filter_sticker")],
+        [InlineKeyboardButton(f"📊 Poll {poll_status}", callback_data="toggle_filter_poll"), InlineKeyboardButton(f"⏭️ Skip Filtered {skip_status}", callback_data="toggle_filter_skip")],
+        [InlineKeyboardButton("🔙 Back to Settings", callback_data="back_to_settings")]
+    ]
+    
+    return text, buttons
+
+
 # Callback handler for settings
-@Client.on_callback_query(filters.regex(r"^(set_|reset_|clear_|back_to_settings|reset_index_to_zero|toggle_upload_type|replace_words_)"))
+@Client.on_callback_query(filters.regex(r"^(set_|reset_|clear_|back_to_settings|reset_index_to_zero|toggle_upload_type|toggle_filter_|replace_words_)"))
 async def settings_callback_handler(client: Client, query: CallbackQuery):
     """Handle settings button clicks"""
     data = query.data
@@ -227,56 +287,7 @@ Example: `@YourChannel` or `_backup` etc.
     
     elif data == "set_filters":
         # Show filter options
-        settings = await db.get_user_settings(user_id)
-        
-        # Get filter statuses
-        filter_text = settings.get('filter_text', True) if settings else True
-        filter_doc = settings.get('filter_document', True) if settings else True
-        filter_video = settings.get('filter_video', True) if settings else True
-        filter_photo = settings.get('filter_photo', True) if settings else True
-        filter_audio = settings.get('filter_audio', True) if settings else True
-        filter_voice = settings.get('filter_voice', True) if settings else True
-        filter_anim = settings.get('filter_animation', True) if settings else True
-        filter_sticker = settings.get('filter_sticker', True) if settings else True
-        filter_poll = settings.get('filter_poll', True) if settings else True
-        
-        # Create status emojis
-        text_status = "✅" if filter_text else "❌"
-        doc_status = "✅" if filter_doc else "❌"
-        video_status = "✅" if filter_video else "❌"
-        photo_status = "✅" if filter_photo else "❌"
-        audio_status = "✅" if filter_audio else "❌"
-        voice_status = "✅" if filter_voice else "❌"
-        anim_status = "✅" if filter_anim else "❌"
-        sticker_status = "✅" if filter_sticker else "❌"
-        poll_status = "✅" if filter_poll else "❌"
-        
-        text = f"""**🎚️ File Type Filters**
-
-Configure which file types to forward to your channel.
-
-**Current Filters:**
-✏️ Text: {text_status}
-📄 Document: {doc_status}
-🎬 Video: {video_status}
-📸 Photo: {photo_status}
-🎵 Audio: {audio_status}
-🎤 Voice: {voice_status}
-🎨 Animation: {anim_status}
-🎭 Sticker: {sticker_status}
-📊 Poll: {poll_status}
-
-**Click to toggle:**"""
-
-        buttons = [
-            [InlineKeyboardButton(f"✏️ Text {text_status}", callback_data="toggle_filter_text"), InlineKeyboardButton(f"📄 Document {doc_status}", callback_data="toggle_filter_document")],
-            [InlineKeyboardButton(f"🎬 Video {video_status}", callback_data="toggle_filter_video"), InlineKeyboardButton(f"📸 Photo {photo_status}", callback_data="toggle_filter_photo")],
-            [InlineKeyboardButton(f"🎵 Audio {audio_status}", callback_data="toggle_filter_audio"), InlineKeyboardButton(f"🎤 Voice {voice_status}", callback_data="toggle_filter_voice")],
-            [InlineKeyboardButton(f"🎨 Animation {anim_status}", callback_data="toggle_filter_animation"), InlineKeyboardButton(f"🎭 Sticker {sticker_status}", callback_data="toggle_filter_sticker")],
-            [InlineKeyboardButton(f"📊 Poll {poll_status}", callback_data="toggle_filter_poll")],
-            [InlineKeyboardButton("🔙 Back to Settings", callback_data="back_to_settings")]
-        ]
-        
+        text, buttons = await build_filters_menu(user_id)
         await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
     
     elif data == "reset_index":
@@ -351,6 +362,22 @@ Or click Reset to set it back to 0."""
             del settings_state[user_id]
         await show_settings_menu(client, query.message, user_id, edit=True)
     
+    elif data == "toggle_filter_skip":
+        # Toggle skipping filtered files completely (no download at all)
+        new_value = await db.toggle_skip_filtered(user_id)
+        
+        if new_value:
+            await query.answer("✅ Filtered file types will be skipped without downloading!", show_alert=True)
+        else:
+            await query.answer("✅ Filtered file types will be sent to you, only not forwarded!", show_alert=True)
+        
+        text, buttons = await build_filters_menu(user_id)
+        try:
+            await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+        except:
+            pass  # Ignore if message didn't change
+        return
+    
     elif data.startswith("toggle_filter_"):
         # Toggle filter
         filter_name = data.replace("toggle_", "")
@@ -359,57 +386,8 @@ Or click Reset to set it back to 0."""
         status = "enabled" if new_value else "disabled"
         await query.answer(f"✅ Filter {status}!", show_alert=False)
         
-        # Refresh filters page by manually rebuilding it
-        settings = await db.get_user_settings(user_id)
-        
-        # Get filter statuses
-        filter_text = settings.get('filter_text', True) if settings else True
-        filter_doc = settings.get('filter_document', True) if settings else True
-        filter_video = settings.get('filter_video', True) if settings else True
-        filter_photo = settings.get('filter_photo', True) if settings else True
-        filter_audio = settings.get('filter_audio', True) if settings else True
-        filter_voice = settings.get('filter_voice', True) if settings else True
-        filter_anim = settings.get('filter_animation', True) if settings else True
-        filter_sticker = settings.get('filter_sticker', True) if settings else True
-        filter_poll = settings.get('filter_poll', True) if settings else True
-        
-        # Create status emojis
-        text_status = "✅" if filter_text else "❌"
-        doc_status = "✅" if filter_doc else "❌"
-        video_status = "✅" if filter_video else "❌"
-        photo_status = "✅" if filter_photo else "❌"
-        audio_status = "✅" if filter_audio else "❌"
-        voice_status = "✅" if filter_voice else "❌"
-        anim_status = "✅" if filter_anim else "❌"
-        sticker_status = "✅" if filter_sticker else "❌"
-        poll_status = "✅" if filter_poll else "❌"
-        
-        text = f"""**🎚️ File Type Filters**
-
-Configure which file types to forward to your channel.
-
-**Current Filters:**
-✏️ Text: {text_status}
-📄 Document: {doc_status}
-🎬 Video: {video_status}
-📸 Photo: {photo_status}
-🎵 Audio: {audio_status}
-🎤 Voice: {voice_status}
-🎨 Animation: {anim_status}
-🎭 Sticker: {sticker_status}
-📊 Poll: {poll_status}
-
-**Click to toggle:**"""
-
-        buttons = [
-            [InlineKeyboardButton(f"✏️ Text {text_status}", callback_data="toggle_filter_text"), InlineKeyboardButton(f"📄 Document {doc_status}", callback_data="toggle_filter_document")],
-            [InlineKeyboardButton(f"🎬 Video {video_status}", callback_data="toggle_filter_video"), InlineKeyboardButton(f"📸 Photo {photo_status}", callback_data="toggle_filter_photo")],
-            [InlineKeyboardButton(f"🎵 Audio {audio_status}", callback_data="toggle_filter_audio"), InlineKeyboardButton(f"🎤 Voice {voice_status}", callback_data="toggle_filter_voice")],
-            [InlineKeyboardButton(f"🎨 Animation {anim_status}", callback_data="toggle_filter_animation"), InlineKeyboardButton(f"🎭 Sticker {sticker_status}", callback_data="toggle_filter_sticker")],
-            [InlineKeyboardButton(f"📊 Poll {poll_status}", callback_data="toggle_filter_poll")],
-            [InlineKeyboardButton("🔙 Back to Settings", callback_data="back_to_settings")]
-        ]
-        
+        # Refresh filters page
+        text, buttons = await build_filters_menu(user_id)
         try:
             await query.message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
         except:
@@ -601,7 +579,7 @@ Configure how your downloaded files are forwarded to your channel.
         [InlineKeyboardButton("📤 Upload Destination", callback_data="set_destination"), InlineKeyboardButton("✏️ Set Caption", callback_data="set_caption")],
         [InlineKeyboardButton(upload_btn_text, callback_data="toggle_upload_type"), InlineKeyboardButton("📝 Set Suffix", callback_data="set_suffix")],
         [InlineKeyboardButton("🔢 Set Index Count", callback_data="reset_index"), InlineKeyboardButton("🖼️ Set Thumbnail", callback_data="set_thumbnail")],
-        [InlineKeyboardButton("🔄 Remove/Replace Words", callback_data="replace_words_menu")],
+        [InlineKeyboardButton("🔄 Remove/Replace Words", callback_data="replace_words_menu"), InlineKeyboardButton("🎚️ File Filters", callback_data="set_filters")],
         [InlineKeyboardButton("🗑️ Clear All Settings", callback_data="clear_settings"), InlineKeyboardButton("🏠 Main Menu", callback_data="start")]
     ]
     
@@ -5,12 +5,42 @@ import glob
 from pyrogram import Client, filters, enums
 from pyrogram.errors import FloodWait, UserIsBlocked, InputUserDeactivated, UserAlreadyParticipant, InviteHashExpired, UsernameNotOccupied, UserNotParticipant
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message 
-from config import API_ID, API_HASH, ERROR_MESSAGE, FORCE_SUB_CHANNEL, FORCE_SUB_CHANNEL_ID, ADMINS, LOG_CHANNEL_ID
+from config import API_ID, API_HASH, ERROR_MESSAGE, FORCE_SUB_CHANNEL, FORCE_SUB_CHANNEL_ID, ADMINS, LOG_CHANNEL_ID, BATCH_WORKERS, STREAM_TRANSFERS, MAX_QUEUED_JOBS, CHECKPOINT_EVERY, FORCE_SUB_MEMBER_TTL, FORCE_SUB_NONMEMBER_TTL
 from database.db import db
 from IdFinderPro.strings import HELP_TXT
+from IdFinderPro.session_pool import session_pool
+from IdFinderPro.progress import progress, progress_registry
+from IdFinderPro.telemetry import transfer_telemetry, media_dc_id
+from IdFinderPro.batch import BatchSequencer, MessagePrefetcher, transfer_slots, PREFETCH_CHUNK
+from IdFinderPro.streaming import StreamingUpload, SESSION_API_ERROR
+from IdFinderPro.jobs import scheduler
+from IdFinderPro.upi_qr import upi_payment_url, send_upi_qr
+from IdFinderPro.replacements import apply_word_replacements
+from IdFinderPro.executors import run_cpu, run_in_thread, remove_files_async, remove_file_async
+
+# Membership of one force subscription channel, cached per (user, channel)
+async def check_channel_member(client: Client, channel_id: int, user_id: int, fresh: bool = False):
+    """True/False if the user is/isn't a member, None if it could not be checked"""
+    key = (user_id, channel_id)
+    found, is_member = db.membership_cache.get(key)
+    # fresh=True re-checks cached "not member" answers (user may have just joined)
+    if found and not (fresh and not is_member):
+        return is_member
+    
+    try:
+        member = await client.get_chat_member(channel_id, user_id)
+        is_member = member.status not in (enums.ChatMemberStatus.LEFT, enums.ChatMemberStatus.BANNED)
+    except UserNotParticipant:
+        is_member = False
+    except Exception as e:
+        print(f"Force sub check error for channel {channel_id}: {e}")
+        return None
+    
+    db.membership_cache.set(key, is_member, FORCE_SUB_MEMBER_TTL if is_member else FORCE_SUB_NONMEMBER_TTL)
+    return is_member
 
 # Force subscription check - supports multiple channels
-async def check_force_sub(client: Client, user_id: int):
+async def check_force_sub(client: Client, user_id: int, fresh: bool = False):
     """Check if user has joined ALL force subscription channels"""
     # Get channels from database
     channels = await db.get_force_sub_channels()
@@ -24,35 +54,14 @@ async def check_force_sub(client: Client, user_id: int):
         except:
             return True
     
-    # Check all channels - user must join ALL
-    for channel in channels:
-        try:
-            member = await client.get_chat_member(channel['id'], user_id)
-            if member.status in ["left", "kicked"]:
-                return False
-        except UserNotParticipant:
-            return False
-        except Exception as e:
-            print(f"Force sub check error for channel {channel['id']}: {e}")
-            # Continue checking other channels
-            continue
-    
-    return True  # User joined all channels
-
-class batch_temp(object):
-    IS_BATCH = {}
+    # Check all channels at once - user must join ALL (channels that can't be checked are skipped)
+    results = await asyncio.gather(*(check_channel_member(client, channel['id'], user_id, fresh) for channel in channels))
+    return False not in results
 
-# Cleanup function to remove old status files and downloads on startup
+# Cleanup function to remove old downloads on startup
 def cleanup_old_files():
-    """Remove old status files and downloads folder contents"""
+    """Remove old downloads folder contents"""
     try:
-        # Remove status files
-        for file in glob.glob("*status.txt"):
-            try:
-                os.remove(file)
-            except:
-                pass
-        
         # Clean downloads folder but keep the folder
         if os.path.exists("downloads"):
             for file in os.listdir("downloads"):
@@ -72,49 +81,11 @@ def cleanup_old_files():
 # Run cleanup on module load
 cleanup_old_files()
 
-async def downstatus(client, statusfile, message, chat):
-    while True:
-        if os.path.exists(statusfile):
-            break
-
-        await asyncio.sleep(3)
-      
-    while os.path.exists(statusfile):
-        with open(statusfile, "r", encoding="utf-8") as downread:
-            txt = downread.read()
-        try:
-            await client.edit_message_text(chat, message.id, txt)
-            await asyncio.sleep(10)
-        except:
-            await asyncio.sleep(5)
-
-
-# upload status
-async def upstatus(client, statusfile, message, chat):
-    while True:
-        if os.path.exists(statusfile):
-            break
-
-        await asyncio.sleep(3)      
-    while os.path.exists(statusfile):
-        with open(statusfile, "r", encoding="utf-8") as upread:
-            txt = upread.read()
-        try:
-            await client.edit_message_text(chat, message.id, txt)
-            await asyncio.sleep(10)
-        except:
-            await asyncio.sleep(5)
-
-
-# progress writer with detailed info
-import time as time_module
-progress_data = {}
-
 # Track status messages for cleanup during cancel
 status_messages = {}  # {user_id: [message_objects]}
 
 # Track active downloads for admin monitoring
-active_downloads = {}  # {user_id: {'file': filename, 'started': timestamp}}
+active_downloads = {}  # {status_message_id: {'user_id': id, 'file': filename, 'started': timestamp}}
 
 # Helper function to apply custom caption
 def apply_custom_caption(template, original_caption, filename, index_count):
@@ -142,53 +113,14 @@ def add_suffix_to_filename(filename, suffix):
     else:
         return f"{filename}{suffix}"
 
-# Helper function to apply word replacements
-def apply_word_replacements(text, replacement_pattern):
-    """
-    Apply word replacements based on pattern.
-    Pattern format: "find1:change1|find2:change2|find3"
-    Works with words separated by space, comma, hyphen, or underscore
-    """
-    if not replacement_pattern or not text:
-        return text
-    
-    import re
-    
-    # Parse the pattern
-    rules = replacement_pattern.split('|')
-    
-    result = text
-    for rule in rules:
-        rule = rule.strip()
-        if not rule:
-            continue
-        
-        # Check if it's a find:replace or just a find (remove)
-        if ':' in rule:
-            find, replace = rule.split(':', 1)
-            find = find.strip()
-            replace = replace.strip()
-        else:
-            find = rule.strip()
-            replace = ''  # Remove the word
-        
-        if not find:
-            continue
-        
-        # Escape special regex characters in the find string
-        find_escaped = re.escape(find)
-        
-        # Create pattern that matches the word with various separators
-        # Comprehensive separator list including: spaces, punctuation, symbols, math operators, 
-        # currency symbols, arrows, geometric shapes, emojis, and special characters
-        # Emoji ranges: U+1F300-1F9FF (emojis), U+2600-26FF (symbols), U+2700-27BF (dingbats), U+FE00-FE0F (variations)
-        separators = r'[\s,.;:!?\'"`~@#$%^&*()\[\]{}|/\\+=•·‣°÷×±¶§©®™†‡…¤¦¨¯¸ºª–—―‚„""''‹›«»≠≈≡≤≥∞∈∉∋∑∏√∂∆∇∫∴∵⊕⊗⊂⊃⊆⊇€£¥₩₽₹→←↑↓⇒⇐⇑⇓⇔★☆◆◇■□▲△▼▽\U0001F300-\U0001F9FF\u2600-\u26FF\u2700-\u27BF\uFE00-\uFE0F\-_]'
-        pattern = r'(?:^|(?<=' + separators + r'))' + find_escaped + r'(?=' + separators + r'|$)'
-        
-        # Replace all occurrences
-        result = re.sub(pattern, replace, result, flags=re.IGNORECASE)
-    
-    return result
+# Captions longer than this are rewritten in the executor instead of on the event loop
+WORD_REPLACE_OFFLOAD_CHARS = 1000
+
+async def apply_word_replacements_async(text, replacement_pattern):
+    """apply_word_replacements that moves long texts off the event loop"""
+    if text and replacement_pattern and len(text) > WORD_REPLACE_OFFLOAD_CHARS:
+        return await run_cpu(apply_word_replacements, text, replacement_pattern)
+    return apply_word_replacements(text, replacement_pattern)
 
 
 # Helper function to forward to log channel
@@ -212,69 +144,98 @@ async def forward_to_log_channel(client, chat, sent_msg, user, filename):
         print(f"Log channel error: {log_error}")
 
 
+# Types whose uploads are remembered in the media cache
+MEDIA_CACHE_TYPES = ("Document", "Video", "Audio", "Photo")
+
+def get_final_filename(msg, msg_type, settings):
+    """Filename after the user's word replacements and suffix (same rules as the upload)"""
+    if msg_type not in ("Document", "Video", "Audio"):
+        return None
+    media = getattr(msg, msg_type.lower(), None)
+    final_filename = media.file_name if media and media.file_name else None
+    if not final_filename or not settings:
+        return final_filename
+    if settings.get('replace_filename_words'):
+        final_filename = apply_word_replacements(final_filename, settings['replace_filename_words'])
+    if settings.get('filename_suffix'):
+        final_filename = add_suffix_to_filename(final_filename, settings['filename_suffix'])
+    return final_filename
+
+async def build_final_caption(message, msg, settings, filename):
+    """Caption after the user's custom caption template and word replacements"""
+    caption = msg.caption if msg.caption else None
+    template = settings.get('custom_caption') if settings else None
+    if template:
+        index_count = await db.increment_index_count(message.from_user.id)
+        caption = apply_custom_caption(template, caption, filename, index_count)
+    replace_caption_words = settings.get('replace_caption_words') if settings else None
+    if replace_caption_words and caption:
+        caption = await apply_word_replacements_async(caption, replace_caption_words)
+    return caption
 
-def progress(current, total, message, type):
-    msg_id = message.id
-    
-    # Initialize progress tracking
-    if msg_id not in progress_data:
-        progress_data[msg_id] = {
-            'start_time': time_module.time(),
-            'last_current': 0,
-            'last_time': time_module.time()
-        }
-    
-    # Calculate speed
-    current_time = time_module.time()
-    time_diff = current_time - progress_data[msg_id]['last_time']
-    
-    if time_diff >= 1:  # Update speed every second
-        bytes_diff = current - progress_data[msg_id]['last_current']
-        speed = bytes_diff / time_diff if time_diff > 0 else 0
-        progress_data[msg_id]['last_current'] = current
-        progress_data[msg_id]['last_time'] = current_time
-    else:
-        # Use previous speed calculation
-        bytes_diff = current - progress_data[msg_id]['last_current']
-        speed = bytes_diff / time_diff if time_diff > 0 else 0
+async def get_media_cache_key(message, msg, msg_type):
+    """
+    Cache key of the bot's upload of this source file.
+    Includes everything that changes the uploaded file itself (filename, thumbnail,
+    document or media) - the caption is applied on top when resending.
+    """
+    media = getattr(msg, msg_type.lower(), None)
+    if not media or not getattr(media, 'file_unique_id', None):
+        return None
+    settings = await db.get_user_settings(message.from_user.id)
+    send_as_document = msg_type != "Document" and await db.get_send_as_document(message.from_user.id)
+    custom_thumb_id = settings.get('custom_thumbnail') if settings and msg_type in ("Document", "Video") else None
+    final_filename = get_final_filename(msg, msg_type, settings)
+    return f"{msg.chat.id}:{msg.id}:{media.file_unique_id}:{int(bool(send_as_document))}:{custom_thumb_id or ''}:{final_filename or ''}"
+
+async def remember_media(cache_key, sent_msg):
+    """Store the file_id of a finished upload in the media cache"""
+    if not cache_key or not sent_msg or not sent_msg.media:
+        return
+    media_type = sent_msg.media.value
+    media = getattr(sent_msg, media_type, None)
+    if not media:
+        return
+    try:
+        await db.set_cached_media(cache_key, media.file_id, media_type)
+    except Exception as e:
+        print(f"[MEDIA CACHE] Could not store {cache_key}: {e}")
+
+async def send_from_media_cache(client, message, msg, msg_type, msgid, sequencer, cache_key):
+    """Resend a file the bot already uploaded - True if handled, False to download it normally"""
+    cached = await db.get_cached_media(cache_key)
+    if not cached:
+        return False
     
-    # Format sizes
-    def format_size(size):
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024:
-                return f"{size:.2f}{unit}"
-            size /= 1024
-        return f"{size:.2f}TB"
+    if sequencer:
+        await sequencer.wait_turn(msgid)
+    if scheduler.is_cancelled(message.from_user.id):
+        return True
     
-    # Format speed
-    speed_text = format_size(speed) + "/s" if speed > 0 else "Calculating..."
+    settings = await db.get_user_settings(message.from_user.id)
+    final_filename = get_final_filename(msg, msg_type, settings)
+    final_caption = await build_final_caption(message, msg, settings, "photo" if msg_type == "Photo" else final_filename)
     
-    # Calculate percentage
-    percentage = (current * 100 / total) if total > 0 else 0
+    try:
+        sent_msg = await client.send_cached_media(message.chat.id, cached['file_id'], caption=final_caption or "", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+    except Exception as e:
+        # file_id no longer usable - forget it and do a normal download
+        print(f"[MEDIA CACHE] Cached file failed, downloading again: {e}")
+        await db.delete_cached_media(cache_key)
+        return False
     
-    # Create horizontal progress bar
-    bar_length = 20
-    filled_length = int(bar_length * current // total) if total > 0 else 0
-    bar = '█' * filled_length + '░' * (bar_length - filled_length)
+    # Forward to destination channel instantly using copy_message (no re-upload!)
+    forward_dest = settings.get('forward_destination') if settings else None
+    if forward_dest and settings.get(TYPE_FILTERS[msg_type], True):
+        try:
+            await client.copy_message(forward_dest, message.chat.id, sent_msg.id)
+        except Exception as e:
+            print(f"[WARNING] Failed to forward to channel: {e}")
     
-    # Create status message
-    action = "📥 Downloading" if type == "down" else "📤 Uploading"
-    status_text = f"""{action} in Progress
+    # Forward to log channel instantly (non-blocking)
+    asyncio.create_task(forward_to_log_channel(client, message.chat.id, sent_msg, message.from_user, final_filename or msg_type.lower()))
+    return True
 
-[{bar}] {percentage:.1f}%
-
-📦 Processed: {format_size(current)} out of {format_size(total)}
-⚡ Speed: {speed_text}
-
-Hit /cancel to cancel the process"""
-    
-    with open(f'{msg_id}{type}status.txt', "w", encoding="utf-8") as fileup:
-        fileup.write(status_text)
-    
-    # Cleanup progress data when complete
-    if current >= total:
-        if msg_id in progress_data:
-            del progress_data[msg_id]
 
 
 # start command
@@ -376,7 +337,7 @@ This will download messages from 100 to 150!
 
 **⚠️ Important Notes:**
 
-• Files are downloaded one by one
+• Several files download at once, but arrive in order
 • Use `/cancel` to stop batch download
 • Spaces in range don't matter: `1 - 10` works!
 • Premium users: Unlimited downloads
@@ -398,10 +359,20 @@ Start with small ranges to test, then do larger batches!
 async def send_cancel(client: Client, message: Message):
     user_id = message.from_user.id
     
+    # Cancel the running job and remove the user's waiting jobs from the queue
+    was_running, dropped = scheduler.cancel_user(user_id)
+    for job in dropped:
+        if job.record_id:
+            await db.finish_job(job.record_id, "cancelled")
+        if job.notice:
+            try:
+                await job.notice.edit_text("⏹️ **Removed from queue.**")
+            except:
+                pass
+    
     # Check if there's an active process
-    if user_id in batch_temp.IS_BATCH and batch_temp.IS_BATCH[user_id] == False:
-        # Process is running, cancel it IMMEDIATELY
-        batch_temp.IS_BATCH[user_id] = True
+    if was_running:
+        # Process is running, it stops IMMEDIATELY
         
         # Send immediate response
         await client.send_message(
@@ -414,11 +385,10 @@ async def send_cancel(client: Client, message: Message):
         
         # Clean up any status files and delete status messages
         try:
-            import glob
-            
             # Delete all tracked status messages for this user
             if user_id in status_messages:
                 for msg in status_messages[user_id]:
+                    progress_registry.untrack(msg.id)
                     try:
                         await msg.delete()
                     except Exception as e:
@@ -426,20 +396,9 @@ async def send_cancel(client: Client, message: Message):
                 # Clear the tracking list
                 status_messages[user_id] = []
             
-            # Clean all status files
-            for file in glob.glob(f"*status.txt"):
-                try:
-                    os.remove(file)
-                except:
-                    pass
-            
             # Clean up any partial downloads for this user
-            for partial_file in glob.glob(f"downloads/{user_id}_*"):
-                try:
-                    os.remove(partial_file)
-                    print(f"[CLEANUP] Removed partial download: {partial_file}")
-                except:
-                    pass
+            for partial_file in await remove_files_async(f"downloads/{user_id}_*"):
+                print(f"[CLEANUP] Removed partial download: {partial_file}")
         except:
             pass
         
@@ -447,6 +406,11 @@ async def send_cancel(client: Client, message: Message):
             chat_id=message.chat.id, 
             text="✅ **Process Cancelled Successfully!**\n\n⏹️ All active downloads/uploads have been stopped.\n\n💡 You can now start a new download."
         )
+    elif dropped:
+        await client.send_message(
+            chat_id=message.chat.id, 
+            text=f"✅ **Queue Cleared!**\n\n⏹️ Removed {len(dropped)} waiting download(s).\n\n💡 You can now start a new download."
+        )
     else:
         # No process is running
         await client.send_message(
@@ -480,8 +444,10 @@ async def admin_panel(client: Client, message: Message):
 • /addupi - Manage UPI payment details
 
 **User Management:**
-• /broadcast - Broadcast message to users
-• /processes - View active downloads
+• /broadcast - Broadcast message to users (add `dryrun` to keep dead users)
+• /broadcast_pause, /broadcast_resume, /broadcast_cancel, /broadcast_retry - Control broadcasts
+• /processes [minutes] - View active downloads and transfer stats
+• /metrics - Handler latency, database and event loop metrics
 • /exportdata - Export user data to CSV
 
 **Quick Actions:**
@@ -514,7 +480,7 @@ async def callback_handler(client: Client, query):
     
     if data == "check_joined":
         # Check if user joined
-        is_subscribed = await check_force_sub(client, query.from_user.id)
+        is_subscribed = await check_force_sub(client, query.from_user.id, fresh=True)
         if is_subscribed:
             await query.answer("✅ You're subscribed! Now send a link to download.", show_alert=True)
         else:
@@ -611,7 +577,7 @@ async def callback_handler(client: Client, query):
         
         if is_premium_user:
             # Premium user - show status and extend option
-            user = await db.col.find_one({'id': query.from_user.id})
+            user = await db.get_user(query.from_user.id)
             expiry = user.get('premium_expiry')
             if expiry:
                 from datetime import datetime
@@ -748,21 +714,9 @@ Choose your preferred payment method:"""
         
         plan_name = plan.replace('day', ' Days' if 'day' in plan and plan[0] != '1' else ' Day')
         
-        # Generate dynamic QR code
+        # Dynamic QR code (rendered once per payment URL, then reused by file_id)
         user_id = query.from_user.id
-        upi_url = f"upi://pay?pa={upi_id}&pn={receiver_name}&am={amount}&tn={user_id}"
-        
-        import qrcode
-        import io
-        
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(upi_url)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        qr_bytes = io.BytesIO()
-        qr_img.save(qr_bytes, format='PNG')
-        qr_bytes.seek(0)
+        upi_url = upi_payment_url(upi_id, receiver_name, amount, user_id)
         
         text = f"""**💳 UPI Payment (INR)**
 
@@ -803,9 +757,10 @@ Choose your preferred payment method:"""
         
         try:
             await query.message.delete()
-            await client.send_photo(
+            await send_upi_qr(
+                client,
                 query.from_user.id,
-                qr_bytes,
+                upi_url,
                 caption=text,
                 reply_markup=InlineKeyboardMarkup(buttons)
             )
@@ -887,26 +842,9 @@ Choose your preferred payment method:"""
         
         plan_name = plan.replace('day', ' Days' if 'day' in plan and plan[0] != '1' else ' Day')
         
-        # Generate dynamic QR code with UPI payment URL
+        # Dynamic QR code with UPI payment URL (rendered once per URL, then reused by file_id)
         user_id = query.from_user.id
-        
-        # UPI payment URL format: upi://pay?pa={upi_id}&pn={receiver_name}&am={amount}&tn={userid}
-        upi_url = f"upi://pay?pa={upi_id}&pn={receiver_name}&am={amount}&tn={user_id}"
-        
-        # Generate QR code
-        import qrcode
-        import io
-        
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(upi_url)
-        qr.make(fit=True)
-        
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Save to bytes
-        qr_bytes = io.BytesIO()
-        qr_img.save(qr_bytes, format='PNG')
-        qr_bytes.seek(0)
+        upi_url = upi_payment_url(upi_id, receiver_name, amount, user_id)
         
         # Message with UPI details and instructions
         text = f"""**💳 Payment Details**
@@ -948,9 +886,10 @@ Choose your preferred payment method:"""
         # Send QR code with caption
         try:
             await query.message.delete()
-            await client.send_photo(
+            await send_upi_qr(
+                client,
                 query.from_user.id,
-                qr_bytes,
+                upi_url,
                 caption=text,
                 reply_markup=InlineKeyboardMarkup(buttons)
             )
@@ -993,8 +932,10 @@ Choose your preferred payment method:"""
 • `/addupi` - Manage UPI payment details
 
 **User Management:**
-• `/broadcast` - Broadcast message to users
-• `/processes` - View active downloads
+• `/broadcast` - Broadcast message to users (add `dryrun` to keep dead users)
+• `/broadcast_pause`, `/broadcast_resume`, `/broadcast_cancel`, `/broadcast_retry` - Control broadcasts
+• `/processes [minutes]` - View active downloads and transfer stats
+• `/metrics` - Handler latency, database and event loop metrics
 • `/exportdata` - Export user data to CSV
 
 **Quick Actions:**
@@ -1099,6 +1040,7 @@ Use `/addupi` command for detailed management.
         total_users = await db.total_users_count()
         premium_users = await db.get_all_premium_users()
         force_sub_channels = await db.get_force_sub_channels()
+        user_cache = db.cache_stats()['users']
         
         text = f"""**📊 Bot Statistics**
 
@@ -1110,6 +1052,10 @@ Use `/addupi` command for detailed management.
 **Configuration:**
 • Force Subscribe Channels: {len(force_sub_channels)}/4
 
+**User Cache:**
+• Hits: {user_cache['hits']} | Misses: {user_cache['misses']} ({user_cache['hit_rate']}% hit rate)
+• Cached Users: {user_cache['size']}
+
 **Premium Plans:**
 • 1 Day: ₹{await db.get_global_setting('pricing_1day', 20)}
 • 7 Days: ₹{await db.get_global_setting('pricing_7day', 40)}
@@ -1260,31 +1206,20 @@ async def save(client: Client, message: Message):
             return await message.reply("**🔐 Please /login first to join channels.**")
         
         try:
-            acc = Client(
-                "saverestricted", 
-                session_string=user_data, 
-                api_hash=API_HASH, 
-                api_id=API_ID,
-                workers=100,  # Increased workers for faster processing
-                max_concurrent_transmissions=10,  # Allow multiple simultaneous transfers
-                sleep_threshold=10
-            )
-            await acc.connect()
-            
-            # Extract invite hash
-            invite_link = message.text.strip()
-            
-            try:
-                chat = await acc.join_chat(invite_link)
-                await message.reply(f"✅ **Successfully joined!**\n\n**Channel:** {chat.title}\n\nYou can now send post links from this channel.")
-            except UserAlreadyParticipant:
-                await message.reply("✅ **Already a member** of this channel!\n\nYou can send post links from this channel.")
-            except InviteHashExpired:
-                await message.reply("❌ **Invite link expired!**\n\nPlease get a new invite link.")
-            except Exception as e:
-                await message.reply(f"❌ **Error:** `{e}`")
-            
-            await acc.disconnect()
+            # Reuse the user's pooled connection instead of opening a new one
+            async with session_pool.session(message.from_user.id, user_data) as acc:
+                # Extract invite hash
+                invite_link = message.text.strip()
+                
+                try:
+                    chat = await acc.join_chat(invite_link)
+                    await message.reply(f"✅ **Successfully joined!**\n\n**Channel:** {chat.title}\n\nYou can now send post links from this channel.")
+                except UserAlreadyParticipant:
+                    await message.reply("✅ **Already a member** of this channel!\n\nYou can send post links from this channel.")
+                except InviteHashExpired:
+                    await message.reply("❌ **Invite link expired!**\n\nPlease get a new invite link.")
+                except Exception as e:
+                    await message.reply(f"❌ **Error:** `{e}`")
         except Exception as e:
             await message.reply(f"❌ **Error:** `{e}`\n\nPlease try `/logout` then `/login` again.")
         return
@@ -1304,9 +1239,9 @@ async def save(client: Client, message: Message):
             )
         
         # RATE LIMIT CHECK - Now moved inside batch loop for per-file counting
-        # But first, validate batch size for free users
-        if batch_temp.IS_BATCH.get(message.from_user.id) == False:
-            return await message.reply_text("⚠️ **One download is already in progress!**\n\n⏳ Please wait for it to complete or use `/cancel` to stop it.")
+        # But first, limit how many links one user can have waiting
+        if scheduler.waiting_jobs(message.from_user.id) >= MAX_QUEUED_JOBS:
+            return await message.reply_text(f"⚠️ **You already have {MAX_QUEUED_JOBS} downloads waiting!**\n\n⏳ Please wait for them to start or use `/cancel` to stop them.")
         
         datas = message.text.split("/")
         temp = datas[-1].replace("?single","").split("-")
@@ -1340,138 +1275,130 @@ async def save(client: Client, message: Message):
                 reply_markup=InlineKeyboardMarkup(buttons) if not is_premium_user else None
             )
         
-        batch_temp.IS_BATCH[message.from_user.id] = False
-        successful_downloads = 0
-        failed_downloads = 0
-        
-        for msgid in range(fromID, toID+1):
-            # Check if user cancelled
-            if batch_temp.IS_BATCH.get(message.from_user.id): 
-                break
-            
-            # Check rate limit for THIS file
-            can_download = await db.check_and_update_downloads(message.from_user.id)
-            if not can_download:
-                is_premium_user = await db.is_premium(message.from_user.id)
-                
-                # Calculate time until reset (midnight)
-                from datetime import datetime, timedelta
-                now = datetime.now()
-                tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-                time_until_reset = tomorrow - now
-                hours = int(time_until_reset.total_seconds() // 3600)
-                minutes = int((time_until_reset.total_seconds() % 3600) // 60)
-                
-                await message.reply(
-                    f"⚠️ **Daily limit reached at file {msgid}!**\n\n"
-                    f"✅ Downloaded: {successful_downloads} files\n"
-                    f"🚫 Daily limit: 2 downloads\n"
-                    f"⏰ **Reset in:** {hours}h {minutes}m\n\n"
-                    f"💡 **Want more?**\n"
-                    f"• Free: 2/day\n"
-                    f"• Premium: Unlimited downloads\n\n"
-                    f"Upgrade now: /premium"
-                )
-                break
-            
+        # Everything below runs as a queued job (see jobs.py)
+        await queue_batch(client, message, fromID, toID, is_premium_user)
+
+
+# Queue a download job (also used to resume stored batches after a restart)
+async def queue_batch(client: Client, message: Message, fromID: int, toID: int, is_premium_user: bool, resume=None):
+    datas = message.text.split("/")
+    batch_size = toID - fromID + 1
+
+    # Batches are stored so they can continue after a restart (single files are not worth a write)
+    record_id = None
+    if resume:
+        record_id = resume['_id']
+    elif batch_size > 1:
+        record_id = await db.create_job(message.from_user.id, message.chat.id, message.id, fromID, toID, is_premium_user)
+    checkpoint = fromID
+    # Filtered files are skipped silently inside a batch, a single link gets a reply
+    single = fromID == toID and not resume
+
+    async def run_batch(job):
+        # A resumed batch continues the counts of the stored job
+        successful_downloads = resume.get('successful', 0) if resume else 0
+        failed_downloads = resume.get('failed', 0) if resume else 0
+        skipped_downloads = resume.get('skipped', 0) if resume else 0
+
+        # File type filters are checked on the metadata, before anything is downloaded
+        user_settings = await db.get_user_settings(message.from_user.id)
+
+        # Private channels and bots need the user's session - connect it once for the whole batch
+        acc = None
+        if "https://t.me/c/" in message.text or "https://t.me/b/" in message.text:
+            user_data = await db.get_session(message.from_user.id)
+            if user_data is None:
+                return await message.reply("**For Downloading Restricted Content You Have To /login First.**")
+            try:
+                acc = await session_pool.acquire(message.from_user.id, user_data)
+            except:
+                return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
+
+        # Several files are downloaded at once but sent to the chat in message order
+        sequencer = BatchSequencer(fromID)
+
+        # Fetch message metadata 200 ids at a time, ahead of the workers
+        if "https://t.me/c/" in message.text:
+            prefetcher = MessagePrefetcher(acc, int("-100" + datas[4]), fromID, toID)
+        elif "https://t.me/b/" in message.text:
+            prefetcher = MessagePrefetcher(acc, datas[4], fromID, toID)
+        else:
+            prefetcher = MessagePrefetcher(client, datas[3], fromID, toID)
+        is_public = prefetcher.client is client
+
+        async def process(msgid, msg=None):
+            nonlocal successful_downloads, failed_downloads, skipped_downloads
             # private
             if "https://t.me/c/" in message.text:
-                # Login required for private channels
-                user_data = await db.get_session(message.from_user.id)
-                if user_data is None:
-                    await message.reply("**For Downloading Restricted Content You Have To /login First.**")
-                    batch_temp.IS_BATCH[message.from_user.id] = True
-                    return
-                try:
-                    acc = Client("saverestricted", session_string=user_data, api_hash=API_HASH, api_id=API_ID)
-                    await acc.connect()
-                except:
-                    batch_temp.IS_BATCH[message.from_user.id] = True
-                    return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
-                
                 chatid = int("-100" + datas[4])
                 try:
-                    await handle_private(client, acc, message, chatid, msgid)
+                    await handle_private(client, acc, message, chatid, msgid, sequencer, msg)
                     successful_downloads += 1
                 except Exception as e:
                     failed_downloads += 1
                     if ERROR_MESSAGE == True:
                         await client.send_message(message.chat.id, f"❌ **Error on file {msgid}:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id)
-    
+
             # bot
             elif "https://t.me/b/" in message.text:
-                # Login required for bot content
-                user_data = await db.get_session(message.from_user.id)
-                if user_data is None:
-                    await message.reply("**For Downloading Restricted Content You Have To /login First.**")
-                    batch_temp.IS_BATCH[message.from_user.id] = True
-                    return
-                try:
-                    acc = Client("saverestricted", session_string=user_data, api_hash=API_HASH, api_id=API_ID)
-                    await acc.connect()
-                except:
-                    batch_temp.IS_BATCH[message.from_user.id] = True
-                    return await message.reply("**Your Login Session Expired. So /logout First Then Login Again By - /login**")
-                
                 username = datas[4]
                 try:
-                    await handle_private(client, acc, message, username, msgid)
+                    await handle_private(client, acc, message, username, msgid, sequencer, msg)
                     successful_downloads += 1
                 except Exception as e:
                     failed_downloads += 1
                     if ERROR_MESSAGE == True:
                         await client.send_message(message.chat.id, f"❌ **Error on file {msgid}:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id)
-            
+
             # public
             else:
                 username = datas[3]
-                
+
                 # Get message from public channel
                 try:
-                    msg = await client.get_messages(username, msgid)
+                    if msg is None:
+                        msg = await client.get_messages(username, msgid)
                     if msg.empty:
                         failed_downloads += 1
                         await client.send_message(message.chat.id, f"❌ **Message {msgid} not found in {username}**", reply_to_message_id=message.id)
-                        continue
-                except UsernameNotOccupied: 
-                    await client.send_message(message.chat.id, "The username is not occupied by anyone", reply_to_message_id=message.id)
+                        return
+                    if is_filtered_out(user_settings, get_message_type(msg)):
+                        skipped_downloads += 1
+                        if single:
+                            await reply_filtered(message, get_message_type(msg))
+                        return
+                except UsernameNotOccupied:
+                    # Stop the rest of the batch, every file would fail the same way
+                    if not job.cancelled:
+                        job.cancelled = True
+                        await client.send_message(message.chat.id, "The username is not occupied by anyone", reply_to_message_id=message.id)
                     return
                 except Exception as access_error:
                     failed_downloads += 1
                     if ERROR_MESSAGE == True:
                         await client.send_message(message.chat.id, f"❌ **Error accessing {username}:** `{access_error}`", reply_to_message_id=message.id)
-                    continue
-                
+                    return
+
+                # Keep the chat in order - earlier files of the batch are sent first
+                await sequencer.wait_turn(msgid)
+                if job.cancelled:
+                    return
+
                 # Copy message to user
                 try:
                     sent_msg = await client.copy_message(message.chat.id, msg.chat.id, msg.id, reply_to_message_id=message.id)
                     successful_downloads += 1
-                    
+
                     # Get user settings for forwarding
                     settings = await db.get_user_settings(message.from_user.id)
                     forward_dest = settings.get('forward_destination') if settings else None
-                    
+
                     # Determine file type for filtering
                     msg_type = get_message_type(msg)
-                    
+
                     # Check filter settings based on file type
-                    should_forward = True
-                    if settings:
-                        if msg_type == "Document":
-                            should_forward = settings.get('filter_document', True)
-                        elif msg_type == "Video":
-                            should_forward = settings.get('filter_video', True)
-                        elif msg_type == "Photo":
-                            should_forward = settings.get('filter_photo', True)
-                        elif msg_type == "Audio":
-                            should_forward = settings.get('filter_audio', True)
-                        elif msg_type == "Animation":
-                            should_forward = settings.get('filter_animation', True)
-                        elif msg_type == "Voice":
-                            should_forward = settings.get('filter_voice', True)
-                        elif msg_type == "Sticker":
-                            should_forward = settings.get('filter_sticker', True)
-                    
+                    should_forward = is_type_enabled(settings, msg_type)
+
                     # Forward to destination channel if configured and filter allows
                     if forward_dest and should_forward:
                         try:
@@ -1480,11 +1407,11 @@ async def save(client: Client, message: Message):
                                 await client.get_chat(forward_dest)
                             except:
                                 pass  # If get_chat fails, try forwarding anyway
-                            
+
                             await client.copy_message(forward_dest, message.chat.id, sent_msg.id)
                         except Exception as fwd_error:
                             print(f"[WARNING] Failed to forward to destination channel {forward_dest}: {fwd_error}")
-                    
+
                     # Forward to log channel
                     if LOG_CHANNEL_ID != 0:
                         try:
@@ -1493,10 +1420,10 @@ async def save(client: Client, message: Message):
                                 await client.get_chat(LOG_CHANNEL_ID)
                             except:
                                 pass  # If get_chat fails, try forwarding anyway
-                            
+
                             # Copy the file to log channel
                             await client.copy_message(LOG_CHANNEL_ID, message.chat.id, sent_msg.id)
-                            
+
                             # Send user info to log channel
                             filename = "public_channel_file"
                             if msg_type == "Document" and msg.document and msg.document.file_name:
@@ -1507,12 +1434,12 @@ async def save(client: Client, message: Message):
                                 filename = msg.audio.file_name
                             elif msg_type:
                                 filename = msg_type.lower()
-                            
+
                             log_caption = f"📄 <b>File Downloaded</b>\n\n👤 User: {message.from_user.mention}\n🆔 ID: <code>{message.from_user.id}</code>\n📝 File: <code>{filename}</code>"
                             await client.send_message(LOG_CHANNEL_ID, log_caption, parse_mode=enums.ParseMode.HTML)
                         except Exception as log_error:
                             print(f"[WARNING] Log channel error for {LOG_CHANNEL_ID}: {log_error}")
-                    
+
                 except Exception as copy_error:
                     # If simple copy fails, try with user session (for restricted public content)
                     user_data = await db.get_session(message.from_user.id)
@@ -1522,20 +1449,141 @@ async def save(client: Client, message: Message):
                             await client.send_message(message.chat.id, f"❌ **Error on file {msgid}:** Content is restricted. Please use `/login` to access.", reply_to_message_id=message.id)
                     else:
                         try:
-                            acc = Client("saverestricted", session_string=user_data, api_hash=API_HASH, api_id=API_ID)
-                            await acc.connect()
-                            await handle_private(client, acc, message, username, msgid)
+                            async with session_pool.session(message.from_user.id, user_data) as user_acc:
+                                await handle_private(client, user_acc, message, username, msgid, sequencer)
                             successful_downloads += 1
                         except Exception as e:
                             failed_downloads += 1
                             if ERROR_MESSAGE == True:
                                 await client.send_message(message.chat.id, f"❌ **Error on file {msgid}:** `{e}`", reply_to_message_id=message.id)
 
-            # Minimal wait time for faster batch processing
-            await asyncio.sleep(0.05)  # Reduced to 50ms for even faster processing
-        
+        workers = asyncio.Semaphore(BATCH_WORKERS)
+        running = set()
+        charged = set()  # Files holding a quota slot that haven't finished yet
+
+        async def worker(msgid, msg):
+            try:
+                await process(msgid, msg)
+            except asyncio.CancelledError:
+                # Abandoned (shutdown or batch error) - not finished, so a resume processes it again
+                workers.release()
+                raise
+            except Exception as e:
+                print(f"[BATCH] File {msgid} failed: {e}")
+            # Always move the sequencer on, even for skipped or failed files
+            charged.discard(msgid)
+            await sequencer.finish(msgid)
+            workers.release()
+            await save_checkpoint()
+
+        async def save_checkpoint(force=False):
+            """Store the batch position every CHECKPOINT_EVERY files (not on every file)"""
+            nonlocal checkpoint
+            if not record_id:
+                return
+            if not force and sequencer.next_id - checkpoint < CHECKPOINT_EVERY:
+                return
+            checkpoint = sequencer.next_id
+            # Unused slots plus those of unfinished files - a resume gives them back and processes those files again
+            reserved = quota + len(charged)
+            try:
+                await db.update_job_progress(record_id, sequencer.next_id - 1, successful_downloads, failed_downloads, skipped_downloads, reserved)
+            except Exception as e:
+                print(f"[JOBS] Checkpoint of {record_id} failed: {e}")
+
+        # Today's quota is reserved one prefetch chunk at a time and stored with the checkpoint,
+        # so a crash or restart can only hold back the current chunk and resume_batches refunds it
+        quota = 0
+        limit_reached_at = None
+
+        try:
+            for msgid in range(fromID, toID+1):
+                # Wait for a free worker
+                await workers.acquire()
+
+                # Check if user cancelled
+                if job.cancelled:
+                    workers.release()
+                    break
+
+                # Deleted, unsupported and filtered messages are skipped before any download
+                # (public ones that don't exist are still reported as not found)
+                msg = await prefetcher.get(msgid)
+                if msg is not None:
+                    if msg.empty:
+                        skip = not is_public
+                    else:
+                        msg_type = get_message_type(msg)
+                        skip = not msg_type or is_filtered_out(user_settings, msg_type)
+                        if msg_type and skip:
+                            skipped_downloads += 1
+                            if single:
+                                await reply_filtered(message, msg_type)
+                    if skip:
+                        workers.release()
+                        await sequencer.finish(msgid)
+                        continue
+
+                # Each file uses one slot of the quota reserved for this batch
+                if msg is None or not msg.empty:
+                    if quota <= 0:
+                        quota = await db.reserve_downloads(message.from_user.id, min(PREFETCH_CHUNK, toID - msgid + 1))
+                        await save_checkpoint(force=True)
+                    if quota <= 0:
+                        workers.release()
+                        limit_reached_at = msgid
+                        break
+                    quota -= 1
+                    charged.add(msgid)
+
+                task = asyncio.create_task(worker(msgid, msg))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            # Wait for the files that are still being processed
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        finally:
+            prefetcher.close()
+            if acc is not None:
+                await session_pool.release(message.from_user.id, acc)
+            # Files still in flight only remain after an error or shutdown - they are abandoned
+            for task in running:
+                task.cancel()
+            # Give back slots that were reserved but not used (cancel, errors that end the batch)
+            unused = quota + len(charged)
+            quota = 0
+            charged.clear()
+            if unused > 0:
+                await db.release_downloads(message.from_user.id, unused)
+            await save_checkpoint(force=True)
+
+        if limit_reached_at is not None:
+            free_limit, premium_limit = await db.get_download_limits()
+
+            # Calculate time until reset (midnight)
+            from datetime import datetime, timedelta
+            now = datetime.now()
+            tomorrow = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            time_until_reset = tomorrow - now
+            hours = int(time_until_reset.total_seconds() // 3600)
+            minutes = int((time_until_reset.total_seconds() % 3600) // 60)
+
+            await message.reply(
+                f"⚠️ **Daily limit reached at file {limit_reached_at}!**\n\n"
+                f"✅ Downloaded: {successful_downloads} files\n"
+                f"🚫 Daily limit: {premium_limit if is_premium_user else free_limit} downloads\n"
+                f"⏰ **Reset in:** {hours}h {minutes}m\n\n"
+                f"💡 **Want more?**\n"
+                f"• Free: {free_limit}/day\n"
+                f"• Premium: Unlimited downloads\n\n"
+                f"Upgrade now: /premium"
+            )
+
         # Batch completed - send completion message
-        total_requested = toID - fromID + 1
+        first_id = resume['from_id'] if resume else fromID
+        total_requested = toID - first_id + 1
         if total_requested > 1:  # Only show for batch downloads (more than 1 file)
             status_emoji = "✅" if failed_downloads == 0 else "⚠️"
             await client.send_message(
@@ -1544,22 +1592,94 @@ async def save(client: Client, message: Message):
                 f"📦 **Requested:** {total_requested} files\n"
                 f"✅ **successful:** {successful_downloads} files\n"
                 + (f"❌ **Failed:** {failed_downloads} files\n" if failed_downloads > 0 else "")
-                + f"📝 **Range:** {fromID} to {toID}\n\n"
+                + (f"⏭️ **Skipped by filters:** {skipped_downloads} files\n" if skipped_downloads > 0 else "")
+                + f"📝 **Range:** {first_id} to {toID}\n\n"
                 + ("All files processed successfully! 🎉" if failed_downloads == 0 else "Some files had errors. Check messages above for details."),
                 reply_to_message_id=message.id
             )
+
+    async def run_and_record(job):
+        try:
+            await run_batch(job)
+        except asyncio.CancelledError:
+            # Bot is shutting down - keep the stored job so it resumes on the next start
+            raise
+        except Exception as e:
+            print(f"[JOBS] Batch of user {message.from_user.id} crashed: {e}")
+        if record_id:
+            await db.finish_job(record_id, "cancelled" if job.cancelled else "done")
+
+    job, position = scheduler.submit(message.from_user.id, is_premium_user, run_and_record)
+    job.record_id = record_id
+    if position:
+        job.notice = await message.reply(
+            f"⏳ **Added to queue!**\n\n"
+            f"📍 **Position:** {position}\n"
+            f"{'💎 Premium downloads start first.' if is_premium_user else '💡 Premium downloads start first - /premium'}\n\n"
+            f"Use `/cancel` to remove it from the queue."
+        )
+        if job.started:
+            # Started while the notice was being sent
+            await job.notice.edit_text("▶️ **Your download is starting now!**")
+
+
+# Continue batches that were queued or running when the bot stopped
+async def resume_batches(client: Client):
+    from datetime import date
+    jobs = await db.get_unfinished_jobs()
+    for record in jobs:
+        # Quota still held when the bot stopped - give it back before the batch reserves again
+        reserved, reserved_date = await db.take_job_reservation(record['_id'])
+        if reserved and reserved_date == str(date.today()):
+            await db.release_downloads(record['user_id'], reserved)
+        
+        next_id = record['cursor'] + 1
+        if next_id > record['to_id']:
+            await db.finish_job(record['_id'], "done")
+            continue
         
-        batch_temp.IS_BATCH[message.from_user.id] = True
+        # The original link message carries the user, chat and link
+        try:
+            message = await client.get_messages(record['chat_id'], record['message_id'])
+        except Exception as e:
+            print(f"[JOBS] Could not load message of job {record['_id']}: {e}")
+            message = None
+        if not message or message.empty or not message.from_user or not message.text:
+            await db.finish_job(record['_id'], "lost")
+            continue
+        
+        try:
+            await client.send_message(
+                record['chat_id'],
+                f"🔄 **Bot restarted - resuming your batch**\n\n📝 **Continuing from:** {next_id} to {record['to_id']}",
+                reply_to_message_id=record['message_id']
+            )
+        except Exception:
+            pass
+        await queue_batch(client, message, next_id, record['to_id'], record.get('premium', False), resume=record)
+    
+    if jobs:
+        print(f"[JOBS] Resumed {len(jobs)} stored batch job(s)")
+
 
 
 # handle private
-async def handle_private(client: Client, acc, message: Message, chatid: int, msgid: int):
-    msg: Message = await acc.get_messages(chatid, msgid)
+async def handle_private(client: Client, acc, message: Message, chatid: int, msgid: int, sequencer=None, msg=None):
+    if msg is None:
+        msg: Message = await acc.get_messages(chatid, msgid)
     if msg.empty: return 
     msg_type = get_message_type(msg)
     if not msg_type: return 
+    if is_filtered_out(await db.get_user_settings(message.from_user.id), msg_type):
+        if sequencer is None:
+            await reply_filtered(message, msg_type)
+        return 
     chat = message.chat.id
-    if batch_temp.IS_BATCH.get(message.from_user.id): return 
+    if scheduler.is_cancelled(message.from_user.id): return 
+    if msg_type in ("Text", "Poll") and sequencer:
+        # Nothing to download - just wait for the earlier files of the batch
+        await sequencer.wait_turn(msgid)
+        if scheduler.is_cancelled(message.from_user.id): return 
     if "Text" == msg_type:
         # Get user settings for forwarding
         settings = await db.get_user_settings(message.from_user.id)
@@ -1623,6 +1743,16 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
                 await client.send_message(message.chat.id, f"❌ **Error:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
             return
 
+    # Same source file already uploaded by the bot with these output settings - resend it instantly
+    cache_key = None
+    if msg_type in MEDIA_CACHE_TYPES:
+        try:
+            cache_key = await get_media_cache_key(message, msg, msg_type)
+            if cache_key and await send_from_media_cache(client, message, msg, msg_type, msgid, sequencer, cache_key):
+                return
+        except Exception as e:
+            print(f"[MEDIA CACHE] Lookup failed: {e}")
+
     smsg = await client.send_message(message.chat.id, '📥 **Downloading...**', reply_to_message_id=message.id)
     
     # Track this status message for cancel command
@@ -1630,24 +1760,56 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
         status_messages[message.from_user.id] = []
     status_messages[message.from_user.id].append(smsg)
     
-    asyncio.create_task(downstatus(client, f'{message.id}downstatus.txt', smsg, chat))
+    # Source DC of the media, for the transfer telemetry
+    source_dc = media_dc_id(msg)
+    progress_registry.track(client, smsg, "down", dc_id=source_dc)
     try:
         # Download with user-specific filename to prevent conflicts
-        # Use format: userid_random5digit (Pyrogram will add .temp automatically)
+        # Use format: userid_msgid_random5digit (Pyrogram will add .temp automatically)
         import random
         import time
         random_suffix = random.randint(10000, 99999)
-        temp_filename = f"downloads/{message.from_user.id}_{random_suffix}"
+        temp_filename = f"downloads/{message.from_user.id}_{msgid}_{random_suffix}"
         
         # Track active download
-        active_downloads[message.from_user.id] = {
+        active_downloads[smsg.id] = {
+            'user_id': message.from_user.id,
             'file': temp_filename,
             'started': time.time()
         }
         
+        # Big files go straight from the user session into the bot upload, without the disk
+        stream = None
+        if STREAM_TRANSFERS and not SESSION_API_ERROR and msg_type in ("Document", "Video", "Audio"):
+            media = getattr(msg, msg_type.lower())
+            stream = StreamingUpload(acc, msg, media.file_size or 0, media.file_name or os.path.basename(temp_filename))
+            progress_registry.track(client, smsg, "up", direction="stream", dc_id=source_dc)
+            try:
+                await stream.upload(client, progress, [smsg, "up"], cancelled=lambda: scheduler.is_cancelled(message.from_user.id))
+            except Exception as e:
+                if not scheduler.is_cancelled(message.from_user.id):
+                    # Saving to disk first is the fallback
+                    print(f"[STREAM] File {msgid} falls back to disk download: {e}")
+                    stream = None
+                    progress_registry.track(client, smsg, "down", dc_id=source_dc)
+        
         try:
-            file = await acc.download_media(msg, file_name=temp_filename, progress=progress, progress_args=[message,"down"])
+            if stream is not None:
+                # Nothing on disk - the path is only used for naming
+                file = temp_filename
+            else:
+                # Global cap on parallel downloads so big batches can't starve everyone else
+                async with transfer_slots:
+                    file = await acc.download_media(msg, file_name=temp_filename, progress=progress, progress_args=[smsg,"down"])
         except TimeoutError:
+            # Clean up
+            progress_registry.untrack(smsg.id)
+            active_downloads.pop(smsg.id, None)
+            # Clean temp files (only this file - other files of the batch may still be downloading)
+            await remove_files_async(f"{temp_filename}*")
+            if sequencer:
+                # Keep the batch replies in order
+                await sequencer.wait_turn(msgid)
             # Handle Pyrogram timeout specifically
             await smsg.edit_text(
                 "⏱️ **Download Timeout**\n\n"
@@ -1661,88 +1823,46 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
                 "✅ Large files may need multiple attempts\n\n"
                 "💡 The download will continue in the background if you try again."
             )
-            # Clean up
-            if os.path.exists(f'{message.id}downstatus.txt'):
-                try:
-                    os.remove(f'{message.id}downstatus.txt')
-                except:
-                    pass
-            if message.from_user.id in active_downloads:
-                del active_downloads[message.from_user.id]
-            # Clean temp files
-            try:
-                import glob
-                for partial_file in glob.glob(f"downloads/{message.from_user.id}_*"):
-                    try:
-                        os.remove(partial_file)
-                    except:
-                        pass
-            except:
-                pass
             return
         
-        # Clean up download status file
-        if os.path.exists(f'{message.id}downstatus.txt'):
-            try:
-                os.remove(f'{message.id}downstatus.txt')
-            except:
-                pass
+        # Stop download status updates
+        progress_registry.untrack(smsg.id)
         
         # Remove from active downloads
-        if message.from_user.id in active_downloads:
-            del active_downloads[message.from_user.id]
+        active_downloads.pop(smsg.id, None)
     except Exception as e:
         # Clean up on download failure
-        if os.path.exists(f'{message.id}downstatus.txt'):
-            try:
-                os.remove(f'{message.id}downstatus.txt')
-            except:
-                pass
-        # Clean up any partial download files for this user (including .temp files)
-        try:
-            import glob
-            for partial_file in glob.glob(f"downloads/{message.from_user.id}_*"):
-                try:
-                    os.remove(partial_file)
-                except:
-                    pass
-        except:
-            pass
+        progress_registry.untrack(smsg.id)
+        # Clean up partial download files of this file (including .temp files)
+        await remove_files_async(f"{temp_filename}*")
         # Remove from active downloads
-        if message.from_user.id in active_downloads:
-            del active_downloads[message.from_user.id]
+        active_downloads.pop(smsg.id, None)
+        if sequencer:
+            # Keep the batch replies in order
+            await sequencer.wait_turn(msgid)
         if ERROR_MESSAGE == True:
             await client.send_message(message.chat.id, f"Error: {e}", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML) 
         return await smsg.delete()
-    if batch_temp.IS_BATCH.get(message.from_user.id):
+    if sequencer:
+        # Downloaded - now wait until the earlier files of the batch have been sent
+        await sequencer.wait_turn(msgid)
+    if scheduler.is_cancelled(message.from_user.id):
         # Batch cancelled, cleanup downloaded file
         await asyncio.sleep(0.5)
-        for attempt in range(3):
-            try:
-                if os.path.exists(file):
-                    os.remove(file)
-                break
-            except:
-                if attempt < 2:
-                    await asyncio.sleep(1)
+        await remove_file_async(file, attempts=3)
         return 
-    asyncio.create_task(upstatus(client, f'{message.id}upstatus.txt', smsg, chat))
+    # The bot uploads to its own DC
+    progress_registry.track(client, smsg, "up", dc_id=await transfer_telemetry.home_dc(client))
 
     if msg.caption:
         caption = msg.caption
     else:
         caption = None
-    if batch_temp.IS_BATCH.get(message.from_user.id):
+    if scheduler.is_cancelled(message.from_user.id):
         # Batch cancelled before upload, cleanup file
+        progress_registry.untrack(smsg.id)
         await asyncio.sleep(0.5)
-        for attempt in range(3):
-            try:
-                if os.path.exists(file):
-                    os.remove(file)
-                break
-            except:
-                if attempt < 2:
-                    await asyncio.sleep(1)
+        await remove_file_async(file, attempts=3)
         return 
             
     if "Document" == msg_type:
@@ -1771,10 +1891,10 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
             final_filename = add_suffix_to_filename(final_filename, suffix)
         
         # Rename file to final filename if different
-        if final_filename and os.path.exists(file):
+        if final_filename:
             new_file_path = os.path.join(os.path.dirname(file), final_filename)
             try:
-                os.rename(file, new_file_path)
+                await run_in_thread(os.rename, file, new_file_path)
                 file = new_file_path
             except:
                 pass
@@ -1798,12 +1918,13 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
         
         # Apply word replacements to caption if pattern is set
         if replace_caption_words and final_caption:
-            final_caption = apply_word_replacements(final_caption, replace_caption_words)
+            final_caption = await apply_word_replacements_async(final_caption, replace_caption_words)
         
         try:
             # Send to user first - use final_filename or original filename for proper file naming
             send_filename = final_filename if final_filename else os.path.basename(file)
-            sent_msg = await client.send_document(chat, file, thumb=ph_path, caption=final_caption, file_name=send_filename, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+            sent_msg = await client.send_document(chat, stream.named(send_filename) if stream else file, thumb=ph_path, caption=final_caption, file_name=send_filename, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[smsg,"up"])
+            await remember_media(cache_key, sent_msg)
             
             # Forward to destination channel instantly using copy_message (no re-upload!)
             if forward_dest and filter_document:
@@ -1820,10 +1941,7 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
                 await client.send_message(message.chat.id, f"❌ **Error:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         
         if ph_path != None: 
-            try:
-                os.remove(ph_path)
-            except:
-                pass
+            await remove_file_async(ph_path)
         
 
     elif "Video" == msg_type:
@@ -1853,10 +1971,10 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
             final_filename = add_suffix_to_filename(final_filename, suffix)
         
         # Rename file to final filename if different
-        if final_filename and final_filename != original_filename and os.path.exists(file):
+        if final_filename and final_filename != original_filename:
             new_file_path = os.path.join(os.path.dirname(file), final_filename)
             try:
-                os.rename(file, new_file_path)
+                await run_in_thread(os.rename, file, new_file_path)
                 file = new_file_path
             except:
                 pass
@@ -1880,14 +1998,15 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
         
         # Apply word replacements to caption if pattern is set
         if replace_caption_words and final_caption:
-            final_caption = apply_word_replacements(final_caption, replace_caption_words)
+            final_caption = await apply_word_replacements_async(final_caption, replace_caption_words)
         
         try:
             # Send to user first
             if send_as_document:
-                sent_msg = await client.send_document(chat, file, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+                sent_msg = await client.send_document(chat, stream.named(final_filename) if stream else file, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[smsg,"up"])
             else:
-                sent_msg = await client.send_video(chat, file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+                sent_msg = await client.send_video(chat, stream.named(final_filename) if stream else file, duration=msg.video.duration, width=msg.video.width, height=msg.video.height, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[smsg,"up"])
+            await remember_media(cache_key, sent_msg)
             
             # Forward to destination channel instantly using copy_message (no re-upload!)
             if forward_dest and filter_video:
@@ -1903,10 +2022,7 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
                 await client.send_message(message.chat.id, f"❌ **Error:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         
         if ph_path != None: 
-            try:
-                os.remove(ph_path)
-            except:
-                pass
+            await remove_file_async(ph_path)
 
     elif "Animation" == msg_type:
         # Get user settings for forwarding
@@ -1962,7 +2078,7 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
         
         try:
             # Send to user first
-            sent_msg = await client.send_voice(chat, file, caption=caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+            sent_msg = await client.send_voice(chat, file, caption=caption, caption_entities=msg.caption_entities, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[smsg,"up"])
             
             # Forward to destination channel instantly using copy_message (no re-upload!)
             if forward_dest and filter_voice:
@@ -2003,10 +2119,10 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
             final_filename = add_suffix_to_filename(final_filename, suffix)
         
         # Rename file to final filename if different
-        if final_filename and final_filename != original_filename and os.path.exists(file):
+        if final_filename and final_filename != original_filename:
             new_file_path = os.path.join(os.path.dirname(file), final_filename)
             try:
-                os.rename(file, new_file_path)
+                await run_in_thread(os.rename, file, new_file_path)
                 file = new_file_path
             except:
                 pass
@@ -2023,13 +2139,18 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
             final_caption = apply_custom_caption(custom_caption_template, caption, final_filename, index_count)
         else:
             final_caption = caption
+        
+        # Apply word replacements to caption if pattern is set
+        if replace_caption_words and final_caption:
+            final_caption = await apply_word_replacements_async(final_caption, replace_caption_words)
 
         try:
             # Send to user first
             if send_as_document:
-                sent_msg = await client.send_document(chat, file, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+                sent_msg = await client.send_document(chat, stream.named(final_filename) if stream else file, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[smsg,"up"])
             else:
-                sent_msg = await client.send_audio(chat, file, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[message,"up"])
+                sent_msg = await client.send_audio(chat, stream.named(final_filename) if stream else file, thumb=ph_path, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML, progress=progress, progress_args=[smsg,"up"])
+            await remember_media(cache_key, sent_msg)
             
             # Forward to destination channel instantly using copy_message (no re-upload!)
             if forward_dest and filter_audio:
@@ -2045,10 +2166,7 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
                 await client.send_message(message.chat.id, f"❌ **Error:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
         
         if ph_path != None: 
-            try:
-                os.remove(ph_path)
-            except:
-                pass
+            await remove_file_async(ph_path)
 
     elif "Photo" == msg_type:
         # Get user settings for forwarding
@@ -2068,16 +2186,16 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
         
         # Apply word replacements to caption if pattern is set
         if replace_caption_words and final_caption:
-            final_caption = apply_word_replacements(final_caption, replace_caption_words)
+            final_caption = await apply_word_replacements_async(final_caption, replace_caption_words)
         
         try:
             # Ensure the downloaded file has a proper image extension
-            if file and os.path.exists(file):
+            if file:
                 # If file doesn't have an image extension, add .jpg
                 if not file.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
                     new_file = file + '.jpg'
                     try:
-                        os.rename(file, new_file)
+                        await run_in_thread(os.rename, file, new_file)
                         file = new_file
                     except:
                         pass
@@ -2087,6 +2205,7 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
                 sent_msg = await client.send_document(chat, file, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
             else:
                 sent_msg = await client.send_photo(chat, file, caption=final_caption, reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
+            await remember_media(cache_key, sent_msg)
             
             # Forward to destination channel instantly using copy_message (no re-upload!)
             if forward_dest and filter_photo:
@@ -2101,34 +2220,49 @@ async def handle_private(client: Client, acc, message: Message, chatid: int, msg
             if ERROR_MESSAGE == True:
                 await client.send_message(message.chat.id, f"❌ **Error:** `{e}`\n\n💡 If the error persists, try `/logout` and `/login` again.", reply_to_message_id=message.id, parse_mode=enums.ParseMode.HTML)
     
-    # Cleanup status file and downloaded file
-    if os.path.exists(f'{message.id}upstatus.txt'): 
-        try:
-            os.remove(f'{message.id}upstatus.txt')
-        except:
-            pass
+    # Stop upload status updates and cleanup downloaded file
+    progress_registry.untrack(smsg.id)
     
     # Give Windows time to release file handle
     await asyncio.sleep(0.5)
     
     # Retry file deletion with multiple attempts (Windows file locking issue)
-    for attempt in range(5):
-        try:
-            if os.path.exists(file):
-                os.remove(file)
-            break
-        except PermissionError:
-            if attempt < 4:
-                await asyncio.sleep(1)  # Wait and retry
-            else:
-                print(f"[WARNING] Could not delete file: {file}")
-        except Exception as e:
-            print(f"[WARNING] File deletion error: {e}")
-            break
+    if not await remove_file_async(file, attempts=5):
+        print(f"[WARNING] Could not delete file: {file}")
     
     await client.delete_messages(message.chat.id,[smsg.id])
 
 
+# User setting that enables each message type
+TYPE_FILTERS = {
+    "Text": "filter_text",
+    "Document": "filter_document",
+    "Video": "filter_video",
+    "Photo": "filter_photo",
+    "Audio": "filter_audio",
+    "Voice": "filter_voice",
+    "Animation": "filter_animation",
+    "Sticker": "filter_sticker",
+    "Poll": "filter_poll"
+}
+
+def is_type_enabled(settings, msg_type):
+    """False if the user turned this type off in the file filters (it isn't forwarded)"""
+    if not settings or msg_type not in TYPE_FILTERS:
+        return True
+    return settings.get(TYPE_FILTERS[msg_type], True)
+
+def is_filtered_out(settings, msg_type):
+    """True if the user disabled this type and wants filtered files skipped completely"""
+    if not settings or not settings.get('skip_filtered'):
+        return False
+    return not is_type_enabled(settings, msg_type)
+
+async def reply_filtered(message, msg_type):
+    """Tell the user why a single link produced nothing"""
+    await message.reply(f"⏭️ **Skipped:** {msg_type.lower()} messages are turned off in your file filters (/settings).")
+
+
 # get the type of message
 def get_message_type(msg: pyrogram.types.messages_and_media.message.Message):
     try:
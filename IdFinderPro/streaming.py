@@ -0,0 +1,248 @@
+"""
+Disk-less transfers.
+A file is read chunk by chunk from the user session (stream_media) and each
+512 KB part is uploaded by the bot right away, through a small bounded buffer.
+The finished upload is handed to send_document/send_video/send_audio through
+Bot.save_file, so the usual send code is used unchanged.
+"""
+import asyncio
+import inspect
+import math
+from hashlib import md5
+from pyrogram import raw
+from pyrogram.errors import FloodWait, InternalServerError, ServiceUnavailable
+from config import STREAM_BUFFER_PARTS
+from IdFinderPro.batch import transfer_slots
+from IdFinderPro.telemetry import transfer_telemetry
+
+try:
+    from pyrogram.session import Session
+except ImportError:
+    Session = None
+
+# Telegram upload part size
+PART_SIZE = 512 * 1024
+# Chunk size of stream_media (a part never spans two chunks)
+STREAM_CHUNK = 1024 * 1024
+
+# Attempts per part and the waits between them (FloodWait uses its own wait)
+PART_RETRIES = 5
+RETRY_DELAYS = [1, 2, 4, 8]
+
+
+class StreamingUnsupported(RuntimeError):
+    """The installed pyrogram doesn't have the Session API streaming relies on"""
+
+
+class StreamPartMissing(Exception):
+    """Telegram asked for a part again and it could not be uploaded"""
+
+
+def check_session_api():
+    """Why the private upload session can't be used with this pyrogram (None if it can)"""
+    if Session is None:
+        return "pyrogram.session.Session not found"
+    params = inspect.signature(Session.__init__).parameters
+    missing = [name for name in ('client', 'dc_id', 'auth_key', 'test_mode', 'is_media') if name not in params]
+    missing += [name for name in ('start', 'stop', 'invoke') if not hasattr(Session, name)]
+    if missing:
+        return f"pyrogram Session has no {', '.join(missing)}"
+    return None
+
+
+# Checked once at import - handle_private doesn't stream at all when it is set
+SESSION_API_ERROR = check_session_api()
+if SESSION_API_ERROR:
+    print(f"[STREAM] Streaming disabled, files go through the disk: {SESSION_API_ERROR}")
+
+
+async def open_upload_session(client):
+    """Media session to the bot's own DC - the only pyrogram internals used for streaming"""
+    if SESSION_API_ERROR:
+        raise StreamingUnsupported(SESSION_API_ERROR)
+    session = Session(
+        client, await client.storage.dc_id(), await client.storage.auth_key(),
+        await client.storage.test_mode(), is_media=True
+    )
+    await session.start()
+    return session
+
+
+def part_request(file_id, file_part, total_parts, is_big, data):
+    if is_big:
+        return raw.functions.upload.SaveBigFilePart(
+            file_id=file_id,
+            file_part=file_part,
+            file_total_parts=total_parts,
+            bytes=data
+        )
+    return raw.functions.upload.SaveFilePart(
+        file_id=file_id,
+        file_part=file_part,
+        bytes=data
+    )
+
+
+async def save_part(invoke, rpc):
+    """Upload one part, retrying transient errors with backoff and waiting out FloodWait"""
+    for attempt in range(PART_RETRIES):
+        try:
+            return await invoke(rpc)
+        except FloodWait as e:
+            if attempt == PART_RETRIES - 1:
+                raise
+            transfer_telemetry.record_flood_wait("up", "bot", e.value)
+            await asyncio.sleep(e.value)
+        except (OSError, asyncio.TimeoutError, InternalServerError, ServiceUnavailable) as e:
+            if attempt == PART_RETRIES - 1:
+                raise
+            transfer_telemetry.record_retry("up")
+            print(f"[STREAM] Part {rpc.file_part} failed, retrying: {e}")
+            await asyncio.sleep(RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)])
+
+
+class StreamingUpload:
+    """A file streamed from a user session into the bot's upload"""
+
+    def __init__(self, acc, msg, file_size, name):
+        self.acc = acc
+        self.msg = msg
+        self.file_size = file_size
+        self.name = name
+        self.input_file = None
+        self.file_id = None
+
+    def is_big(self):
+        return self.file_size > 10 * 1024 * 1024
+
+    def named(self, name):
+        """Use another filename for the upload (renames are free, nothing is on disk)"""
+        if name:
+            self.name = name
+        return self
+
+    async def read_parts(self, buffer):
+        """Download from the user session and cut the data into upload parts"""
+        try:
+            pending = bytearray()
+            async with transfer_slots:
+                chunks = self.acc.stream_media(self.msg)
+                try:
+                    async for chunk in chunks:
+                        pending.extend(chunk)
+                        while len(pending) >= PART_SIZE:
+                            await buffer.put(bytes(pending[:PART_SIZE]))
+                            del pending[:PART_SIZE]
+                finally:
+                    # Close the download generator even when cancelled mid-stream
+                    await chunks.aclose()
+            if pending:
+                await buffer.put(bytes(pending))
+        except asyncio.CancelledError:
+            # upload() stopped reading and cancelled us - nobody waits for the end marker
+            raise
+        except Exception:
+            # upload() is still reading, it cancels this put if it stops first
+            await buffer.put(None)
+            raise
+        await buffer.put(None)
+
+    async def upload(self, client, progress=None, progress_args=(), cancelled=None):
+        """Upload every part with the bot, keeping at most STREAM_BUFFER_PARTS in memory"""
+        if self.file_size <= 0:
+            raise ValueError("Unknown file size, can't stream")
+
+        total_parts = int(math.ceil(self.file_size / PART_SIZE))
+        is_big = self.is_big()
+        file_id = self.file_id = client.rnd_id()
+        md5_sum = md5() if not is_big else None
+
+        session = await open_upload_session(client)
+        buffer = asyncio.Queue(STREAM_BUFFER_PARTS)
+        reader = asyncio.create_task(self.read_parts(buffer))
+        requests = asyncio.Queue(1)
+        errors = []
+        uploaded = 0  # Bytes Telegram has confirmed
+
+        async def sender():
+            nonlocal uploaded
+            while True:
+                rpc = await requests.get()
+                if rpc is None:
+                    return
+                if errors:
+                    continue
+                try:
+                    await save_part(session.invoke, rpc)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                uploaded += len(rpc.bytes)
+                if progress:
+                    await progress(uploaded, self.file_size, *progress_args)
+
+        senders = [asyncio.create_task(sender()) for _ in range(4 if is_big else 1)]
+        file_part = 0
+        try:
+            while True:
+                part = await buffer.get()
+                if part is None:
+                    break
+                if errors:
+                    raise errors[0]
+                if cancelled and cancelled():
+                    raise RuntimeError("Transfer cancelled")
+
+                if md5_sum is not None:
+                    md5_sum.update(part)
+                await requests.put(part_request(file_id, file_part, total_parts, is_big, part))
+                file_part += 1
+
+            # Re-raise download errors
+            await reader
+        finally:
+            reader.cancel()
+            # Let the reader finish its cancellation (closes the stream_media generator)
+            await asyncio.gather(reader, return_exceptions=True)
+            for _ in senders:
+                await requests.put(None)
+            await asyncio.gather(*senders, return_exceptions=True)
+            await session.stop()
+
+        if errors:
+            raise errors[0]
+        if uploaded != self.file_size:
+            raise ValueError(f"Streamed {uploaded} of {self.file_size} bytes")
+
+        if is_big:
+            self.input_file = raw.types.InputFileBig(id=file_id, parts=total_parts, name=self.name)
+        else:
+            self.input_file = raw.types.InputFile(
+                id=file_id,
+                parts=total_parts,
+                name=self.name,
+                md5_checksum=md5_sum.hexdigest()
+            )
+
+    async def upload_missing_part(self, client, file_id, file_part):
+        """Upload one part again when Telegram reports it missing (read again from the user session)"""
+        try:
+            if file_id != self.file_id:
+                raise ValueError("unknown file id")
+            chunk_index, skip = divmod(file_part * PART_SIZE, STREAM_CHUNK)
+            data = b""
+            async for chunk in self.acc.stream_media(self.msg, limit=1, offset=chunk_index):
+                data = bytes(chunk[skip:skip + PART_SIZE])
+            if not data:
+                raise ValueError("no data at this offset")
+            total_parts = int(math.ceil(self.file_size / PART_SIZE))
+            await save_part(client.invoke, part_request(file_id, file_part, total_parts, self.is_big(), data))
+        except Exception as e:
+            raise StreamPartMissing(f"Part {file_part} of the streamed upload is missing and could not be sent again: {e}") from e
+
+    def get_input_file(self):
+        """Uploaded file for Bot.save_file, with the final filename"""
+        if self.input_file is None:
+            raise ValueError("Streaming upload is not finished")
+        self.input_file.name = self.name
+        return self.input_file
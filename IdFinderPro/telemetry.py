@@ -0,0 +1,222 @@
+"""
+Transfer telemetry.
+Every finished transfer is recorded with its direction, Telegram DC and file
+size bucket. FloodWait sleeps and retries that pyrogram handles internally are
+picked up from its session log. Everything is kept for the last hour and
+aggregated on demand for /processes and /metrics.
+"""
+import logging
+import re
+import time
+from collections import deque
+
+# Rolling windows shown in /processes (seconds)
+WINDOWS = (300, 3600)
+# Samples kept at most, whatever the window
+MAX_SAMPLES = 20000
+
+MB = 1024 * 1024
+SIZE_BUCKETS = ((10 * MB, "<10MB"), (100 * MB, "10-100MB"), (1024 * MB, "100MB-1GB"), (float('inf'), ">1GB"))
+
+# File RPCs and the direction they belong to
+FILE_METHODS = {
+    "upload.GetFile": "down",
+    "upload.GetCdnFile": "down",
+    "upload.SaveFilePart": "up",
+    "upload.SaveBigFilePart": "up",
+}
+
+
+def size_bucket(size):
+    for limit, name in SIZE_BUCKETS:
+        if size < limit:
+            return name
+    return SIZE_BUCKETS[-1][1]
+
+
+def media_dc_id(msg):
+    """DC the media of a message is stored on (where the user session downloads it from)"""
+    try:
+        from pyrogram.file_id import FileId
+        media = getattr(msg, msg.media.value)
+        return FileId.decode(media.file_id).dc_id
+    except Exception:
+        return None
+
+
+class TransferSample:
+    __slots__ = ('time', 'direction', 'dc_id', 'bucket', 'size', 'seconds', 'ttfb')
+
+    def __init__(self, direction, dc_id, size, seconds, ttfb):
+        self.time = time.time()
+        self.direction = direction
+        self.dc_id = dc_id
+        self.bucket = size_bucket(size)
+        self.size = size
+        self.seconds = seconds
+        self.ttfb = ttfb
+
+
+class TransferTelemetry:
+    """Rolling record of finished transfers, FloodWait sleeps and retries"""
+
+    def __init__(self, span=max(WINDOWS)):
+        self.span = span
+        self.transfers = deque(maxlen=MAX_SAMPLES)  # TransferSample
+        self.flood_waits = deque(maxlen=MAX_SAMPLES)  # (time, direction, session, seconds)
+        self.retries = deque(maxlen=MAX_SAMPLES)  # (time, direction)
+        self.dc_ids = {}  # {client name: home DC}
+
+    def trim(self):
+        cutoff = time.time() - self.span
+        while self.transfers and self.transfers[0].time < cutoff:
+            self.transfers.popleft()
+        while self.flood_waits and self.flood_waits[0][0] < cutoff:
+            self.flood_waits.popleft()
+        while self.retries and self.retries[0][0] < cutoff:
+            self.retries.popleft()
+
+    def record_transfer(self, direction, dc_id, size, seconds, ttfb):
+        if size <= 0 or seconds <= 0:
+            return
+        self.transfers.append(TransferSample(direction, dc_id, size, seconds, ttfb))
+        self.trim()
+
+    def record_flood_wait(self, direction, session, seconds):
+        self.flood_waits.append((time.time(), direction, session, seconds))
+        self.trim()
+
+    def record_retry(self, direction):
+        self.retries.append((time.time(), direction))
+        self.trim()
+
+    async def home_dc(self, client):
+        """DC a client uploads to (its own), remembered per client"""
+        dc_id = self.dc_ids.get(client.name)
+        if dc_id is None:
+            try:
+                dc_id = self.dc_ids[client.name] = await client.storage.dc_id()
+            except Exception:
+                return None
+        return dc_id
+
+    def aggregate(self, window, key):
+        """{key(sample): totals} over the last window seconds"""
+        cutoff = time.time() - window
+        groups = {}
+        for sample in self.transfers:
+            if sample.time < cutoff:
+                continue
+            g = groups.setdefault(key(sample), {'files': 0, 'bytes': 0, 'seconds': 0.0, 'ttfb': 0.0, 'ttfb_count': 0})
+            g['files'] += 1
+            g['bytes'] += sample.size
+            g['seconds'] += sample.seconds
+            if sample.ttfb is not None:
+                g['ttfb'] += sample.ttfb
+                g['ttfb_count'] += 1
+        for g in groups.values():
+            g['speed'] = g['bytes'] / g['seconds'] if g['seconds'] else 0.0
+            g['avg_ttfb'] = g['ttfb'] / g['ttfb_count'] if g['ttfb_count'] else None
+        return groups
+
+    def flood_summary(self, window):
+        """{direction: (count, seconds slept)} over the last window seconds"""
+        cutoff = time.time() - window
+        summary = {}
+        for at, direction, session, seconds in self.flood_waits:
+            if at >= cutoff:
+                count, total = summary.get(direction, (0, 0.0))
+                summary[direction] = (count + 1, total + seconds)
+        return summary
+
+    def retry_summary(self, window):
+        cutoff = time.time() - window
+        summary = {}
+        for at, direction in self.retries:
+            if at >= cutoff:
+                summary[direction] = summary.get(direction, 0) + 1
+        return summary
+
+
+transfer_telemetry = TransferTelemetry()
+
+
+class PyrogramLogWatcher(logging.Handler):
+    """Counts the FloodWait sleeps and retries pyrogram does without raising"""
+
+    FLOOD_WAIT = re.compile(r'^\[(.+?)\] Waiting for ([\d.]+) seconds before continuing \(required by "([^"]+)"\)')
+    RETRY = re.compile(r'Retrying "([^"]+)" due to')
+
+    def __init__(self, bot_name):
+        super().__init__(logging.INFO)
+        self.bot_name = bot_name
+
+    def emit(self, record):
+        try:
+            text = record.getMessage()
+            match = self.FLOOD_WAIT.search(text)
+            if match:
+                client_name, seconds, method = match.groups()
+                session = "bot" if client_name == self.bot_name else "user"
+                transfer_telemetry.record_flood_wait(FILE_METHODS.get(method, "other"), session, float(seconds))
+                return
+            match = self.RETRY.search(text)
+            if match:
+                transfer_telemetry.record_retry(FILE_METHODS.get(match.group(1), "other"))
+        except Exception:
+            pass
+
+
+def install_log_watcher(bot_name):
+    """Attach the watcher to pyrogram's session logger (called from Bot.start)"""
+    logger = logging.getLogger("pyrogram.session.session")
+    if any(isinstance(h, PyrogramLogWatcher) for h in logger.handlers):
+        return
+    logger.addHandler(PyrogramLogWatcher(bot_name))
+    # The first retries are logged at INFO
+    if logger.getEffectiveLevel() > logging.INFO:
+        logger.setLevel(logging.INFO)
+
+
+def format_speed(speed):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if speed < 1024:
+            return f"{speed:.1f}{unit}/s"
+        speed /= 1024
+    return f"{speed:.1f}TB/s"
+
+
+DIRECTION_NAMES = {"down": "📥 Download", "up": "📤 Upload", "stream": "🔀 Stream"}
+
+
+def render_transfer_stats(window=WINDOWS[0]):
+    """Transfer stats of the last window seconds for /processes"""
+    by_direction = transfer_telemetry.aggregate(window, lambda s: s.direction)
+    floods = transfer_telemetry.flood_summary(window)
+    retries = transfer_telemetry.retry_summary(window)
+
+    lines = [f"📈 **Transfers (last {window // 60} min)**"]
+    if not by_direction and not floods and not retries:
+        lines.append("No finished transfers yet.")
+        return "\n".join(lines)
+
+    by_dc = transfer_telemetry.aggregate(window, lambda s: (s.direction, s.dc_id))
+    by_size = transfer_telemetry.aggregate(window, lambda s: (s.direction, s.bucket))
+    for direction in ("down", "up", "stream"):
+        g = by_direction.get(direction)
+        if not g:
+            continue
+        ttfb = f"{g['avg_ttfb']:.1f}s" if g['avg_ttfb'] is not None else "-"
+        lines.append(f"{DIRECTION_NAMES[direction]}: {g['files']} files, {format_speed(g['speed'])}, first byte {ttfb}")
+        dcs = sorted((dc, d) for (dir_, dc), d in by_dc.items() if dir_ == direction and dc is not None)
+        if dcs:
+            lines.append("   " + " | ".join(f"DC{dc} {format_speed(d['speed'])}" for dc, d in dcs))
+        sizes = [(name, by_size.get((direction, name))) for _, name in SIZE_BUCKETS]
+        lines.append("   " + " | ".join(f"{name} {format_speed(d['speed'])}" for name, d in sizes if d))
+
+    for direction in ("down", "up", "other"):
+        count, seconds = floods.get(direction, (0, 0.0))
+        retry_count = retries.get(direction, 0)
+        if count or retry_count:
+            lines.append(f"⚠️ {direction}: {count} FloodWaits ({seconds:.0f}s slept), {retry_count} retries")
+    return "\n".join(lines)
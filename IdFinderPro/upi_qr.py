@@ -0,0 +1,63 @@
+"""
+UPI payment QR codes.
+A QR is rendered off the event loop the first time a payment URL is needed and
+its Telegram file_id is reused for every later click on the same URL.
+
+The URL carries the buyer's user id as the payment note (tn=) so admins can
+match payments to users. The cache is keyed on the full URL, so only repeat
+clicks by the same user for the same amount hit it. Dropping the note would
+share one QR per amount, but payments could no longer be told apart.
+"""
+import io
+import logging
+from database.db import TTLCache
+from IdFinderPro.executors import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# Payment URLs whose uploaded QR file_id is remembered
+QR_CACHE_SIZE = 1000
+QR_CACHE_TTL = 24 * 60 * 60
+
+
+def upi_payment_url(upi_id, receiver_name, amount, user_id):
+    # UPI payment URL format: upi://pay?pa={upi_id}&pn={receiver_name}&am={amount}&tn={userid}
+    return f"upi://pay?pa={upi_id}&pn={receiver_name}&am={amount}&tn={user_id}"
+
+
+def render_qr_png(data):
+    """Build the QR image as PNG bytes (CPU bound, runs in a worker thread)"""
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    qr_img = qr.make_image(fill_color="black", back_color="white")
+    qr_bytes = io.BytesIO()
+    qr_img.save(qr_bytes, format='PNG')
+    return qr_bytes.getvalue()
+
+
+# {upi_url: file_id of the bot's first upload}
+qr_cache = TTLCache(QR_CACHE_TTL, max_size=QR_CACHE_SIZE)
+
+
+async def send_upi_qr(client, chat_id, upi_url, **kwargs):
+    """Send the QR of a payment URL, rendering and uploading it only the first time"""
+    found, file_id = qr_cache.get(upi_url)
+    if found:
+        try:
+            return await client.send_photo(chat_id, file_id, **kwargs)
+        except Exception as e:
+            # file_id no longer usable - render it again
+            logger.warning("Cached QR could not be sent, rendering it again: %s", e)
+            qr_cache.pop(upi_url)
+
+    png = await run_in_thread(render_qr_png, upi_url)
+    photo = io.BytesIO(png)
+    photo.name = "upi_qr.png"
+    sent = await client.send_photo(chat_id, photo, **kwargs)
+    if sent and sent.photo:
+        qr_cache.set(upi_url, sent.photo.file_id)
+    return sent
@@ -1,130 +1,148 @@
-from flask import Flask, request, jsonify
+from aiohttp import web
 import os
 import hashlib
 import hmac
-import asyncio
+import json
 
-app = Flask(__name__)
+routes = web.RouteTableDef()
 
-@app.route('/')
-def hello_world():
-    return 'Bot is running! Restricted Content Download Bot by @idfinderpro'
+@routes.get('/')
+async def hello_world(request):
+    return web.Response(text='Bot is running! Restricted Content Download Bot by @idfinderpro')
 
-@app.route('/health')
-def health_check():
-    return {'status': 'healthy', 'service': 'Restricted Content Download Bot'}, 200
+@routes.get('/health')
+async def health_check(request):
+    return web.json_response({'status': 'healthy', 'service': 'Restricted Content Download Bot'})
+
+
+def webhook_signature(token, raw_body):
+    """HMAC-SHA256 of the body keyed with SHA256(token), as sent by Crypto Pay"""
+    secret = hashlib.sha256(token.encode()).digest()
+    return hmac.new(secret, raw_body.encode(), hashlib.sha256).hexdigest()
+
+
+# Prometheus metrics endpoint (needs METRICS_TOKEN, or METRICS_ALLOW_LOCALHOST for same-host scrapers)
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+@routes.get('/metrics')
+async def metrics_endpoint(request):
+    from config import METRICS_TOKEN, METRICS_ALLOW_LOCALHOST
+    from IdFinderPro.metrics import render_prometheus
+
+    if METRICS_TOKEN:
+        token = request.query.get('token') or request.headers.get('Authorization', '').replace('Bearer ', '', 1)
+        if not hmac.compare_digest(token, METRICS_TOKEN):
+            return web.Response(status=401, text='Unauthorized')
+    elif not (METRICS_ALLOW_LOCALHOST and request.remote in LOCAL_ADDRESSES):
+        # No token configured - off, unless localhost access was explicitly enabled
+        return web.Response(status=404, text='Not Found')
+    return web.Response(text=render_prometheus(), content_type='text/plain', charset='utf-8', headers={'X-Content-Type-Options': 'nosniff'})
 
 
 # Crypto Pay webhook endpoint
-@app.route('/webhook/cryptopay', methods=['POST'])
-def crypto_pay_webhook():
+@routes.post('/webhook/cryptopay')
+async def crypto_pay_webhook(request):
     """
     Receive payment confirmations from Crypto Pay API.
     This webhook is triggered when a user completes a crypto payment.
     """
     try:
         from config import CRYPTO_PAY_API_TOKEN
-        
+
         # Get the signature from headers
         signature = request.headers.get('crypto-pay-api-signature', '')
-        
+
         # Get raw body for signature verification
-        raw_body = request.get_data(as_text=True)
-        
-        # Verify signature
+        raw_body = await request.text()
+
+        # Verify signature (hashing runs in the thread pool, off the event loop)
         if CRYPTO_PAY_API_TOKEN:
-            secret = hashlib.sha256(CRYPTO_PAY_API_TOKEN.encode()).digest()
-            expected_signature = hmac.new(secret, raw_body.encode(), hashlib.sha256).hexdigest()
-            
+            from IdFinderPro.executors import run_in_thread
+            expected_signature = await run_in_thread(webhook_signature, CRYPTO_PAY_API_TOKEN, raw_body)
+
             if not hmac.compare_digest(signature, expected_signature):
                 print(f"[WEBHOOK] Invalid signature! Expected: {expected_signature}, Got: {signature}")
-                return jsonify({'error': 'Invalid signature'}), 401
-        
+                return web.json_response({'error': 'Invalid signature'}, status=401)
+
         # Parse the webhook data
-        data = request.get_json()
-        
+        try:
+            data = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            data = None
+
         if not data:
-            return jsonify({'error': 'No data'}), 400
-        
+            return web.json_response({'error': 'No data'}, status=400)
+
         update_type = data.get('update_type')
         payload = data.get('payload', {})
-        
+
         print(f"[WEBHOOK] Received: {update_type}")
-        
+
         if update_type == 'invoice_paid':
             # Invoice was paid - activate premium
             invoice_id = payload.get('invoice_id')
             invoice_payload = payload.get('payload', '')  # Contains "user_id:plan"
             paid_amount = payload.get('paid_amount') or payload.get('amount')
             paid_asset = payload.get('paid_asset', 'crypto')
-            
+
             print(f"[WEBHOOK] Invoice {invoice_id} paid! Payload: {invoice_payload}")
-            
+
             # Parse user_id and plan from payload
             if ':' in invoice_payload:
                 user_id, plan = invoice_payload.split(':', 1)
                 user_id = int(user_id)
-                
-                # Run async function to activate premium
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                try:
-                    loop.run_until_complete(activate_premium_from_webhook(
-                        invoice_id, user_id, plan, paid_amount, paid_asset
-                    ))
-                finally:
-                    loop.close()
-                
-                return jsonify({'ok': True, 'message': 'Premium activated'}), 200
+
+                # Same event loop and database client as the bot
+                await activate_premium_from_webhook(
+                    invoice_id, user_id, plan, paid_amount, paid_asset
+                )
+
+                return web.json_response({'ok': True, 'message': 'Premium activated'})
             else:
                 print(f"[WEBHOOK] Invalid payload format: {invoice_payload}")
-                return jsonify({'error': 'Invalid payload'}), 400
-        
-        return jsonify({'ok': True}), 200
-        
+                return web.json_response({'error': 'Invalid payload'}, status=400)
+
+        return web.json_response({'ok': True})
+
     except Exception as e:
         print(f"[WEBHOOK] Error: {e}")
         import traceback
         traceback.print_exc()
-        return jsonify({'error': str(e)}), 500
+        return web.json_response({'error': str(e)}, status=500)
 
 
 async def activate_premium_from_webhook(invoice_id, user_id, plan, paid_amount, paid_asset):
     """Activate premium subscription from webhook callback"""
-    import time
-    from database.db import db
-    
-    # Plan durations
-    plan_durations = {"1day": 1, "7day": 7, "30day": 30}
-    days = plan_durations.get(plan, 1)
-    
-    # Calculate expiry
-    duration = days * 24 * 60 * 60  # Convert to seconds
-    
-    # Check if user already has premium
-    user = await db.col.find_one({'id': user_id})
-    is_premium = await db.is_premium(user_id)
-    
-    if is_premium and user and user.get('premium_expiry'):
-        current_expiry = user.get('premium_expiry')
-        if current_expiry > time.time():
-            expiry_time = current_expiry + duration
-        else:
-            expiry_time = time.time() + duration
-    else:
-        expiry_time = time.time() + duration
-    
-    # Set premium
-    await db.set_premium(user_id, True, expiry_time)
-    
-    # Update invoice status
-    await db.update_crypto_invoice_status(invoice_id, "paid", time.time())
-    
+    from IdFinderPro.cryptopay import activate_crypto_premium
+
+    activation = await activate_crypto_premium(invoice_id, user_id, plan)
+    if activation is None:
+        print(f"[WEBHOOK] Invoice {invoice_id} was already processed")
+        return
+
+    expiry_time, days = activation
     print(f"[WEBHOOK] Premium activated for user {user_id} - {days} days until {expiry_time}")
 
 
+def create_app():
+    app = web.Application()
+    app.add_routes(routes)
+    return app
+
+
+async def start_web_server(port=None):
+    """Serve the health check and webhooks on the running event loop (called from Bot.start)"""
+    if port is None:
+        port = int(os.environ.get('PORT', 8080))
+    runner = web.AppRunner(create_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '0.0.0.0', port)
+    await site.start()
+    print(f"[WEB] Listening on port {port}")
+    return runner
+
+
 if __name__ == "__main__":
+    # Standalone web server (the bot normally runs it in its own process)
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port, debug=False)
-
+    web.run_app(create_app(), host='0.0.0.0', port=port)
@@ -40,11 +40,45 @@ class Bot(Client):
       
     async def start(self):
             
+        # Health check + payment webhooks share this event loop and database client
+        from config import WEB_SERVER
+        self.web_runner = None
+        if WEB_SERVER:
+            from app import start_web_server
+            self.web_runner = await start_web_server()
+        
         await super().start()
         
+        # Shared thread/process pools and the event loop lag monitor
+        from IdFinderPro.executors import start_executors
+        start_executors()
+        
+        # Count the FloodWait sleeps and retries pyrogram handles without raising
+        from IdFinderPro.telemetry import install_log_watcher
+        install_log_watcher(self.name)
+        
         # Initialize global settings with defaults if not exist
         from database.db import db
+        await db.ensure_indexes()
         await db.init_global_settings()
+        db.start_settings_watcher()
+        
+        # Open the keep-alive connection pool for Crypto Pay calls
+        from IdFinderPro.cryptopay import get_http_session, invoice_reconciler
+        get_http_session()
+        # Catch payments whose webhook never arrived
+        invoice_reconciler.start(self)
+        
+        # Start closing idle pooled user sessions
+        from IdFinderPro.session_pool import session_pool
+        session_pool.start()
+        
+        # Continue batches that were interrupted by the last shutdown
+        from IdFinderPro.start import resume_batches
+        try:
+            await resume_batches(self)
+        except Exception as e:
+            print(f'⚠️  Warning: Could not resume stored batches: {e}')
         
         # Set bot commands menu
         await self.set_bot_commands([
@@ -75,9 +109,41 @@ class Bot(Client):
         print('Channel: @Save_Restricted_Content17_bot')
         print('='*50)
 
+    def add_handler(self, handler, group=0):
+        # Record latency, errors and DB usage of every update handler (shown by /metrics)
+        from IdFinderPro.metrics import instrument
+        import inspect
+        callback = getattr(handler, 'callback', None)
+        if inspect.iscoroutinefunction(callback) and not getattr(callback, 'instrumented', False):
+            handler.callback = instrument(callback)
+        return super().add_handler(handler, group)
+
+    async def save_file(self, path, file_id=None, file_part=0, progress=None, progress_args=()):
+        # Files streamed from a user session are already uploaded part by part
+        from IdFinderPro.streaming import StreamingUpload
+        if isinstance(path, StreamingUpload):
+            if file_id is not None:
+                # Telegram asked for a missing part again - it is read again from the user session
+                # (raises StreamPartMissing if that fails, reported by the send code like any upload error)
+                await path.upload_missing_part(self, file_id, file_part)
+            return path.get_input_file()
+        return await super().save_file(path, file_id, file_part, progress, progress_args)
+
     async def stop(self, *args):
 
+        # Running batches stop first, while their sessions are still connected
+        from IdFinderPro.jobs import scheduler
+        await scheduler.stop()
+        from IdFinderPro.session_pool import session_pool
+        await session_pool.close()
+        from IdFinderPro.cryptopay import close_http_session, invoice_reconciler
+        invoice_reconciler.stop()
+        await close_http_session()
+        if getattr(self, 'web_runner', None):
+            await self.web_runner.cleanup()
         await super().stop()
+        from IdFinderPro.executors import shutdown_executors
+        shutdown_executors()
         print('Bot Stopped Bye')
 
 if __name__ == "__main__":
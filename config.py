@@ -32,3 +32,56 @@ ERROR_MESSAGE = bool(os.environ.get('ERROR_MESSAGE', True))
 CRYPTO_PAY_API_TOKEN = os.environ.get("CRYPTO_PAY_API_TOKEN", "")  # Your Crypto Pay API token
 CRYPTO_PAY_TESTNET = os.environ.get("CRYPTO_PAY_TESTNET", "False").lower() == "true"  # Set to True for testing with @CryptoTestnetBot
 
+
+# User session pool - how many logged-in user clients stay connected and how long an idle one is kept (seconds)
+SESSION_POOL_SIZE = int(os.environ.get("SESSION_POOL_SIZE", "50"))
+SESSION_IDLE_TIMEOUT = int(os.environ.get("SESSION_IDLE_TIMEOUT", "600"))
+
+# Seconds a cached user document is served before it is read from MongoDB again
+# (also how stale it can be - writes made by another process are not invalidated)
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "300"))
+
+# Batch downloads - parallel files per user batch and total parallel downloads across all users
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "3"))
+MAX_CONCURRENT_TRANSFERS = int(os.environ.get("MAX_CONCURRENT_TRANSFERS", "20"))
+
+# Stream large files from the user session straight into the bot upload instead of saving them to disk first
+STREAM_TRANSFERS = os.environ.get("STREAM_TRANSFERS", "True").lower() == "true"
+STREAM_BUFFER_PARTS = int(os.environ.get("STREAM_BUFFER_PARTS", "8"))  # 512 KB parts buffered per transfer
+
+# Job queue - jobs (links) running at once for all users, and jobs one user may have waiting
+MAX_RUNNING_JOBS = int(os.environ.get("MAX_RUNNING_JOBS", "5"))
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "3"))
+# Slots premium jobs leave free while free users are waiting, so a free link never waits behind premium forever
+FREE_RESERVED_JOBS = int(os.environ.get("FREE_RESERVED_JOBS", "1"))
+
+# Resumable batches - files between two saved checkpoints of a running batch
+CHECKPOINT_EVERY = int(os.environ.get("CHECKPOINT_EVERY", "25"))
+
+# Force subscribe membership cache (seconds) - members are re-checked rarely, non-members quickly
+FORCE_SUB_MEMBER_TTL = int(os.environ.get("FORCE_SUB_MEMBER_TTL", "600"))
+FORCE_SUB_NONMEMBER_TTL = int(os.environ.get("FORCE_SUB_NONMEMBER_TTL", "30"))
+
+# Seconds between checks for global settings changed by another bot process
+SETTINGS_REFRESH_INTERVAL = int(os.environ.get("SETTINGS_REFRESH_INTERVAL", "30"))
+
+# Broadcast - messages sent per second across all senders (Telegram allows about 30/s in bulk) and parallel senders
+BROADCAST_RATE = int(os.environ.get("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.environ.get("BROADCAST_WORKERS", "10"))
+
+# Health check and Crypto Pay webhook server, runs inside the bot process (set to False if another process serves it)
+WEB_SERVER = os.environ.get("WEB_SERVER", "True").lower() == "true"
+
+# Pending crypto invoice checks (seconds) - fastest interval while invoices wait, slowest when there are none
+INVOICE_POLL_MIN = int(os.environ.get("INVOICE_POLL_MIN", "30"))
+INVOICE_POLL_MAX = int(os.environ.get("INVOICE_POLL_MAX", "600"))
+
+# Executors - threads for blocking calls, processes for CPU heavy work (0 = use the threads), and the event loop lag (seconds) that gets reported
+THREAD_POOL_SIZE = int(os.environ.get("THREAD_POOL_SIZE", "8"))
+PROCESS_POOL_SIZE = int(os.environ.get("PROCESS_POOL_SIZE", "0"))
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.25"))
+
+# Token required by the /metrics web endpoint (?token= or Bearer header), without one the endpoint is off
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# Serve /metrics without a token to 127.0.0.1/::1 (only safe with no reverse proxy on the same host)
+METRICS_ALLOW_LOCALHOST = os.environ.get("METRICS_ALLOW_LOCALHOST", "False").lower() == "true"
@@ -1,12 +1,99 @@
+import copy
+import time
+import asyncio
 import motor.motor_asyncio
-from config import DB_NAME, DB_URI
+from pymongo import ReturnDocument
+from config import DB_NAME, DB_URI, USER_CACHE_TTL, FORCE_SUB_MEMBER_TTL, SETTINGS_REFRESH_INTERVAL
+from IdFinderPro.metrics import MongoCommandListener
+
+
+class TTLCache:
+    """Small in-memory cache with per-entry expiry and hit/miss counters"""
+
+    def __init__(self, ttl, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = {}  # {key: (expires_at, value)}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (found, value) for a fresh entry"""
+        entry = self.entries.get(key)
+        if entry and entry[0] > time.time():
+            self.hits += 1
+            return True, entry[1]
+        self.misses += 1
+        return False, None
+
+    def set(self, key, value, ttl=None):
+        if len(self.entries) >= self.max_size:
+            self.purge()
+        self.entries[key] = (time.time() + (ttl or self.ttl), value)
+
+    def pop(self, key):
+        self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def purge(self):
+        """Drop expired entries, then the oldest ones if still full"""
+        now = time.time()
+        for key in [k for k, (expires, _) in self.entries.items() if expires <= now]:
+            del self.entries[key]
+        while len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits * 100 / total, 1) if total else 0.0,
+            'size': len(self.entries)
+        }
+
 
 class Database:
     
     def __init__(self, uri, database_name):
-        self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
+        # The listener times every command for /metrics
+        self._client = motor.motor_asyncio.AsyncIOMotorClient(uri, event_listeners=[MongoCommandListener()])
         self.db = self._client[database_name]
         self.col = self.db.users
+        # Read-through caches, kept in sync by every write below
+        self.user_cache = TTLCache(USER_CACHE_TTL)  # {user_id: user document (without session) or None}
+        self.session_cache = TTLCache(USER_CACHE_TTL)  # {user_id: session string or None}
+        self.ban_cache = TTLCache(USER_CACHE_TTL)  # {user_id: ban document or None}
+        # Snapshot of the global_settings collection, reloaded when its version changes
+        self.global_settings = {}  # {key: value}
+        self.settings_version = None
+        self.settings_loaded = False
+        self.settings_task = None
+        self.channels_cache = TTLCache(300)  # Force subscribe channel list
+        self.membership_cache = TTLCache(FORCE_SUB_MEMBER_TTL, max_size=50000)  # {(user_id, channel_id): is_member}
+
+    async def ensure_indexes(self):
+        """Create the indexes every lookup relies on (safe to run on every start)"""
+        indexes = [
+            (self.col, [('id', 1)], {'name': 'id_unique', 'unique': True}),
+            (self.col, [('is_premium', 1)], {'name': 'premium_users', 'partialFilterExpression': {'is_premium': True}}),
+            (self.db.banned_users, [('user_id', 1)], {'name': 'user_id_unique', 'unique': True}),
+            (self.db.crypto_payments, [('invoice_id', 1)], {'name': 'invoice_id_unique', 'unique': True}),
+            (self.db.crypto_payments, [('user_id', 1), ('status', 1)], {'name': 'user_status'}),
+            (self.db.crypto_payments, [('status', 1), ('created_at', 1)], {'name': 'status_created'}),
+            (self.db.jobs, [('status', 1), ('created_at', 1)], {'name': 'status_created'}),
+            (self.db.broadcast_failures, [('broadcast_id', 1), ('reason', 1), ('user_id', 1)], {'name': 'broadcast_reason_user'}),
+        ]
+        for col, keys, options in indexes:
+            try:
+                # No-op if the same index already exists
+                name = await col.create_index(keys, **options)
+                print(f"[DB] Index ready: {col.name}.{name}")
+            except Exception as e:
+                # e.g. duplicate values block a unique index - the bot still works without it
+                print(f"[DB] Could not create index {col.name}.{options['name']}: {e}")
 
     def new_user(self, id, name):
         return dict(
@@ -37,46 +124,124 @@ class Database:
             filter_voice = True,
             filter_animation = True,
             filter_sticker = True,
-            filter_poll = True
+            filter_poll = True,
+            skip_filtered = False  # If True, filtered types are not downloaded or sent at all
         )
     
+    # User document cache
+    # The session string is the biggest field and only get_session needs it,
+    # so it is never loaded into (or cached with) the settings document
+    USER_PROJECTION = {'_id': 0, 'session': 0}
+    
+    async def get_user(self, id):
+        """
+        Get a user document (without session), served from cache while fresh.
+        Returns a copy, so callers can change it without touching the cache.
+        Writes by another process are only seen after USER_CACHE_TTL seconds.
+        """
+        user_id = int(id)
+        found, user = self.user_cache.get(user_id)
+        if not found:
+            user = await self.col.find_one({'id': user_id}, self.USER_PROJECTION)
+            self.user_cache.set(user_id, user)
+        return copy.deepcopy(user)
+    
+    def _cache_user_fields(self, user_id, fields):
+        """Write-through: apply updated fields to the cached user document"""
+        fields = dict(fields)
+        if 'session' in fields:
+            self.session_cache.set(int(user_id), fields.pop('session'))
+        entry = self.user_cache.entries.get(int(user_id))
+        if entry and entry[1] is not None:
+            entry[1].update(fields)
+    
+    async def _set_user_fields(self, user_id, fields):
+        await self.col.update_one({'id': int(user_id)}, {'$set': fields})
+        self._cache_user_fields(user_id, fields)
+    
+    def invalidate_user(self, user_id):
+        """Drop a user from the caches (next read goes to MongoDB)"""
+        self.user_cache.pop(int(user_id))
+        self.session_cache.pop(int(user_id))
+        self.ban_cache.pop(int(user_id))
+    
+    def cache_stats(self):
+        """Hit/miss counters of the read-through caches"""
+        return {
+            'users': self.user_cache.stats(),
+            'sessions': self.session_cache.stats(),
+            'bans': self.ban_cache.stats(),
+            'membership': self.membership_cache.stats()
+        }
+    
     async def add_user(self, id, name):
+        """Insert the user unless they exist (upsert - two /start at once can't hit the unique index)"""
         user = self.new_user(id, name)
-        await self.col.insert_one(user)
+        result = await self.col.update_one({'id': user['id']}, {'$setOnInsert': user}, upsert=True)
+        if result.upserted_id is None:
+            # Another request created the user first - read theirs on the next get_user
+            self.user_cache.pop(int(id))
+            self.session_cache.pop(int(id))
+            return
+        # Cache the same shape get_user would return
+        self.user_cache.set(int(id), {k: v for k, v in user.items() if k not in self.USER_PROJECTION})
+        self.session_cache.set(int(id), None)
     
     async def is_user_exist(self, id):
-        user = await self.col.find_one({'id':int(id)})
-        return bool(user)
+        found, user = self.user_cache.get(int(id))
+        if found:
+            return user is not None
+        # Index-only existence check, no document is sent back
+        return await self.col.count_documents({'id': int(id)}, limit=1) > 0
     
     async def total_users_count(self):
         count = await self.col.count_documents({})
         return count
 
     async def get_all_users(self):
-        return self.col.find({})
+        return self.col.find({}, {'_id': 0, 'id': 1})
+    
+    async def get_user_ids(self, after=None, limit=200):
+        """Next page of user ids in id order, starting after the given id"""
+        query = {'id': {'$gt': after}} if after is not None else {}
+        cursor = self.col.find(query, {'_id': 0, 'id': 1}).sort('id', 1).limit(limit)
+        return [user['id'] async for user in cursor if 'id' in user]
 
     async def delete_user(self, user_id):
         await self.col.delete_many({'id': int(user_id)})
+        self.invalidate_user(user_id)
+    
+    async def delete_users(self, user_ids):
+        """Delete many users in one round trip, returns how many were removed"""
+        user_ids = [int(uid) for uid in user_ids]
+        if not user_ids:
+            return 0
+        result = await self.col.delete_many({'id': {'$in': user_ids}})
+        for uid in user_ids:
+            self.invalidate_user(uid)
+        return result.deleted_count
 
     async def set_session(self, id, session):
-        await self.col.update_one({'id': int(id)}, {'$set': {'session': session}})
+        await self._set_user_fields(id, {'session': session})
 
     async def get_session(self, id):
-        user = await self.col.find_one({'id': int(id)})
-        return user.get('session') if user else None
+        user_id = int(id)
+        found, session = self.session_cache.get(user_id)
+        if found:
+            return session
+        user = await self.col.find_one({'id': user_id}, {'_id': 0, 'session': 1})
+        session = user.get('session') if user else None
+        self.session_cache.set(user_id, session)
+        return session
     
     # Premium membership methods
     async def set_premium(self, user_id, is_premium, expiry_timestamp=None):
         """Set premium status for user"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'is_premium': is_premium, 'premium_expiry': expiry_timestamp}}
-        )
+        await self._set_user_fields(user_id, {'is_premium': is_premium, 'premium_expiry': expiry_timestamp})
     
     async def is_premium(self, user_id):
         """Check if user is premium"""
-        import time
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return False
         
@@ -92,8 +257,7 @@ class Database:
     
     async def get_all_premium_users(self):
         """Get all premium users"""
-        import time
-        cursor = self.col.find({'is_premium': True})
+        cursor = self.col.find({'is_premium': True}, {'_id': 0, 'id': 1, 'name': 1, 'premium_expiry': 1})
         premium_users = []
         async for user in cursor:
             if user.get('premium_expiry') is None or user.get('premium_expiry') > time.time():
@@ -101,40 +265,87 @@ class Database:
         return premium_users
     
     # Download tracking for rate limiting
-    async def check_and_update_downloads(self, user_id):
-        """Check and update download count for rate limiting"""
-        from datetime import datetime, date
+    async def get_download_limits(self):
+        """Daily download limits as (free, premium) from global settings"""
+        return (
+            int(await self.get_global_setting('free_daily_limit', 2)),
+            int(await self.get_global_setting('premium_daily_limit', 99999))
+        )
+    
+    async def reserve_downloads(self, user_id, count=1):
+        """
+        Atomically reserve up to `count` downloads from today's quota.
+        Returns how many were granted (0 if the limit is reached).
+        """
+        from datetime import date
         
-        user = await self.col.find_one({'id': int(user_id)})
-        if not user:
-            return False
+        if count < 1:
+            return 0
         
         today = str(date.today())
-        last_date = user.get('last_download_date')
-        downloads_today = user.get('downloads_today', 0)
+        now = time.time()
+        free_limit, premium_limit = await self.get_download_limits()
         
-        # Reset if new day
-        if last_date != today:
-            downloads_today = 0
+        # Count used today (0 after a date rollover) and the user's limit, evaluated by MongoDB
+        used = {'$cond': [{'$eq': ['$last_download_date', today]}, {'$ifNull': ['$downloads_today', 0]}, 0]}
+        limit = {'$cond': [
+            {'$and': [
+                {'$eq': ['$is_premium', True]},
+                {'$or': [
+                    {'$eq': [{'$ifNull': ['$premium_expiry', None]}, None]},
+                    {'$gt': ['$premium_expiry', now]}
+                ]}
+            ]},
+            premium_limit,
+            free_limit
+        ]}
         
-        # Check limits
-        is_premium_user = await self.is_premium(user_id)
-        limit = 99999 if is_premium_user else 2  # Premium: Unlimited, Free: 10/day
+        # Only matches while quota is left, so concurrent requests can't both pass the limit
+        before = await self.col.find_one_and_update(
+            {'id': int(user_id), '$expr': {'$lt': [used, limit]}},
+            [{'$set': {
+                'downloads_today': {'$min': [{'$add': [used, count]}, limit]},
+                'last_download_date': today
+            }}],
+            projection={'downloads_today': 1, 'last_download_date': 1, 'is_premium': 1, 'premium_expiry': 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return 0  # Limit exceeded or unknown user
         
-        if downloads_today >= limit:
-            return False  # Limit exceeded
+        used_before = before.get('downloads_today', 0) if before.get('last_download_date') == today else 0
+        expiry = before.get('premium_expiry')
+        is_premium_user = before.get('is_premium') is True and (expiry is None or expiry > now)
+        granted = min(count, (premium_limit if is_premium_user else free_limit) - used_before)
         
-        # Update count
+        self._cache_user_fields(user_id, {'downloads_today': used_before + granted, 'last_download_date': today})
+        return granted
+    
+    async def release_downloads(self, user_id, count):
+        """Give back reserved downloads that were not used (cancel, batch ended early)"""
+        from datetime import date
+        
+        if count < 1:
+            return
+        
+        today = str(date.today())
         await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'downloads_today': downloads_today + 1, 'last_download_date': today}}
+            {'id': int(user_id), 'last_download_date': today},
+            [{'$set': {'downloads_today': {'$max': [{'$subtract': ['$downloads_today', count]}, 0]}}}]
         )
-        return True
+        
+        entry = self.user_cache.entries.get(int(user_id))
+        if entry and entry[1] is not None and entry[1].get('last_download_date') == today:
+            entry[1]['downloads_today'] = max(entry[1].get('downloads_today', 0) - count, 0)
+    
+    async def check_and_update_downloads(self, user_id):
+        """Check and update download count for rate limiting"""
+        return await self.reserve_downloads(user_id, 1) == 1
     
     async def get_download_count(self, user_id):
         """Get today's download count"""
         from datetime import date
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return 0
         
@@ -146,88 +357,71 @@ class Database:
     # Forward settings methods
     async def set_forward_destination(self, user_id, channel_id):
         """Set forward destination channel"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'forward_destination': channel_id}}
-        )
+        await self._set_user_fields(user_id, {'forward_destination': channel_id})
     
     async def get_forward_destination(self, user_id):
         """Get forward destination channel"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('forward_destination') if user else None
     
     async def set_custom_caption(self, user_id, caption):
         """Set custom caption template"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'custom_caption': caption}}
-        )
+        await self._set_user_fields(user_id, {'custom_caption': caption})
     
     async def get_custom_caption(self, user_id):
         """Get custom caption template"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('custom_caption') if user else None
     
     async def set_custom_thumbnail(self, user_id, file_id):
         """Set custom thumbnail file ID"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'custom_thumbnail': file_id}}
-        )
+        await self._set_user_fields(user_id, {'custom_thumbnail': file_id})
     
     async def get_custom_thumbnail(self, user_id):
         """Get custom thumbnail file ID"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('custom_thumbnail') if user else None
     
     async def set_filename_suffix(self, user_id, suffix):
         """Set filename suffix"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'filename_suffix': suffix}}
-        )
+        await self._set_user_fields(user_id, {'filename_suffix': suffix})
     
     async def get_filename_suffix(self, user_id):
         """Get filename suffix"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('filename_suffix') if user else None
     
     async def increment_index_count(self, user_id):
         """Get current index count and increment for next use"""
-        # Get current value first
-        user = await self.col.find_one({'id': int(user_id)})
-        current_count = user.get('index_count', 0) if user else 0
-        
-        # Increment for next time
-        await self.col.update_one(
+        # Increment and read the previous value in one round trip
+        user = await self.col.find_one_and_update(
             {'id': int(user_id)},
-            {'$inc': {'index_count': 1}}
+            {'$inc': {'index_count': 1}},
+            projection={'index_count': 1},
+            return_document=ReturnDocument.BEFORE
         )
+        current_count = user.get('index_count', 0) if user else 0
+        if user:
+            self._cache_user_fields(user_id, {'index_count': current_count + 1})
         
         return current_count
     
     async def reset_index_count(self, user_id):
         """Reset index count to 0"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'index_count': 0}}
-        )
+        await self._set_user_fields(user_id, {'index_count': 0})
     
     async def set_index_count(self, user_id, count):
         """Set index count to specific number"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'index_count': int(count)}}
-        )
+        await self._set_user_fields(user_id, {'index_count': int(count)})
     
     async def get_index_count(self, user_id):
         """Get current index count"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('index_count', 0) if user else 0
     
     async def get_user_settings(self, user_id):
         """Get all user settings"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return None
         return {
@@ -248,51 +442,56 @@ class Database:
             'filter_voice': user.get('filter_voice', True),
             'filter_animation': user.get('filter_animation', True),
             'filter_sticker': user.get('filter_sticker', True),
-            'filter_poll': user.get('filter_poll', True)
+            'filter_poll': user.get('filter_poll', True),
+            'skip_filtered': user.get('skip_filtered', False)
         }
     
     # Filter methods
     async def toggle_filter(self, user_id, filter_name):
         """Toggle a file type filter on/off"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return False
         
         current_value = user.get(filter_name, True)
         new_value = not current_value
         
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {filter_name: new_value}}
-        )
+        await self._set_user_fields(user_id, {filter_name: new_value})
         return new_value
     
     async def get_filter_status(self, user_id, filter_name):
         """Get status of a specific filter"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return True  # Default enabled
         return user.get(filter_name, True)
     
+    async def toggle_skip_filtered(self, user_id):
+        """Toggle skipping filtered file types before download"""
+        user = await self.get_user(user_id)
+        if not user:
+            return False
+        
+        new_value = not user.get('skip_filtered', False)
+        await self._set_user_fields(user_id, {'skip_filtered': new_value})
+        return new_value
+    
     # Send as document toggle methods
     async def toggle_send_as_document(self, user_id):
         """Toggle send as document setting"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return False
         
         current_value = user.get('send_as_document', False)
         new_value = not current_value
         
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'send_as_document': new_value}}
-        )
+        await self._set_user_fields(user_id, {'send_as_document': new_value})
         return new_value
     
     async def get_send_as_document(self, user_id):
         """Get send as document status"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         if not user:
             return False  # Default to media
         return user.get('send_as_document', False)
@@ -300,34 +499,64 @@ class Database:
     # Replace words methods
     async def set_replace_caption_words(self, user_id, pattern):
         """Set caption word replacement pattern"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'replace_caption_words': pattern}}
-        )
+        await self._set_user_fields(user_id, {'replace_caption_words': pattern})
     
     async def get_replace_caption_words(self, user_id):
         """Get caption word replacement pattern"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('replace_caption_words') if user else None
     
     async def set_replace_filename_words(self, user_id, pattern):
         """Set filename word replacement pattern"""
-        await self.col.update_one(
-            {'id': int(user_id)},
-            {'$set': {'replace_filename_words': pattern}}
-        )
+        await self._set_user_fields(user_id, {'replace_filename_words': pattern})
     
     async def get_replace_filename_words(self, user_id):
         """Get filename word replacement pattern"""
-        user = await self.col.find_one({'id': int(user_id)})
+        user = await self.get_user(user_id)
         return user.get('replace_filename_words') if user else None
     
     # Global settings methods
+    # Every write bumps a version number, other bot processes sharing the database
+    # see the new version on their next check and reload the snapshot
+    async def get_settings_version(self):
+        version_doc = await self.db.settings_version.find_one({'_id': 'global'}, {'version': 1})
+        return version_doc.get('version', 0) if version_doc else 0
+    
+    async def load_global_settings(self):
+        """Load every global setting into memory"""
+        version = await self.get_settings_version()
+        settings_col = self.db.global_settings
+        settings = {}
+        async for setting in settings_col.find({}, {'_id': 0, 'key': 1, 'value': 1}):
+            settings[setting['key']] = setting['value']
+        self.global_settings = settings
+        self.settings_version = version
+        self.settings_loaded = True
+    
+    async def refresh_global_settings(self):
+        """Reload the snapshot if another process changed a setting"""
+        if await self.get_settings_version() != self.settings_version:
+            await self.load_global_settings()
+            print(f"[SETTINGS] Global settings reloaded (version {self.settings_version})")
+    
+    async def settings_watcher(self):
+        while True:
+            await asyncio.sleep(SETTINGS_REFRESH_INTERVAL)
+            try:
+                await self.refresh_global_settings()
+            except Exception as e:
+                print(f"[SETTINGS] Refresh error: {e}")
+    
+    def start_settings_watcher(self):
+        """Start the periodic version check (called from Bot.start)"""
+        if self.settings_task is None:
+            self.settings_task = asyncio.create_task(self.settings_watcher())
+    
     async def get_global_setting(self, key, default=None):
         """Get a global setting value"""
-        settings_col = self.db.global_settings
-        setting = await settings_col.find_one({'key': key})
-        return setting.get('value') if setting else default
+        if not self.settings_loaded:
+            await self.load_global_settings()
+        return self.global_settings.get(key, default)
     
     async def set_global_setting(self, key, value):
         """Set a global setting value"""
@@ -337,15 +566,22 @@ class Database:
             {'$set': {'key': key, 'value': value}},
             upsert=True
         )
+        version_doc = await self.db.settings_version.find_one_and_update(
+            {'_id': 'global'},
+            {'$inc': {'version': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.global_settings[key] = value
+        # Only skip the reload if nobody else wrote in between
+        if self.settings_version is not None and version_doc['version'] == self.settings_version + 1:
+            self.settings_version = version_doc['version']
     
     async def get_all_global_settings(self):
         """Get all global settings as a dictionary"""
-        settings_col = self.db.global_settings
-        cursor = settings_col.find({})
-        settings = {}
-        async for setting in cursor:
-            settings[setting['key']] = setting['value']
-        return settings
+        if not self.settings_loaded:
+            await self.load_global_settings()
+        return dict(self.global_settings)
     
     async def init_global_settings(self):
         """Initialize global settings with defaults if not exist"""
@@ -362,17 +598,27 @@ class Database:
             'premium_daily_limit': 99999
         }
         
+        await self.load_global_settings()
         for key, value in defaults.items():
-            existing = await self.get_global_setting(key)
-            if existing is None:
+            if self.global_settings.get(key) is None:
                 await self.set_global_setting(key, value)
     
     # Force subscribe channels methods
     async def get_force_sub_channels(self):
         """Get all force subscribe channels"""
+        found, channels = self.channels_cache.get('channels')
+        if found:
+            return list(channels)
         channels_col = self.db.force_sub_channels
-        channel_doc = await channels_col.find_one({'_id': 'channels'})
-        return channel_doc.get('channels', []) if channel_doc else []
+        channel_doc = await channels_col.find_one({'_id': 'channels'}, {'channels': 1})
+        channels = channel_doc.get('channels', []) if channel_doc else []
+        self.channels_cache.set('channels', channels)
+        return list(channels)
+    
+    def invalidate_force_sub(self):
+        """Channel list changed - forget the list and every cached membership"""
+        self.channels_cache.clear()
+        self.membership_cache.clear()
     
     async def add_force_sub_channel(self, channel_id, channel_username=None):
         """Add a force subscribe channel (max 4)"""
@@ -397,6 +643,7 @@ class Database:
             {'$set': {'channels': channels}},
             upsert=True
         )
+        self.invalidate_force_sub()
         return True, "Channel added successfully"
     
     async def remove_force_sub_channel(self, channel_id):
@@ -410,13 +657,14 @@ class Database:
             {'$set': {'channels': channels}},
             upsert=True
         )
+        self.invalidate_force_sub()
         return True
     
     # UPI payment details methods
     async def get_upi_details(self):
         """Get UPI payment details"""
         upi_col = self.db.upi_details
-        upi = await upi_col.find_one({'_id': 'upi'})
+        upi = await upi_col.find_one({'_id': 'upi'}, {'_id': 0})
         return {
             'upi_id': upi.get('upi_id') if upi else None,
             'receiver_name': upi.get('receiver_name') if upi else None,
@@ -458,7 +706,6 @@ class Database:
     # Banned users methods
     async def ban_user(self, user_id, reason=None):
         """Ban a user from using the bot"""
-        import time
         banned_col = self.db.banned_users
         await banned_col.update_one(
             {'user_id': int(user_id)},
@@ -469,28 +716,34 @@ class Database:
             }},
             upsert=True
         )
+        self.ban_cache.pop(int(user_id))
     
     async def unban_user(self, user_id):
         """Unban a user"""
         banned_col = self.db.banned_users
         result = await banned_col.delete_one({'user_id': int(user_id)})
+        self.ban_cache.pop(int(user_id))
         return result.deleted_count > 0
     
     async def is_banned(self, user_id):
         """Check if user is banned"""
-        banned_col = self.db.banned_users
-        banned = await banned_col.find_one({'user_id': int(user_id)})
+        banned = await self.get_ban_info(user_id)
         return banned is not None
     
     async def get_ban_info(self, user_id):
         """Get ban info for a user"""
+        found, banned = self.ban_cache.get(int(user_id))
+        if found:
+            return banned
         banned_col = self.db.banned_users
-        return await banned_col.find_one({'user_id': int(user_id)})
+        banned = await banned_col.find_one({'user_id': int(user_id)}, {'_id': 0})
+        self.ban_cache.set(int(user_id), banned)
+        return banned
     
     async def get_all_banned_users(self):
         """Get all banned users"""
         banned_col = self.db.banned_users
-        cursor = banned_col.find({})
+        cursor = banned_col.find({}, {'_id': 0, 'user_id': 1, 'reason': 1, 'banned_at': 1})
         banned_users = []
         async for user in cursor:
             banned_users.append(user)
@@ -499,7 +752,6 @@ class Database:
     # Crypto payment methods
     async def create_crypto_invoice(self, invoice_id, user_id, plan, amount, asset, pay_url):
         """Store a crypto payment invoice"""
-        import time
         crypto_col = self.db.crypto_payments
         await crypto_col.insert_one({
             'invoice_id': invoice_id,
@@ -515,7 +767,7 @@ class Database:
     async def get_crypto_invoice(self, invoice_id):
         """Get crypto invoice by ID"""
         crypto_col = self.db.crypto_payments
-        return await crypto_col.find_one({'invoice_id': invoice_id})
+        return await crypto_col.find_one({'invoice_id': invoice_id}, {'_id': 0})
     
     async def update_crypto_invoice_status(self, invoice_id, status, paid_at=None):
         """Update crypto invoice status"""
@@ -531,11 +783,226 @@ class Database:
     async def get_pending_crypto_invoices(self, user_id):
         """Get pending crypto invoices for a user"""
         crypto_col = self.db.crypto_payments
-        cursor = crypto_col.find({'user_id': int(user_id), 'status': 'pending'})
+        cursor = crypto_col.find({'user_id': int(user_id), 'status': 'pending'}, {'_id': 0})
         invoices = []
         async for inv in cursor:
             invoices.append(inv)
         return invoices
+    
+    async def get_all_pending_crypto_invoices(self):
+        """Pending crypto invoices of every user (and claims a crashed activation left behind), oldest first"""
+        crypto_col = self.db.crypto_payments
+        cursor = crypto_col.find(
+            {'status': {'$in': ['pending', 'activating']}},
+            {'_id': 0, 'invoice_id': 1, 'user_id': 1, 'plan': 1, 'created_at': 1}
+        ).sort('created_at', 1)
+        return [inv async for inv in cursor]
+    
+    async def claim_crypto_invoice(self, invoice_id, now, stale_before):
+        """
+        Mark an invoice 'activating' unless it is paid or another caller is activating it
+        (claims older than stale_before are taken over). Returns the invoice only for
+        the caller that claimed it.
+        """
+        crypto_col = self.db.crypto_payments
+        return await crypto_col.find_one_and_update(
+            {'invoice_id': invoice_id, '$or': [
+                {'status': {'$nin': ['paid', 'activating']}},
+                {'status': 'activating', 'claimed_at': {'$lt': stale_before}}
+            ]},
+            {'$set': {'status': 'activating', 'claimed_at': now}},
+            projection={'_id': 0, 'user_id': 1, 'plan': 1}
+        )
+    
+    async def finish_crypto_invoice(self, invoice_id, paid_at):
+        """Mark a claimed invoice paid once its premium is granted"""
+        crypto_col = self.db.crypto_payments
+        await crypto_col.update_one(
+            {'invoice_id': invoice_id, 'status': 'activating'},
+            {'$set': {'status': 'paid', 'paid_at': paid_at}, '$unset': {'claimed_at': ''}}
+        )
+    
+    async def release_crypto_invoice(self, invoice_id):
+        """Put a claimed invoice back to pending after a failed activation, the reconciler retries it"""
+        crypto_col = self.db.crypto_payments
+        await crypto_col.update_one(
+            {'invoice_id': invoice_id, 'status': 'activating'},
+            {'$set': {'status': 'pending'}, '$unset': {'claimed_at': ''}}
+        )
+    
+    async def expire_crypto_invoices(self, invoice_ids):
+        """Mark many pending invoices expired in one round trip"""
+        if not invoice_ids:
+            return
+        crypto_col = self.db.crypto_payments
+        await crypto_col.update_many(
+            {'invoice_id': {'$in': list(invoice_ids)}, 'status': 'pending'},
+            {'$set': {'status': 'expired'}}
+        )
+    
+    # Batch job methods (resumable batches)
+    async def create_job(self, user_id, chat_id, message_id, from_id, to_id, premium):
+        """Store a new batch job, returns its _id"""
+        jobs_col = self.db.jobs
+        result = await jobs_col.insert_one({
+            'user_id': int(user_id),
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'from_id': from_id,
+            'to_id': to_id,
+            'premium': premium,
+            'cursor': from_id - 1,  # Last message id finished (everything before it is done too)
+            'successful': 0,
+            'failed': 0,
+            'skipped': 0,
+            'status': 'active',
+            'created_at': time.time(),
+            'updated_at': time.time()
+        })
+        return result.inserted_id
+    
+    async def update_job_progress(self, job_id, cursor, successful, failed, skipped, reserved=None):
+        """Checkpoint a batch job (reserved = quota slots held for files after the cursor)"""
+        from datetime import date
+        jobs_col = self.db.jobs
+        update = {
+            'cursor': cursor,
+            'successful': successful,
+            'failed': failed,
+            'skipped': skipped,
+            'updated_at': time.time()
+        }
+        if reserved is not None:
+            update['reserved'] = reserved
+            update['reserved_date'] = str(date.today())
+        await jobs_col.update_one({'_id': job_id}, {'$set': update})
+    
+    async def take_job_reservation(self, job_id):
+        """
+        Clear the quota a stored job still holds, returns (slots, day reserved).
+        Atomic, so the same reservation is never given back twice.
+        """
+        jobs_col = self.db.jobs
+        before = await jobs_col.find_one_and_update(
+            {'_id': job_id, 'reserved': {'$gt': 0}},
+            {'$set': {'reserved': 0}},
+            projection={'reserved': 1, 'reserved_date': 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            return 0, None
+        return before['reserved'], before.get('reserved_date')
+    
+    async def finish_job(self, job_id, status):
+        """Mark a batch job as done, cancelled or lost"""
+        jobs_col = self.db.jobs
+        await jobs_col.update_one(
+            {'_id': job_id},
+            {'$set': {'status': status, 'finished_at': time.time()}}
+        )
+    
+    async def get_unfinished_jobs(self):
+        """Batch jobs that were queued or running when the bot stopped, oldest first"""
+        jobs_col = self.db.jobs
+        cursor = jobs_col.find({'status': 'active'}).sort('created_at', 1)
+        return [job async for job in cursor]
+    
+    # Broadcast methods (pausable, resumable broadcasts)
+    async def create_broadcast(self, chat_id, message_id, total, retry_of=None, dry_run=False):
+        """Store a new broadcast, returns its _id"""
+        broadcasts_col = self.db.broadcasts
+        result = await broadcasts_col.insert_one({
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'retry_of': retry_of,  # Broadcast whose failed users are sent again
+            'dry_run': dry_run,  # Only count blocked/deleted users, keep them in the database
+            'total': total,
+            'cursor': None,  # Last user id finished (everything before it is done too)
+            'success': 0,
+            'blocked': 0,
+            'deleted': 0,
+            'failed': 0,
+            'removed': 0,
+            'status': 'running',
+            'created_at': time.time(),
+            'updated_at': time.time()
+        })
+        return result.inserted_id
+    
+    async def update_broadcast_progress(self, broadcast_id, cursor, success, blocked, deleted, failed, removed):
+        """Checkpoint a broadcast"""
+        broadcasts_col = self.db.broadcasts
+        await broadcasts_col.update_one(
+            {'_id': broadcast_id},
+            {'$set': {
+                'cursor': cursor,
+                'success': success,
+                'blocked': blocked,
+                'deleted': deleted,
+                'failed': failed,
+                'removed': removed,
+                'updated_at': time.time()
+            }}
+        )
+    
+    async def set_broadcast_status(self, broadcast_id, status):
+        """Mark a broadcast as running, paused, done or cancelled"""
+        broadcasts_col = self.db.broadcasts
+        await broadcasts_col.update_one(
+            {'_id': broadcast_id},
+            {'$set': {'status': status, 'updated_at': time.time()}}
+        )
+    
+    async def get_last_broadcast(self, statuses=None):
+        """Most recent broadcast, optionally only one with a status in the given list"""
+        broadcasts_col = self.db.broadcasts
+        query = {'status': {'$in': statuses}} if statuses else {}
+        cursor = broadcasts_col.find(query).sort('created_at', -1).limit(1)
+        broadcasts = [b async for b in cursor]
+        return broadcasts[0] if broadcasts else None
+    
+    async def add_broadcast_failures(self, broadcast_id, failures):
+        """Record users a broadcast could not reach, failures is a list of (user_id, reason)"""
+        if not failures:
+            return
+        failures_col = self.db.broadcast_failures
+        await failures_col.insert_many([
+            {'broadcast_id': broadcast_id, 'user_id': user_id, 'reason': reason}
+            for user_id, reason in failures
+        ], ordered=False)
+    
+    async def count_broadcast_failures(self, broadcast_id, reason):
+        failures_col = self.db.broadcast_failures
+        return await failures_col.count_documents({'broadcast_id': broadcast_id, 'reason': reason})
+    
+    async def get_broadcast_failed_ids(self, broadcast_id, reason, after=None, limit=200):
+        """Next page of user ids that failed with this reason, in id order"""
+        failures_col = self.db.broadcast_failures
+        query = {'broadcast_id': broadcast_id, 'reason': reason}
+        if after is not None:
+            query['user_id'] = {'$gt': after}
+        cursor = failures_col.find(query, {'_id': 0, 'user_id': 1}).sort('user_id', 1).limit(limit)
+        return [f['user_id'] async for f in cursor]
+    
+    # Media cache methods (file_id of the bot's upload, keyed by source file + output settings)
+    async def get_cached_media(self, key):
+        """Get the cached upload for a source file, None if not uploaded yet"""
+        media_col = self.db.media_cache
+        return await media_col.find_one({'_id': key}, {'file_id': 1, 'type': 1})
+    
+    async def set_cached_media(self, key, file_id, media_type):
+        """Remember the file_id of the bot's first successful upload"""
+        media_col = self.db.media_cache
+        await media_col.update_one(
+            {'_id': key},
+            {'$set': {'file_id': file_id, 'type': media_type, 'created_at': time.time()}},
+            upsert=True
+        )
+    
+    async def delete_cached_media(self, key):
+        """Forget a cached upload (file_id no longer valid)"""
+        media_col = self.db.media_cache
+        await media_col.delete_one({'_id': key})
 
 db = Database(DB_URI, DB_NAME)
 
@@ -0,0 +1,107 @@
+"""
+Crypto Pay client benchmark: one aiohttp session per call (the old
+crypto_pay_request) against the shared keep-alive session.
+Both talk to a local stub of the Crypto Pay API, so only the client side
+differs. The stub is plain HTTP - against the real API every new connection
+also costs a TLS handshake, so the gap there is larger.
+
+Run from the repository root:
+    python scripts/bench_cryptopay_session.py [calls] [concurrency]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# config.py needs these to import, the values are not used
+for key, value in {
+    "API_ID": "1", "API_HASH": "x", "BOT_TOKEN": "x", "ADMINS": "1", "DB_URI": "mongodb://localhost",
+    "DB_NAME": "bench", "CHANNEL_ID": "0", "LOG_CHANNEL_ID": "0", "CRYPTO_PAY_API_TOKEN": "bench-token"
+}.items():
+    os.environ.setdefault(key, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from aiohttp import web
+import IdFinderPro.cryptopay as cryptopay
+
+
+async def per_call_request(method, params=None):
+    """crypto_pay_request before the shared session (new session and connection every call)"""
+    url = f"{cryptopay.CRYPTO_PAY_API_URL}/{method}"
+    headers = {"Crypto-Pay-API-Token": cryptopay.CRYPTO_PAY_API_TOKEN, "Content-Type": "application/json"}
+    try:
+        async with aiohttp.ClientSession() as session:
+            if params:
+                request = session.post(url, headers=headers, json=params)
+            else:
+                request = session.get(url, headers=headers)
+            async with request as response:
+                data = await response.json()
+        if data.get("ok"):
+            return data.get("result"), None
+        return None, str(data.get("error"))
+    except Exception as e:
+        return None, str(e)
+
+
+async def start_stub():
+    """Local Crypto Pay stub counting the TCP connections it accepts"""
+    connections = set()
+
+    async def handle(request):
+        connections.add(request.transport.get_extra_info('peername'))
+        return web.json_response({"ok": True, "result": {"app_id": 1, "name": "bench"}})
+
+    app = web.Application()
+    app.router.add_route('*', '/api/{method}', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, port, connections
+
+
+async def run(label, request, calls, concurrency, connections):
+    connections.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            result, error = await request("getMe")
+            latencies.append(time.perf_counter() - started)
+            if error:
+                raise RuntimeError(error)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(
+        f"{label:<16} {calls / elapsed:8.0f} calls/s   "
+        f"avg {statistics.mean(latencies) * 1000:6.2f}ms   "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:6.2f}ms   "
+        f"{len(connections)} connections"
+    )
+
+
+async def main(calls, concurrency):
+    runner, port, connections = await start_stub()
+    cryptopay.CRYPTO_PAY_API_URL = f"http://127.0.0.1:{port}/api"
+    try:
+        print(f"{calls} getMe calls, {concurrency} at a time\n")
+        await run("per-call session", per_call_request, calls, concurrency, connections)
+        await run("shared session", cryptopay.crypto_pay_request, calls, concurrency, connections)
+    finally:
+        await cryptopay.close_http_session()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(main(calls, concurrency))
@@ -18,14 +18,8 @@ fi
 # Create downloads directory if it doesn't exist
 mkdir -p downloads
 
-# Start Flask web server in background (required for Render/Railway health checks)
-echo "Starting web server on port ${PORT:-8080}..."
-gunicorn app:app --bind 0.0.0.0:${PORT:-8080} --workers 1 --timeout 120 &
-
-# Wait a moment for gunicorn to start
-sleep 2
-
 # Start the bot (this keeps running in foreground)
-echo "Starting Telegram bot..."
+# It also serves the health check and webhooks on port ${PORT:-8080} (required for Render/Railway health checks)
+echo "Starting Telegram bot and web server on port ${PORT:-8080}..."
 python3 bot.py
 
@@ -0,0 +1,118 @@
+"""
+Parity of the compiled word replacement engine with the original
+per-call implementation (kept below, frozen, as the reference).
+Run with: python -m unittest discover tests
+"""
+import random
+import re
+import unittest
+
+from IdFinderPro.replacements import apply_word_replacements, compile_word_replacements
+
+
+def reference_apply_word_replacements(text, replacement_pattern):
+    """apply_word_replacements as it was before the rules were compiled and cached"""
+    if not replacement_pattern or not text:
+        return text
+
+    rules = replacement_pattern.split('|')
+
+    result = text
+    for rule in rules:
+        rule = rule.strip()
+        if not rule:
+            continue
+
+        if ':' in rule:
+            find, replace = rule.split(':', 1)
+            find = find.strip()
+            replace = replace.strip()
+        else:
+            find = rule.strip()
+            replace = ''
+
+        if not find:
+            continue
+
+        find_escaped = re.escape(find)
+        separators = r'[\s,.;:!?\'"`~@#$%^&*()\[\]{}|/\\+=•·‣°÷×±¶§©®™†‡…¤¦¨¯¸ºª–—―‚„""''‹›«»≠≈≡≤≥∞∈∉∋∑∏√∂∆∇∫∴∵⊕⊗⊂⊃⊆⊇€£¥₩₽₹→←↑↓⇒⇐⇑⇓⇔★☆◆◇■□▲△▼▽\U0001F300-\U0001F9FF\u2600-\u26FF\u2700-\u27BF\uFE00-\uFE0F\-_]'
+        pattern = r'(?:^|(?<=' + separators + r'))' + find_escaped + r'(?=' + separators + r'|$)'
+
+        result = re.sub(pattern, replace, result, flags=re.IGNORECASE)
+
+    return result
+
+
+TEXTS = [
+    "",
+    "Movie.2024.1080p.WEB-DL.x264",
+    "movie_MOVIE movie-Movie mOvIe",
+    "The Best of The Best (2019) [HD] @channel",
+    "a+b=c (a+b) a.b* a|b a\\b",
+    "émoji🎬title★new★ — «quoted» → next",
+    "overlap overlapping lap over-lap",
+    "   leading and trailing   ",
+    "no separators:here",
+]
+
+PATTERNS = [
+    "",
+    "|",
+    " | : |:x",
+    "movie:Film",
+    "MOVIE",
+    "movie:Film|film:Movie",
+    "over|overlap:X|lap:Y",
+    "overlap:over|over:lap",
+    "a+b:sum|a.b*:star|a|b",
+    "(2019):|[HD]:HD|@channel",
+    "a\\b:back",
+    "★new★:fresh|🎬:",
+    "the best:top|The:A",
+    "x264:x265|WEB-DL:WEBRip|1080p",
+    "here:there|no separators",
+]
+
+WORDS = ["a", "A", "ab", "Ab", "b", "a+b", "a.b", "(x)", "[y]", "c*", "é", "★", "🎬", "-", "_"]
+SEPARATORS = [" ", ".", "-", "_", ",", "★", "🎬", "", "|"]
+
+
+class WordReplacementParityTest(unittest.TestCase):
+
+    def setUp(self):
+        compile_word_replacements.cache_clear()
+
+    def assertParity(self, text, pattern):
+        expected = reference_apply_word_replacements(text, pattern)
+        # First call compiles, second one uses the cached rules
+        self.assertEqual(apply_word_replacements(text, pattern), expected, (text, pattern))
+        self.assertEqual(apply_word_replacements(text, pattern), expected, (text, pattern))
+
+    def test_fixed_cases(self):
+        for text in TEXTS:
+            for pattern in PATTERNS:
+                self.assertParity(text, pattern)
+
+    def test_cache_is_used(self):
+        apply_word_replacements("movie", "movie:Film")
+        apply_word_replacements("other movie", "movie:Film")
+        info = compile_word_replacements.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 1))
+
+    def test_uncached_compile_matches_cached(self):
+        for pattern in PATTERNS:
+            self.assertEqual(compile_word_replacements.__wrapped__(pattern), compile_word_replacements(pattern))
+
+    def test_random_cases(self):
+        rng = random.Random(1234)
+        for _ in range(2000):
+            text = "".join(rng.choice(WORDS) + rng.choice(SEPARATORS) for _ in range(rng.randint(0, 8)))
+            rules = []
+            for _ in range(rng.randint(0, 4)):
+                find = rng.choice(WORDS + [""])
+                rules.append(find if rng.random() < 0.3 else f"{find}:{rng.choice(WORDS + [''])}")
+            self.assertParity(text, "|".join(rules))
+
+
+if __name__ == "__main__":
+    unittest.main()